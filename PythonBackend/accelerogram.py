@@ -0,0 +1,371 @@
+# accelerogram.py
+import hashlib
+import itertools
+import json
+import os
+import re
+
+import numpy as np
+
+from config import Config
+from logger import Logger
+
+# Initialize the logger
+logger = Logger()
+log = logger.get_logger(__name__)
+
+G = 9806.65  # mm/s²
+UNITS = {'g': G, 'm/s2': 1000.0, 'cm/s2': 10.0, 'mm/s2': 1.0}
+CHUNK_SIZE = 65536
+
+_AT2_HEADER = re.compile(r'NPTS\s*=\s*(\d+)\s*,\s*DT\s*=\s*([\d.Ee+-]+)', re.IGNORECASE)
+_AT2_HEADER_OLD = re.compile(r'^\s*(\d+)\s+([\d.Ee+-]+)')
+_NUMERIC_ROW = re.compile(r'\s*[-+]?(\d|\.\d)')
+
+
+def read_at2(path, chunk_size=CHUNK_SIZE):
+    """
+    Streams a PEER NGA .AT2 record.
+
+    :return: (dt, units, generator of acceleration chunks)
+    """
+    f = open(path, 'r')
+    header = [f.readline() for _ in range(4)]
+    match = _AT2_HEADER.search(header[3]) or _AT2_HEADER_OLD.match(header[3])
+    if not match:
+        f.close()
+        raise ValueError(f"Could not find NPTS/DT in AT2 header: {header[3].strip()}")
+    dt = float(match.group(2))
+
+    def chunks():
+        with f:
+            values = []
+            for line in f:
+                values.extend(line.split())
+                if len(values) >= chunk_size:
+                    yield np.array(values, dtype=np.float64)
+                    values = []
+            if values:
+                yield np.array(values, dtype=np.float64)
+
+    return dt, 'g', chunks()
+
+
+def read_csv(path, dt=None, units='g', column=-1, chunk_size=CHUNK_SIZE):
+    """
+    Streams a CSV record with either one acceleration column or time and
+    acceleration columns. Lines that do not start with a number are skipped.
+
+    :param dt: Sample interval in s, required when the file has no time column.
+    :param column: Column holding acceleration (default: last).
+    :return: (dt, units, generator of acceleration chunks)
+    """
+    f = open(path, 'r')
+    rows = (line for line in f if _NUMERIC_ROW.match(line))
+    first = np.loadtxt(itertools.islice(rows, 2), delimiter=',', ndmin=2)
+    if dt is None:
+        if first.shape[1] < 2 or len(first) < 2:
+            f.close()
+            raise ValueError("CSV record has no time column, pass dt")
+        dt = float(first[1, 0] - first[0, 0])
+
+    def chunks():
+        with f:
+            # The sniffed rows lead the first chunk rather than forming a chunk of their own
+            head = first[:, column]
+            while True:
+                lines = list(itertools.islice(rows, chunk_size))
+                if not lines:
+                    break
+                chunk = np.loadtxt(lines, delimiter=',', ndmin=2)[:, column]
+                if head is not None:
+                    chunk = np.concatenate((head, chunk))
+                    head = None
+                yield chunk
+            if head is not None:
+                yield head
+
+    return dt, units, chunks()
+
+
+def read_binary(path, dt, units='g', dtype='<f4', chunk_size=CHUNK_SIZE):
+    """
+    Streams a raw binary or .npy acceleration array through a memory map.
+
+    :return: (dt, units, generator of acceleration chunks)
+    """
+    if str(path).lower().endswith('.npy'):
+        data = np.load(path, mmap_mode='r')
+    else:
+        data = np.memmap(path, dtype=dtype, mode='r')
+
+    def chunks():
+        for start in range(0, len(data), chunk_size):
+            yield np.asarray(data[start:start + chunk_size], dtype=np.float64)
+
+    return dt, units, chunks()
+
+
+def open_record(path, fmt=None, dt=None, units=None):
+    """Picks a reader from `fmt` or the file extension."""
+    fmt = (fmt or os.path.splitext(str(path))[1].lstrip('.')).lower()
+    if fmt == 'at2':
+        return read_at2(path)
+    if fmt in ('csv', 'txt'):
+        return read_csv(path, dt=dt, units=units or 'g')
+    if dt is None:
+        raise ValueError(f"Binary record {path} needs dt")
+    return read_binary(path, dt, units=units or 'g')
+
+
+def _bandpass_taps(sample_rate, low_hz, high_hz, transition_hz):
+    """Windowed-sinc band-pass (or high-pass when high_hz is None) FIR taps."""
+    numtaps = int(np.ceil(5.5 * sample_rate / transition_hz)) | 1
+    n = np.arange(numtaps) - (numtaps - 1) / 2
+    window = np.blackman(numtaps)
+
+    def lowpass(cutoff):
+        taps = np.sinc(2 * cutoff / sample_rate * n) * window
+        return taps / taps.sum()
+
+    if high_hz is not None and high_hz < sample_rate / 2:
+        return lowpass(high_hz) - lowpass(low_hz)
+    taps = -lowpass(low_hz)
+    taps[(numtaps - 1) // 2] += 1
+    return taps
+
+
+class _StreamingFIR:
+    """Linear-phase FIR applied chunk by chunk with FFT convolution and delay removal."""
+
+    def __init__(self, taps):
+        self.taps = taps
+        self.history = np.zeros(len(taps) - 1)
+        self.skip = (len(taps) - 1) // 2
+
+    def process(self, x):
+        if len(x) == 0:
+            return x
+        buf = np.concatenate((self.history, x))
+        size = 1 << int(len(buf) + len(self.taps) - 1).bit_length()
+        full = np.fft.irfft(np.fft.rfft(buf, size) * np.fft.rfft(self.taps, size), size)
+        y = full[len(self.taps) - 1:len(buf)]
+        self.history = buf[len(buf) - len(self.history):]
+        if self.skip:
+            drop = min(self.skip, len(y))
+            y = y[drop:]
+            self.skip -= drop
+        return y
+
+    def flush(self):
+        return self.process(np.zeros((len(self.taps) - 1) // 2))
+
+
+class _StreamingIntegrator:
+    """Trapezoidal cumulative integral carried across chunks."""
+
+    def __init__(self, dt):
+        self.dt = dt
+        self.last = None
+        self.total = 0.0
+
+    def process(self, x):
+        if len(x) == 0:
+            return x
+        prev = x[0] if self.last is None else self.last
+        increments = (np.concatenate(([prev], x[:-1])) + x) * (self.dt / 2)
+        out = self.total + np.cumsum(increments)
+        self.total = out[-1]
+        self.last = x[-1]
+        return out
+
+
+class _StreamingResampler:
+    """Linear-interpolation resampler carried across chunks."""
+
+    def __init__(self, rate_in, rate_out):
+        self.step = rate_in / rate_out
+        self.position = 0.0  # next output time, in input samples
+        self.offset = 0      # input index of the next chunk's first sample
+        self.prev = None
+
+    def process(self, x):
+        if len(x) == 0:
+            return x
+        count_in = len(x)
+        base = self.offset
+        if self.prev is not None:
+            x = np.concatenate(([self.prev], x))
+            base -= 1
+        last = base + len(x) - 1
+        self.offset += count_in
+        self.prev = x[-1]
+        if self.position > last:
+            return np.zeros(0)
+        count = int((last - self.position) // self.step) + 1
+        times = self.position + self.step * np.arange(count)
+        self.position += self.step * count
+        return np.interp(times - base, np.arange(len(x)), x)
+
+
+class GroundMotion:
+    """Resampled displacement of a record, memory-mapped from the motion cache."""
+
+    def __init__(self, displacement, sample_rate, scale, peak_displacement, peak_acceleration, source):
+        self.displacement = displacement
+        self.sample_rate = sample_rate
+        self.scale = scale
+        self.peak_displacement = peak_displacement
+        self.peak_acceleration = peak_acceleration
+        self.source = source
+
+    @property
+    def duration(self):
+        return len(self.displacement) / self.sample_rate
+
+    def scaled(self):
+        """Returns the displacement in mm scaled to fit the table."""
+        return np.asarray(self.displacement, dtype=np.float64) * self.scale
+
+
+def _cache_key(path, fmt, dt, units, sample_rate, low_hz, high_hz):
+    stat = os.stat(path)
+    raw = json.dumps([
+        os.path.abspath(path), stat.st_size, stat.st_mtime_ns, fmt, dt, units,
+        sample_rate, low_hz, high_hz
+    ])
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def load(path, fmt=None, dt=None, units=None, sample_rate=None, low_hz=0.1, high_hz=None,
+         cache_dir=None):
+    """
+    Converts an accelerogram into table displacement, reusing the cached
+    result when the same file was processed with the same settings.
+
+    Acceleration is streamed in chunks: the pre-event mean is removed, the
+    signal is band-passed, integrated twice with a further high-pass on
+    velocity and displacement to stop drift, then resampled to
+    `sample_rate`. Only the resampled float32 output is kept, written to
+    the cache and memory-mapped back.
+
+    :param path: AT2, CSV, .npy or raw float32 file.
+    :param fmt: Override the format picked from the extension.
+    :param dt: Sample interval in s for files that do not record it.
+    :param units: Acceleration units, one of UNITS (default: g).
+    :param sample_rate: Output rate in Hz (default: Config.RECORD_SAMPLE_RATE).
+    :param low_hz: High-pass corner in Hz.
+    :param high_hz: Low-pass corner in Hz (default: 0.4 * sample_rate).
+    :param cache_dir: Where resampled outputs live (default: Config.MOTION_CACHE_DIR).
+    :return: GroundMotion
+    """
+    sample_rate = float(sample_rate or Config.RECORD_SAMPLE_RATE)
+    high_hz = high_hz or 0.4 * sample_rate
+    cache_dir = cache_dir or Config.MOTION_CACHE_DIR
+    os.makedirs(cache_dir, exist_ok=True)
+    key = _cache_key(path, fmt, dt, units, sample_rate, low_hz, high_hz)
+    data_path = os.path.join(cache_dir, f"{key}.f32")
+    meta_path = os.path.join(cache_dir, f"{key}.json")
+
+    if not os.path.exists(meta_path):
+        _process(path, fmt, dt, units, sample_rate, low_hz, high_hz, data_path, meta_path)
+    else:
+        log.info(f"Using cached motion for {path}")
+
+    with open(meta_path, 'r') as f:
+        meta = json.load(f)
+    displacement = np.memmap(data_path, dtype=np.float32, mode='r') if meta['samples'] else np.zeros(0, np.float32)
+    return GroundMotion(displacement, meta['sample_rate'], meta['scale'],
+                        meta['peak_displacement'], meta['peak_acceleration'], path)
+
+
+def _process(path, fmt, dt, units, sample_rate, low_hz, high_hz, data_path, meta_path):
+    dt, units, chunks = open_record(path, fmt, dt, units)
+    rate_in = 1 / dt
+    if units not in UNITS:
+        raise ValueError(f"Unknown units '{units}', expected one of {', '.join(UNITS)}")
+    to_mm = UNITS[units]
+    transition = max(low_hz / 2, 0.01)
+    high = min(high_hz, 0.45 * rate_in)
+
+    accel_filter = _StreamingFIR(_bandpass_taps(rate_in, low_hz, high, transition))
+    velocity_filter = _StreamingFIR(_bandpass_taps(rate_in, low_hz, None, transition))
+    displacement_filter = _StreamingFIR(_bandpass_taps(rate_in, low_hz, None, transition))
+    velocity = _StreamingIntegrator(dt)
+    position = _StreamingIntegrator(dt)
+    resampler = _StreamingResampler(rate_in, sample_rate)
+
+    baseline = None
+    samples = 0
+    peak_displacement = 0.0
+    peak_acceleration = 0.0
+    tail = np.zeros(0)
+    dt_out = 1 / sample_rate
+    log.info(f"Processing {path} at {rate_in:g} Hz into {sample_rate:g} Hz displacement")
+
+    tmp_path = data_path + '.tmp'
+    with open(tmp_path, 'wb') as out:
+        def emit(disp):
+            nonlocal samples, peak_displacement, peak_acceleration, tail
+            if len(disp) == 0:
+                return
+            disp.astype(np.float32).tofile(out)
+            samples += len(disp)
+            peak_displacement = max(peak_displacement, float(np.abs(disp).max()))
+            joined = np.concatenate((tail, disp))
+            if len(joined) >= 3:
+                accel = np.diff(joined, 2) / dt_out ** 2
+                peak_acceleration = max(peak_acceleration, float(np.abs(accel).max()))
+            tail = joined[-2:]
+
+        def stage(chunk):
+            chunk = accel_filter.process(chunk)
+            chunk = velocity_filter.process(velocity.process(chunk))
+            chunk = displacement_filter.process(position.process(chunk))
+            return resampler.process(chunk)
+
+        # Pre-event mean over the first second, chunks are held back until it is known
+        first_second = max(int(rate_in), 1)
+        held = []
+        for chunk in chunks:
+            chunk = chunk * to_mm
+            if baseline is None:
+                held.append(chunk)
+                if sum(len(c) for c in held) < first_second:
+                    continue
+                chunk = np.concatenate(held)
+                baseline = float(chunk[:first_second].mean())
+            emit(stage(chunk - baseline))
+        if baseline is None and held:
+            # Shorter than a second
+            chunk = np.concatenate(held)
+            baseline = float(chunk.mean())
+            emit(stage(chunk - baseline))
+
+        # Drain the filter delays, one stage at a time
+        tail_chunk = accel_filter.flush()
+        tail_chunk = velocity_filter.process(velocity.process(tail_chunk))
+        tail_chunk = np.concatenate((tail_chunk, velocity_filter.flush()))
+        tail_chunk = displacement_filter.process(position.process(tail_chunk))
+        tail_chunk = np.concatenate((tail_chunk, displacement_filter.flush()))
+        emit(resampler.process(tail_chunk))
+
+    os.replace(tmp_path, data_path)
+
+    scale = 1.0
+    if peak_displacement > 0:
+        scale = min(scale, float(Config.MAX_DISPLACEMENT) / peak_displacement)
+    if peak_acceleration > 0:
+        scale = min(scale, float(Config.MAX_ACCELERATION) / peak_acceleration)
+    if scale < 1:
+        log.info(f"Scaling {path} by {scale:.3f} to fit table stroke and acceleration")
+
+    with open(meta_path, 'w') as f:
+        json.dump({
+            "source": os.path.abspath(path),
+            "sample_rate": sample_rate,
+            "samples": samples,
+            "scale": scale,
+            "peak_displacement": peak_displacement,
+            "peak_acceleration": peak_acceleration,
+        }, f)
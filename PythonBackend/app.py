@@ -1,8 +1,16 @@
 import os
-from queue import Queue, Empty
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from flask_cors import CORS
-from flask import Flask, jsonify, render_template, request, Response
-from shake_table_controller import ShakeTableController
+from flask import Flask, g, jsonify, render_template, request, Response
+from table_registry import TableRegistry
+from broadcaster import Broadcaster, format_event
+import metrics
+import run_recorder
+import telemetry
+import upload_format
 from logger import Logger
 from config import Config
 
@@ -18,8 +26,15 @@ app.config.from_object(Config)
 log.setLevel(app.config['LOG_LEVEL'])
 
 # Initialize components
-message_queue = Queue()
-pico_manager = ShakeTableController(queue=message_queue)
+message_queue = Broadcaster()
+registry = TableRegistry(queue=message_queue)
+# The default table, also served by the routes without a table ID
+pico_manager = registry.default()
+
+# Uploads run one at a time per table off the request thread, so a request never waits on serial I/O
+motion_executor = ThreadPoolExecutor(max_workers=4)
+motion_lock = threading.Lock()
+motion_jobs = {}  # table ID -> Future of the table's current upload
 
 # Setup CORS
 CORS(
@@ -32,9 +47,9 @@ CORS(
     supports_credentials=True
 )
 
-def trigger_alert(message):
-    """Add an error message to the SSE queue."""
-    message_queue.put(('error', message))
+def trigger_alert(message, queue=None):
+    """Add an error message to the SSE queue, or to a table's queue."""
+    (queue or message_queue).put(('error', message))
     log.error(message)
 
 def trigger_limit_alert():
@@ -42,43 +57,120 @@ def trigger_limit_alert():
     message_queue.put(('limit_triggered', 'Limit switch triggered'))
     log.warning("Limit switch triggered")
 
+def motion_job_running(table_id):
+    job = motion_jobs.get(table_id)
+    return job is not None and not job.done()
+
+def start_motion_job(description, fn, *args, table_ids=None):
+    """
+    Runs a movement upload in the background and answers straight away.
+
+    The outcome is published as a 'movement' SSE event, failures also as
+    an 'error' event.
+
+    :param table_ids: Tables the job sends to, each runs one job at a time (default: the default table).
+    """
+    table_ids = table_ids or [registry.default_id]
+    # A job for one table reports on that table's events
+    queue = registry.get(table_ids[0]).message_queue if len(table_ids) == 1 else message_queue
+
+    def run():
+        try:
+            response = fn(*args)
+        except Exception as e:
+            response = {"status": "error", "message": f"{description} failed: {str(e)}"}
+        log.info(f"{description} response: {response}")
+        if response["status"] == "error":
+            trigger_alert(response["message"], queue)
+        queue.put(('movement', json.dumps(response)))
+
+    with motion_lock:
+        if any(motion_job_running(table_id) for table_id in table_ids):
+            return jsonify({"status": "error", "message": "A movement is already being sent to the table."}), 409
+        if any(registry.get(table_id).campaign.running for table_id in table_ids):
+            return jsonify({"status": "error", "message": "A campaign is running on the table."}), 409
+        job = motion_executor.submit(run)
+        for table_id in table_ids:
+            motion_jobs[table_id] = job
+    return jsonify({"status": "success", "message": f"{description} started."}), 202
+
+def unknown_table(table_id):
+    return jsonify({"status": "error", "message": f"Unknown table {table_id}"}), 404
+
 def setup_connection():
-    """Open the connection to the microcontroller."""
+    """
+    Starts connecting every table's microcontroller in the background, so
+    the web UI is served straight away. Progress arrives as 'connection'
+    events and the outcome as 'status' events.
+    """
     try:
-        result = pico_manager.open_connection()
-        log.info(f"Connection result: {result}")
-
-        if "established" in result.lower():
-            message_queue.put(('status', 'connected'))
-            log.info("Status updated to: connected")
-        else:
-            message_queue.put(('status', 'disconnected'))
-            message_queue.put(('error', result))
-            log.warning(f"Connection failed: {result}")
+        registry.connect_all_async()
     except Exception as e:
         error_msg = f"Failed to open connection: {str(e)}"
         log.error(error_msg)
         message_queue.put(('status', 'disconnected'))
         message_queue.put(('error', error_msg))
 
+def reader_stat(field):
+    """One of the listener thread's reader_stats() values for every connected table."""
+    return [((table_id,), controller.conn.reader_stats()[field])
+            for table_id, controller in registry.controllers()
+            if controller.conn is not None and controller.conn.reader is not None]
+
+metrics.Callback('pico_reader_bytes_total', 'Bytes read from the serial port by the listener thread.',
+                 lambda: reader_stat('bytes_total'), ('table',), kind='counter')
+metrics.Callback('pico_reader_lines_total', 'Lines read from the serial port by the listener thread.',
+                 lambda: reader_stat('lines_total'), ('table',), kind='counter')
+metrics.Callback('pico_reader_bytes_per_second', 'Bytes per second read by the listener thread since the last scrape.',
+                 lambda: reader_stat('bytes_per_sec'), ('table',))
+metrics.Callback('pico_reader_lines_per_second', 'Lines per second read by the listener thread since the last scrape.',
+                 lambda: reader_stat('lines_per_sec'), ('table',))
+metrics.Callback('pico_connected', 'Whether the table is connected.',
+                 lambda: [((table["id"],), int(table["connected"])) for table in registry.tables()], ('table',))
+metrics.Callback('sse_subscribers', 'Connected SSE clients.', lambda: message_queue.subscriber_count())
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    start = g.get('request_start')
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.HTTP_REQUEST.observe(time.perf_counter() - start, request.method, route, str(response.status_code))
+    return response
+
 @app.route('/')
 def home():
     return render_template('index.html')
 
+def connection_status():
+    """Heartbeat payload shared by every SSE client."""
+    if pico_manager.conn and pico_manager.conn.is_connected():
+        return 'connected'
+    return 'disconnected'
+
+message_queue.start_heartbeat(connection_status, app.config['SSE_HEARTBEAT_TIMEOUT'])
+
+def start_telemetry_publishers(table_ids):
+    for table_id in table_ids:
+        event_type = 'telemetry' if table_id == registry.default_id else f"telemetry:{table_id}"
+        telemetry.start_publisher(registry.get(table_id).telemetry, message_queue, event_type=event_type)
+
+start_telemetry_publishers([table_id for table_id, _ in registry.controllers()])
+
 @app.route('/stream')
 def stream():
+    subscription = message_queue.subscribe(request.headers.get('Last-Event-ID'))
+
     def event_stream():
-        while True:
-            try:
-                message = message_queue.get(timeout=app.config['SSE_HEARTBEAT_TIMEOUT'])
-                if message:
-                    message_type, message_data = message
-                    yield f"event: {message_type}\ndata: {message_data}\n\n"
-            except Empty:
-                if pico_manager.conn and pico_manager.conn.is_connected():
-                    yield "event: heartbeat\ndata: connected\n\n"
-                else:
-                    yield "event: heartbeat\ndata: disconnected\n\n"
+        try:
+            while True:
+                for event in subscription.get():
+                    yield format_event(event)
+        finally:
+            subscription.close()
 
     return Response(
         event_stream(),
@@ -90,25 +182,358 @@ def stream():
         }
     )
 
+@app.route('/telemetry')
+@app.route('/tables/<table_id>/telemetry')
+def get_telemetry(table_id=None):
+    """Min/max decimated position history sized to the client's chart width."""
+    controller = registry.get(table_id)
+    if controller is None:
+        return unknown_table(table_id)
+    try:
+        width = max(1, min(int(request.args.get('width', 800)), 10000))
+        end = request.args.get('end', type=float)
+        start = request.args.get('start', type=float)
+        if start is None:
+            latest = end if end is not None else controller.telemetry.latest_time()
+            start = None if latest is None else latest - app.config['TELEMETRY_WINDOW']
+        data = controller.telemetry.decimate(start, end, width)
+        return jsonify({"status": "success", **data}), 200
+    except Exception as e:
+        error_msg = f"Error reading telemetry: {str(e)}"
+        log.error(error_msg)
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+def read_typed_upload():
+    """
+    Reads the moves of a .npy or msgpack request body, see upload_format.
+
+    :return: (COMMAND_DTYPE batch, None), or (None, 400 response) if the body is not a valid batch.
+    """
+    try:
+        return upload_format.read_moves(request.stream, request.mimetype,
+                                        request.headers.get('Content-Encoding')), None
+    except ValueError as e:
+        return None, (jsonify({"status": "error", "message": f"Invalid upload: {e}"}), 400)
+
 @app.route('/start-movement', methods=['POST'])
-def start_movement():
+@app.route('/tables/<table_id>/start-movement', methods=['POST'])
+def start_movement(table_id=None):
+    controller = registry.get(table_id)
+    if controller is None:
+        return unknown_table(table_id)
     try:
         log.info("Starting Simulation")
-        command_batch = request.get_json().get('commands')
-        response = pico_manager.send_movement_data(command_batch)
-        log.info(f"Response: {response}")
+        if upload_format.is_typed(request.mimetype):
+            moves, error = read_typed_upload()
+            if error:
+                return error
+            return start_motion_job("Batch upload", controller.run_commands, moves, table_ids=[controller.table_id])
+        data = request.get_json()
+        waveform = data.get('waveform')
+        if waveform:
+            return start_motion_job(
+                "Waveform",
+                controller.run_waveform,
+                float(waveform.get('displacement', 0)),
+                float(waveform.get('frequency', 0)),
+                float(waveform.get('duration', 0)),
+                float(waveform.get('percentDamped', 0)),
+                table_ids=[controller.table_id]
+            )
+        commands = data.get('commands')
+        if not commands:
+            return jsonify({"status": "error", "message": "No waveform or commands received"}), 400
+        return start_motion_job("Batch upload", controller.run_commands, commands, table_ids=[controller.table_id])
+    except Exception as e:
+        error_msg = f"Error sending movement data: {str(e)}"
+        log.error(error_msg)
+        trigger_alert(error_msg, controller.message_queue)
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/check-movement', methods=['POST'])
+@app.route('/tables/<table_id>/check-movement', methods=['POST'])
+def check_movement(table_id=None):
+    """Feasibility report for a /start-movement body, nothing is sent to the table."""
+    controller = registry.get(table_id)
+    if controller is None:
+        return unknown_table(table_id)
+    try:
+        if upload_format.is_typed(request.mimetype):
+            moves, error = read_typed_upload()
+            if error:
+                return error
+            response = controller.check_movement(commands=moves)
+            return jsonify(response), 200 if response["status"] == "success" else 400
+        data = request.get_json()
+        waveform = data.get('waveform')
+        if waveform:
+            response = controller.check_movement(waveform=(
+                float(waveform.get('displacement', 0)),
+                float(waveform.get('frequency', 0)),
+                float(waveform.get('duration', 0)),
+                float(waveform.get('percentDamped', 0))
+            ))
+        elif data.get('commands'):
+            response = controller.check_movement(commands=data['commands'])
+        else:
+            return jsonify({"status": "error", "message": "No waveform or commands received"}), 400
+        return jsonify(response), 200 if response["status"] == "success" else 400
+    except Exception as e:
+        error_msg = f"Error checking movement: {str(e)}"
+        log.error(error_msg)
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/start-record', methods=['POST'])
+@app.route('/tables/<table_id>/start-record', methods=['POST'])
+def start_record(table_id=None):
+    controller = registry.get(table_id)
+    if controller is None:
+        return unknown_table(table_id)
+    try:
+        data = request.get_json()
+        if not data or not data.get('path'):
+            return jsonify({"status": "error", "message": "No record path received"}), 400
+
+        log.info(f"Starting record {data['path']}")
+        dt = data.get('dt')
+        dt = float(dt) if dt is not None else None
+        return start_motion_job(
+            "Record",
+            lambda: controller.run_record(data['path'], fmt=data.get('format'), dt=dt, units=data.get('units')),
+            table_ids=[controller.table_id]
+        )
+    except Exception as e:
+        error_msg = f"Error starting record: {str(e)}"
+        log.error(error_msg)
+        trigger_alert(error_msg, controller.message_queue)
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/start-synthetic', methods=['POST'])
+@app.route('/tables/<table_id>/start-synthetic', methods=['POST'])
+def start_synthetic(table_id=None):
+    """Generates and runs a motion matching a design spectrum, the match is reported in the 'movement' event."""
+    controller = registry.get(table_id)
+    if controller is None:
+        return unknown_table(table_id)
+    try:
+        data = request.get_json() or {}
+        duration = float(data.get('duration', 0))
+        if duration <= 0:
+            return jsonify({"status": "error", "message": "No duration received"}), 400
+        seed = data.get('seed')
+        seed = int(seed) if seed is not None else None
+
+        log.info(f"Starting {duration:g}s synthetic motion")
+        return start_motion_job(
+            "Synthetic motion",
+            lambda: controller.run_synthetic(duration, spectrum=data.get('spectrum'), seed=seed),
+            table_ids=[controller.table_id]
+        )
+    except Exception as e:
+        error_msg = f"Error starting synthetic motion: {str(e)}"
+        log.error(error_msg)
+        trigger_alert(error_msg, controller.message_queue)
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/start-stream', methods=['POST'])
+@app.route('/tables/<table_id>/start-stream', methods=['POST'])
+def start_stream(table_id=None):
+    controller = registry.get(table_id)
+    if controller is None:
+        return unknown_table(table_id)
+    if controller.campaign.running:
+        return jsonify({"status": "error", "message": "A campaign is running on the table."}), 409
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({"status": "error", "message": "No data received"}), 400
+
+        duration = data.get('duration')
+        response = controller.stream_waveform(
+            float(data.get('displacement', 0)),
+            float(data.get('frequency', 0)),
+            float(duration) if duration else None,
+            float(data.get('percentDamped', 0))
+        )
+        log.info(f"Stream response: {response}")
         if response["status"] == "error":
-            trigger_alert(response["message"])
+            trigger_alert(response["message"], controller.message_queue)
             return jsonify(response), 400
         return jsonify(response), 200
     except Exception as e:
-        error_msg = f"Error sending movement data: {str(e)}"
+        error_msg = f"Error starting stream: {str(e)}"
         log.error(error_msg)
-        trigger_alert(error_msg)
+        trigger_alert(error_msg, controller.message_queue)
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route('/stream-stats')
+@app.route('/tables/<table_id>/stream-stats')
+def stream_stats(table_id=None):
+    controller = registry.get(table_id)
+    if controller is None:
+        return unknown_table(table_id)
+    response = controller.stream_stats()
+    return jsonify(response), 200 if response["status"] == "success" else 404
+
+@app.route('/runs')
+def list_runs():
+    """Recorded sessions, newest first."""
+    return jsonify({"status": "success", "runs": run_recorder.list_runs()}), 200
+
+@app.route('/replay-run', methods=['POST'])
+@app.route('/tables/<table_id>/replay-run', methods=['POST'])
+def replay_run(table_id=None):
+    controller = registry.get(table_id)
+    if controller is None:
+        return unknown_table(table_id)
+    try:
+        data = request.get_json()
+        if not data or not data.get('name'):
+            return jsonify({"status": "error", "message": "No run name received"}), 400
+        log.info(f"Replaying run {data['name']}")
+        return start_motion_job("Replay", controller.replay_run, data['name'], float(data.get('speed', 1.0)),
+                                table_ids=[controller.table_id])
+    except Exception as e:
+        error_msg = f"Error replaying run: {str(e)}"
+        log.error(error_msg)
+        trigger_alert(error_msg, controller.message_queue)
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/compensation')
+@app.route('/tables/<table_id>/compensation')
+def compensation_status(table_id=None):
+    controller = registry.get(table_id)
+    if controller is None:
+        return unknown_table(table_id)
+    if controller.compensator is None:
+        return jsonify({"status": "error", "message": "No compensation target set."}), 404
+    return jsonify({"status": "success", "compensation": controller.compensator.status()}), 200
+
+@app.route('/compensation', methods=['POST'])
+@app.route('/tables/<table_id>/compensation', methods=['POST'])
+def start_compensation(table_id=None):
+    """
+    Iterative tracking-error compensation. A body with a waveform (like
+    /start-movement) or a record (like /start-record) sets a new target,
+    without one the current target keeps learning. Each of `iterations`
+    runs moves the table.
+    """
+    controller = registry.get(table_id)
+    if controller is None:
+        return unknown_table(table_id)
+    try:
+        data = request.get_json(silent=True) or {}
+        waveform = data.get('waveform')
+        record = data.get('record')
+        compensator = None
+        if waveform or record:
+            # Only replaces the current target once the job is accepted
+            response = controller.prepare_compensation(
+                waveform=(
+                    float(waveform.get('displacement', 0)),
+                    float(waveform.get('frequency', 0)),
+                    float(waveform.get('duration', 0)),
+                    float(waveform.get('percentDamped', 0))
+                ) if waveform else None,
+                record=record
+            )
+            if response["status"] == "error":
+                return jsonify(response), 400
+            compensator = response["compensator"]
+        elif controller.compensator is None:
+            return jsonify({"status": "error", "message": "No waveform or record received"}), 400
+        iterations = data.get('iterations')
+        return start_motion_job("Compensation", controller.run_compensation,
+                                int(iterations) if iterations is not None else None, True, compensator,
+                                table_ids=[controller.table_id])
+    except Exception as e:
+        error_msg = f"Error starting compensation: {str(e)}"
+        log.error(error_msg)
+        trigger_alert(error_msg, controller.message_queue)
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/compensation/run', methods=['POST'])
+@app.route('/tables/<table_id>/compensation/run', methods=['POST'])
+def run_compensated(table_id=None):
+    """Runs the corrected command once without learning from it."""
+    controller = registry.get(table_id)
+    if controller is None:
+        return unknown_table(table_id)
+    if controller.compensator is None:
+        return jsonify({"status": "error", "message": "No compensation target set."}), 400
+    return start_motion_job("Compensated run", controller.run_compensation, None, False,
+                            table_ids=[controller.table_id])
+
+@app.route('/campaigns')
+@app.route('/tables/<table_id>/campaigns')
+def campaign_status(table_id=None):
+    """Queued and finished campaign runs of a table."""
+    controller = registry.get(table_id)
+    if controller is None:
+        return unknown_table(table_id)
+    return jsonify({"status": "success", **controller.campaign.status()}), 200
+
+@app.route('/campaigns', methods=['POST'])
+@app.route('/tables/<table_id>/campaigns', methods=['POST'])
+def submit_campaign(table_id=None):
+    """
+    Queues a sweep, e.g. {"displacements": [5, 10], "frequencies": {"start": 1, "stop": 5, "step": 0.5},
+    "duration": 10, "settle": 2, "reset": true}. Runs start at once unless "start" is false.
+    """
+    controller = registry.get(table_id)
+    if controller is None:
+        return unknown_table(table_id)
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({"status": "error", "message": "No sweep received"}), 400
+        start = bool(data.get('start', True))
+        with motion_lock:
+            if start and motion_job_running(controller.table_id):
+                return jsonify({"status": "error", "message": "A movement is already being sent to the table."}), 409
+            campaign = controller.campaign.submit(data, start=start)
+        return jsonify({"status": "success", "message": f"Queued {campaign['runs']} runs.", "campaign": campaign}), 200
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"status": "error", "message": f"Invalid sweep: {e}"}), 400
+    except Exception as e:
+        error_msg = f"Error queueing campaign: {str(e)}"
+        log.error(error_msg)
+        trigger_alert(error_msg, controller.message_queue)
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/campaigns/<action>', methods=['POST'])
+@app.route('/tables/<table_id>/campaigns/<action>', methods=['POST'])
+def control_campaign(action, table_id=None):
+    """pause (after the current run), resume, cancel (queued runs, of {"campaign": id} or all) or clear (finished runs)."""
+    controller = registry.get(table_id)
+    if controller is None:
+        return unknown_table(table_id)
+    scheduler = controller.campaign
+    if action == 'pause':
+        scheduler.pause()
+    elif action == 'resume':
+        with motion_lock:
+            if motion_job_running(controller.table_id):
+                return jsonify({"status": "error", "message": "A movement is already being sent to the table."}), 409
+            scheduler.resume()
+    elif action == 'cancel':
+        data = request.get_json(silent=True) or {}
+        cancelled = scheduler.cancel(data.get('campaign'))
+        return jsonify({"status": "success", "message": f"Cancelled {cancelled} runs."}), 200
+    elif action == 'clear':
+        scheduler.clear()
+    else:
+        return jsonify({"status": "error", "message": f"Unknown campaign action {action}"}), 404
+    return jsonify({"status": "success", **scheduler.stats()}), 200
+
 @app.route('/start-manual', methods=['POST'])
-def start_manual():
+@app.route('/tables/<table_id>/start-manual', methods=['POST'])
+def start_manual(table_id=None):
+    controller = registry.get(table_id)
+    if controller is None:
+        return unknown_table(table_id)
+    if controller.campaign.running:
+        return jsonify({"status": "error", "message": "A campaign is running on the table."}), 409
     try:
         data = request.get_json()
         if not data:
@@ -116,11 +541,11 @@ def start_manual():
 
         speed = data.get('speed', 0)
         displacement = data.get('displacement', 0)
-        response = pico_manager.run_manual_routine(speed, displacement)
+        response = controller.run_manual_routine(speed, displacement)
         log.info(f"Manual routine response: {response}")
 
         if response["status"] == "error":
-            trigger_alert(response["message"])
+            trigger_alert(response["message"], controller.message_queue)
             log.warning(f"Manual routine failed: {response}")
             return jsonify(response), 400
         return jsonify(response), 200
@@ -128,48 +553,175 @@ def start_manual():
     except Exception as e:
         error_msg = f"Error running manual routine: {str(e)}"
         log.error(error_msg)
-        trigger_alert(error_msg)
+        trigger_alert(error_msg, controller.message_queue)
         return jsonify({"status": "error", "message": str(e)}), 500
 
 @app.route('/stop-movement', methods=['POST'])
-def stop_movement():
+@app.route('/tables/<table_id>/stop-movement', methods=['POST'])
+def stop_movement(table_id=None):
+    controller = registry.get(table_id)
+    if controller is None:
+        return unknown_table(table_id)
     try:
         log.info("Sending stop movement command")
-        response = pico_manager.stop_table()
+        response = controller.stop_table()
         log.info(f"Stop command response: {response}")
         if response["status"] == "error":
-            trigger_alert(response["message"])
+            trigger_alert(response["message"], controller.message_queue)
             return jsonify(response), 400
         return jsonify(response), 200
     except Exception as e:
         error_msg = f"Error stopping table: {str(e)}"
         log.error(error_msg)
-        trigger_alert(error_msg)
+        trigger_alert(error_msg, controller.message_queue)
         return jsonify({"status": "error", "message": str(e)}), 500
 
 @app.route('/reset-position', methods=['POST'])
-def reset_position():
+@app.route('/tables/<table_id>/reset-position', methods=['POST'])
+def reset_position(table_id=None):
+    controller = registry.get(table_id)
+    if controller is None:
+        return unknown_table(table_id)
     try:
         log.info("Centering Table")
-        response = pico_manager.reset_table()
+        response = controller.reset_table()
         log.info(f"Reset command response: {response}")
         if response["status"] == "error":
-            trigger_alert(response["message"])
+            trigger_alert(response["message"], controller.message_queue)
             return jsonify(response), 400
         return jsonify(response), 200
     except Exception as e:
         error_msg = f"Error resetting table: {str(e)}"
         log.error(error_msg)
+        trigger_alert(error_msg, controller.message_queue)
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/tables')
+def list_tables():
+    """Known tables; ?refresh=1 looks for newly connected Picos first."""
+    if request.args.get('refresh') == '1':
+        start_telemetry_publishers(registry.refresh())
+    return jsonify({"status": "success", "tables": registry.tables()}), 200
+
+@app.route('/tables/<table_id>/connect', methods=['POST'])
+def connect_table(table_id):
+    """Connects a table in the background, progress arrives as 'connection' events."""
+    controller = registry.get(table_id)
+    if controller is None:
+        return unknown_table(table_id)
+    try:
+        if not controller.connect_async():
+            return jsonify({"status": "error", "message": f"Table {table_id} is already connecting."}), 409
+        return jsonify({"status": "success", "message": f"Connecting table {table_id}."}), 202
+    except Exception as e:
+        error_msg = f"Error connecting table {table_id}: {str(e)}"
+        log.error(error_msg)
+        trigger_alert(error_msg, controller.message_queue)
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/tables/start', methods=['POST'])
+def start_tables():
+    """
+    Starts movements on several tables together. The body maps table IDs to
+    /start-movement bodies, or lists table IDs that all run one movement:
+    {"tables": {"a": {"waveform": {...}}, "b": {"commands": [...]}}}
+    {"tables": ["a", "b"], "waveform": {...}}
+    """
+    try:
+        data = request.get_json()
+        tables = data.get('tables') if data else None
+        if not tables:
+            return jsonify({"status": "error", "message": "No tables received"}), 400
+        if isinstance(tables, list):
+            tables = {table_id: data for table_id in tables}
+
+        movements = {}
+        for table_id, body in tables.items():
+            if registry.get(table_id) is None:
+                return unknown_table(table_id)
+            waveform = body.get('waveform')
+            if waveform:
+                movements[table_id] = {"waveform": (
+                    float(waveform.get('displacement', 0)),
+                    float(waveform.get('frequency', 0)),
+                    float(waveform.get('duration', 0)),
+                    float(waveform.get('percentDamped', 0))
+                )}
+            elif body.get('commands'):
+                movements[table_id] = {"commands": body['commands']}
+            else:
+                return jsonify({"status": "error", "message": f"No waveform or commands for table {table_id}"}), 400
+
+        log.info(f"Starting tables {', '.join(movements)} together")
+        return start_motion_job("Synchronized start", registry.start_synchronized, movements,
+                                table_ids=list(movements))
+    except Exception as e:
+        error_msg = f"Error starting tables: {str(e)}"
+        log.error(error_msg)
+        trigger_alert(error_msg)
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/tables/stop', methods=['POST'])
+def stop_tables():
+    try:
+        log.info("Stopping every table")
+        responses = registry.stop_all()
+        failed = {table_id: response["message"] for table_id, response in responses.items()
+                  if response["status"] == "error"}
+        if failed:
+            trigger_alert(f"Could not stop every table: {failed}")
+            return jsonify({"status": "error", "message": f"Could not stop every table: {failed}"}), 400
+        return jsonify({"status": "success", "message": f"Stopped {len(responses)} tables."}), 200
+    except Exception as e:
+        error_msg = f"Error stopping tables: {str(e)}"
+        log.error(error_msg)
         trigger_alert(error_msg)
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route('/metrics')
+def get_metrics():
+    """Latency summaries and counters in the Prometheus text format."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/profiler', methods=['GET', 'POST'])
+def profiler():
+    """
+    Opt-in sampling profiler. POST {"enabled": true, "interval": 0.005} to
+    start it, {"enabled": false} to stop and {"reset": true} to clear the
+    samples. GET ?format=collapsed returns the sampled stacks for flame
+    graph tools, otherwise the profiler status.
+    """
+    try:
+        if request.method == 'POST':
+            data = request.get_json() or {}
+            if data.get('reset'):
+                metrics.profiler.reset()
+            if data.get('enabled') is True:
+                interval = data.get('interval')
+                metrics.profiler.start(float(interval) if interval else None)
+                log.info(f"Sampling profiler started, interval {metrics.profiler.interval}s")
+            elif data.get('enabled') is False:
+                metrics.profiler.stop()
+                log.info(f"Sampling profiler stopped after {metrics.profiler.samples} samples")
+        elif request.args.get('format') == 'collapsed':
+            limit = request.args.get('limit', type=int)
+            return Response(metrics.profiler.collapsed(limit), mimetype='text/plain')
+        return jsonify({"status": "success", **metrics.profiler.status()}), 200
+    except Exception as e:
+        error_msg = f"Error controlling profiler: {str(e)}"
+        log.error(error_msg)
+        return jsonify({"status": "error", "message": str(e)}), 500
+
 if __name__ == '__main__':
-    # Uncomment the following two lines if you want to run the app without connecting to the pico
-    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+    # With the reloader the app is started twice, only the reloaded child connects
+    use_reloader = app.config['FLASK_RELOADER']
+    if not use_reloader or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
         setup_connection()
 
     app.run(
         debug=app.config['DEBUG'],
         host=app.config['FLASK_HOST'],
-        port=app.config['FLASK_PORT']
-    )
\ No newline at end of file
+        port=app.config['FLASK_PORT'],
+        use_reloader=use_reloader,
+        threaded=True
+    )
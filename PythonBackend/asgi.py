@@ -0,0 +1,20 @@
+# asgi.py
+"""
+ASGI entry point.
+
+Serves the Flask app from an ASGI server, e.g.:
+    uvicorn asgi:application --host 127.0.0.1 --port 5051
+
+Each request runs on its own worker thread, so long-lived SSE streams and
+serial round trips never hold up other requests. Uploads are already run
+in the background by app.py.
+"""
+from a2wsgi import WSGIMiddleware
+
+from app import app, setup_connection
+
+# Every open /stream connection holds one worker
+ASGI_WORKERS = 32
+
+setup_connection()
+application = WSGIMiddleware(app, workers=ASGI_WORKERS)
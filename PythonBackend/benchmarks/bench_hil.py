@@ -0,0 +1,266 @@
+"""
+Hardware-in-the-loop benchmark suite.
+
+Runs PicoLink and ShakeTableController against the software Pico in
+pico_emulator.py (or a real Pico with --port) and measures connect time,
+per-command round-trip latency, batch upload throughput, STOP latency and
+the start skew of several tables started together.
+Results are written as JSON; pass --baseline with an earlier report to fail
+on regressions.
+
+Usage:
+    python benchmarks/bench_hil.py [--latency 0.0002] [--sizes 1000 10000]
+                                   [--report bench_hil.json] [--baseline old.json]
+"""
+import argparse
+import functools
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from logger import Logger  # noqa: E402
+
+# Keep per-line INFO logging out of the measurement
+Logger(log_level=logging.WARNING, console_level=logging.WARNING)
+
+from config import Config  # noqa: E402
+from pico_emulator import PicoEmulator  # noqa: E402
+from pico_link import PicoLink  # noqa: E402
+from shake_table_controller import ShakeTableController  # noqa: E402
+from table_registry import TableRegistry  # noqa: E402
+
+# Metrics where a larger value is better; every other metric is a duration
+HIGHER_IS_BETTER = ("cmd_per_sec",)
+
+
+def _percentiles(samples):
+    samples = sorted(samples)
+    return {
+        "p50_ms": samples[len(samples) // 2] * 1e3,
+        "p99_ms": samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1e3,
+        "mean_ms": statistics.fmean(samples) * 1e3,
+        "max_ms": samples[-1] * 1e3,
+    }
+
+
+def bench_connect(port, repeats, make_emulator=None):
+    """
+    Time from constructing PicoLink to a configured, connected link.
+
+    With the emulator every repeat gets a freshly booted device, like
+    plugging the Pico in again.
+    """
+    samples = []
+    for _ in range(repeats):
+        emulator = make_emulator() if make_emulator else None
+        if emulator is not None:
+            port = emulator.start()
+        start = time.perf_counter()
+        link = PicoLink(port=port)
+        link.open()
+        samples.append(time.perf_counter() - start)
+        connected = link.is_connected()
+        link.close()
+        if emulator is not None:
+            emulator.close()
+        if not connected:
+            raise RuntimeError(f"Could not connect to {port}")
+    return _percentiles(samples)
+
+
+def bench_rtt(link, count):
+    """Round trip of single CONF commands."""
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        link.send("CONF")
+        samples.append(time.perf_counter() - start)
+    return _percentiles(samples)
+
+
+def bench_upload(link, controller, sizes, window):
+    results = {}
+    for size in sizes:
+        commands = [f"MOVE 4000 640000 {80 + i % 400} {i % 2}" for i in range(size)]
+
+        start = time.perf_counter()
+        failed = link.send_pipelined(commands, window=window, announce=[f"BATCH_SIZE {size}"])
+        elapsed = time.perf_counter() - start
+
+        # The controller adds the BATCH_SIZE handshake and its own bookkeeping
+        start = time.perf_counter()
+        response = controller.send_movement_data(commands, window=window)
+        controller_elapsed = time.perf_counter() - start
+
+        results[str(size)] = {
+            "pico_link": {"seconds": elapsed, "cmd_per_sec": size / elapsed, "failed": len(failed)},
+            "controller": {"seconds": controller_elapsed, "cmd_per_sec": size / controller_elapsed,
+                           "status": response["status"]},
+        }
+    return results
+
+
+def bench_stop(controller, emulator, repeats, size):
+    """
+    Time from stop_table() to its reply while an upload is in flight.
+
+    With the emulator the arrival time of STOP on the device side is also
+    reported, separating host queueing from the reply path.
+    """
+    commands = [f"MOVE 4000 640000 {80 + i % 400} {i % 2}" for i in range(size)]
+    samples, arrival = [], []
+    for _ in range(repeats):
+        upload = threading.Thread(target=controller.send_movement_data, args=(commands,))
+        upload.start()
+        time.sleep(0.05)
+        start = time.perf_counter()
+        monotonic_start = time.monotonic()
+        controller.stop_table()
+        samples.append(time.perf_counter() - start)
+        if emulator is not None and emulator.stop_received_at is not None:
+            arrival.append(max(0.0, emulator.stop_received_at - monotonic_start))
+        upload.join()
+    result = {"reply": _percentiles(samples)}
+    if arrival:
+        result["device_arrival"] = _percentiles(arrival)
+    return result
+
+
+def bench_sync_start(make_emulator, tables, repeats):
+    """
+    Skew between tables started with TableRegistry.start_synchronized, as
+    written by the host and as seen by the emulated devices.
+    """
+    emulators = [make_emulator() for _ in range(tables)]
+    Config.TABLE_PORTS = ','.join(emulator.start() for emulator in emulators)
+    registry = TableRegistry()
+    registry.open_all()
+    movement = {"waveform": (10, 2, 1, 0)}
+    host, device = [], []
+    for _ in range(repeats):
+        response = registry.start_synchronized({table_id: movement for table_id, _ in registry.controllers()})
+        if response["status"] != "success":
+            raise RuntimeError(response["message"])
+        host.append(response["skew_ms"] / 1e3)
+        started = [emulator.batch_started_at for emulator in emulators]
+        device.append(max(started) - min(started))
+    registry.close_all()
+    for emulator in emulators:
+        emulator.close()
+    Config.TABLE_PORTS = ''
+    return {"tables": tables, "host": _percentiles(host), "device": _percentiles(device)}
+
+
+def _flatten(report, prefix=""):
+    flat = {}
+    for key, value in report.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(results, baseline, tolerance):
+    """Returns the metrics that got worse than the baseline by more than `tolerance` (fraction)."""
+    current, previous = _flatten(results), _flatten(baseline)
+    regressions = []
+    for name, value in current.items():
+        old = previous.get(name)
+        if not old or name.endswith("failed"):
+            continue
+        if name.endswith(HIGHER_IS_BETTER):
+            change = (old - value) / old
+        elif name.endswith("_ms") or name.endswith("seconds"):
+            change = (value - old) / old
+        else:
+            continue
+        if change > tolerance:
+            regressions.append({"metric": name, "baseline": old, "current": value, "change": change})
+    return regressions
+
+
+def run(args):
+    Config.BINARY_PROTOCOL = not args.text_only
+    emulator = None
+    port = args.port
+    # Without a port every stage runs against fresh emulators
+    make_emulator = None if port is not None else functools.partial(
+        PicoEmulator, latency=args.latency, buffer_size=max(args.sizes), binary=not args.text_only)
+
+    results = {"connect": bench_connect(port, args.connect_repeats, make_emulator)}
+
+    if make_emulator is not None:
+        emulator = make_emulator()
+        port = emulator.start()
+    Config.COM_PORT = port
+
+    link = PicoLink(port=port)
+    link.open()
+    results["rtt"] = bench_rtt(link, args.rtt_count)
+    link.close()
+    if emulator is not None:
+        emulator.reboot()
+
+    controller = ShakeTableController()
+    controller.open_connection()
+    results["upload"] = bench_upload(controller.conn, controller, args.sizes, args.window)
+    results["stop"] = bench_stop(controller, emulator, args.stop_repeats, max(args.sizes))
+    controller.close_connection()
+    if emulator is not None:
+        emulator.close()
+
+    if make_emulator is not None and args.tables > 1:
+        results["sync_start"] = bench_sync_start(make_emulator, args.tables, args.sync_repeats)
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "target": "emulator" if emulator else port,
+        "settings": {"latency": args.latency, "window": args.window or Config.UPLOAD_WINDOW,
+                     "binary": Config.BINARY_PROTOCOL, "sizes": args.sizes},
+        "results": results,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["regressions"] = compare(results, json.load(f)["results"], args.tolerance)
+
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"Report written to {args.report}")
+    if report.get("regressions"):
+        for regression in report["regressions"]:
+            print(f"REGRESSION {regression['metric']}: {regression['baseline']:.4g} -> "
+                  f"{regression['current']:.4g} ({regression['change']:+.0%})")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--port', default=None, help="Benchmark a real Pico instead of the emulator")
+    parser.add_argument('--latency', type=float, default=0.0002, help="Emulated per-command latency (s)")
+    parser.add_argument('--text-only', action='store_true', help="Stay on the text protocol")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--window', type=int, default=None)
+    parser.add_argument('--connect-repeats', type=int, default=5)
+    parser.add_argument('--rtt-count', type=int, default=500)
+    parser.add_argument('--stop-repeats', type=int, default=5)
+    parser.add_argument('--tables', type=int, default=3, help="Emulated tables started together, 1 to skip")
+    parser.add_argument('--sync-repeats', type=int, default=10)
+    parser.add_argument('--report', default='bench_hil.json')
+    parser.add_argument('--baseline', default=None, help="Earlier report to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed slowdown before flagging")
+    args = parser.parse_args()
+    sys.exit(run(args))
@@ -0,0 +1,137 @@
+"""
+Backend startup benchmark.
+
+Starts app.py as a subprocess, like the Electron shell does, and measures
+the time until the web UI is served and the time until the table reports
+connected. The table is the software Pico from pico_emulator.py; with
+--no-device the port does not exist, which is the case that used to hold
+the server up for CONNECTION_TIMEOUT.
+
+Usage:
+    python benchmarks/bench_startup.py [--repeats 5] [--no-device]
+                                       [--report bench_startup.json] [--baseline old.json]
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(BACKEND_DIR))
+
+from bench_hil import _percentiles, compare  # noqa: E402
+from pico_emulator import PicoEmulator  # noqa: E402
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _get(url, timeout=0.5):
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return response.status, response.read()
+    except OSError:
+        return None, None
+
+
+def start_once(device_port, timeout, wait_connected=True):
+    """
+    One backend start.
+
+    :return: (seconds until / is served, seconds until connected or None)
+    """
+    http_port = _free_port()
+    env = dict(os.environ, COM_PORT=device_port, TABLE_PORTS=device_port, FLASK_PORT=str(http_port),
+               RECORD_RUNS='0', FLASK_RELOADER='0',
+               PYTHONPATH=os.pathsep.join(filter(None, [os.path.dirname(BACKEND_DIR), os.environ.get('PYTHONPATH')])))
+    base = f"http://127.0.0.1:{http_port}"
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, 'app.py'], cwd=BACKEND_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    serving = connected = None
+    try:
+        while time.perf_counter() - start < timeout:
+            if serving is None:
+                status, _ = _get(f"{base}/")
+                if status == 200:
+                    serving = time.perf_counter() - start
+            else:
+                status, body = _get(f"{base}/tables")
+                if status == 200 and any(table["connected"] for table in json.loads(body)["tables"]):
+                    connected = time.perf_counter() - start
+                    break
+                if not wait_connected:
+                    break
+            time.sleep(0.005)
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+    if serving is None:
+        raise RuntimeError(f"Backend was not serving within {timeout} s")
+    return serving, connected
+
+
+def run(args):
+    serving, connected = [], []
+    for _ in range(args.repeats):
+        emulator = None
+        if args.no_device:
+            port = '/dev/nonexistent-pico'
+        else:
+            emulator = PicoEmulator(latency=args.latency)
+            port = emulator.start()
+        try:
+            served_after, connected_after = start_once(port, args.timeout, wait_connected=not args.no_device)
+        finally:
+            if emulator is not None:
+                emulator.close()
+        serving.append(served_after)
+        if connected_after is not None:
+            connected.append(connected_after)
+
+    results = {"serving": _percentiles(serving)}
+    if connected:
+        results["connected"] = _percentiles(connected)
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {"repeats": args.repeats, "device": not args.no_device, "latency": args.latency},
+        "results": results,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["regressions"] = compare(results, json.load(f)["results"], args.tolerance)
+
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"Report written to {args.report}")
+    if report.get("regressions"):
+        for regression in report["regressions"]:
+            print(f"REGRESSION {regression['metric']}: {regression['baseline']:.4g} -> "
+                  f"{regression['current']:.4g} ({regression['change']:+.0%})")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--no-device', action='store_true', help="Start without a Pico on the port")
+    parser.add_argument('--latency', type=float, default=0.0002, help="Emulated per-command latency (s)")
+    parser.add_argument('--timeout', type=float, default=30, help="Give up on a start after this many seconds")
+    parser.add_argument('--report', default='bench_startup.json')
+    parser.add_argument('--baseline', default=None, help="Earlier report to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed slowdown before flagging")
+    args = parser.parse_args()
+    sys.exit(run(args))
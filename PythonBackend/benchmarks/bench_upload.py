@@ -0,0 +1,47 @@
+"""
+Loopback benchmark for pipelined batch uploads.
+
+Opens PicoLink on pyserial's ``loop://`` port, where every line written is read
+straight back and treated as the reply, and reports commands/second for a
+range of batch sizes and upload windows.
+
+Usage:
+    python benchmarks/bench_upload.py [--windows 1 8 32] [--sizes 100 1000 10000 100000]
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from logger import Logger  # noqa: E402
+
+# Keep per-line INFO logging out of the measurement
+Logger(log_level=logging.WARNING, console_level=logging.WARNING)
+
+from pico_link import PicoLink  # noqa: E402
+
+
+def run(sizes, windows):
+    link = PicoLink(port='loop://')
+    print(f"{'batch':>8} {'window':>7} {'seconds':>9} {'cmd/s':>10}")
+    for size in sizes:
+        commands = [f"MOVE 4000 640000 {80 + i % 400} {i % 2}" for i in range(size)]
+        for window in windows:
+            start = time.perf_counter()
+            failed = link.send_pipelined(commands, window=window)
+            elapsed = time.perf_counter() - start
+            status = f"  ({len(failed)} failed)" if failed else ""
+            print(f"{size:>8} {window:>7} {elapsed:>9.3f} {size / elapsed:>10.0f}{status}")
+    link.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 100000])
+    parser.add_argument('--windows', type=int, nargs='+', default=[1, 8, 32])
+    args = parser.parse_args()
+    run(args.sizes, args.windows)
@@ -0,0 +1,170 @@
+# broadcaster.py
+import threading
+import time
+from collections import deque
+
+import metrics
+from config import Config
+from logger import Logger
+
+# Initialize the logger
+logger = Logger()
+log = logger.get_logger(__name__)
+
+# Only the latest pending event of these types matters to a client
+COALESCE_TYPES = ('status', 'heartbeat')
+
+
+class Subscription:
+    """One client's bounded view of the broadcast."""
+
+    def __init__(self, broadcaster, max_pending):
+        self.broadcaster = broadcaster
+        self.pending = deque()
+        self._published = deque()  # publish time of each pending event, for the delivery lag
+        self.max_pending = max_pending
+        self.dropped = 0
+        self.coalesced = 0
+        self._cond = threading.Condition()
+
+    def _deliver(self, event):
+        with self._cond:
+            if event[1] in COALESCE_TYPES:
+                for i, pending in enumerate(self.pending):
+                    if pending[1] == event[1]:
+                        self.pending[i] = event
+                        self.coalesced += 1
+                        self._cond.notify()
+                        return
+            if len(self.pending) >= self.max_pending:
+                self.pending.popleft()
+                self._published.popleft()
+                self.dropped += 1
+            self.pending.append(event)
+            self._published.append(time.perf_counter())
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """
+        Waits for events and returns every pending one.
+
+        :return: List of (event id or None, type, data) tuples, empty on timeout.
+        """
+        with self._cond:
+            if not self.pending:
+                self._cond.wait(timeout)
+            events = list(self.pending)
+            self.pending.clear()
+            published = list(self._published)
+            self._published.clear()
+        now = time.perf_counter()
+        for stamp in published:
+            metrics.SSE_LAG.observe(now - stamp)
+        return events
+
+    def close(self):
+        self.broadcaster.unsubscribe(self)
+
+
+class Broadcaster:
+    """
+    Publish/subscribe fan-out of server-sent events.
+
+    Every subscriber gets its own bounded buffer, so a slow client loses its
+    oldest events (and sees only the latest status and heartbeat) without
+    holding up other clients or the code publishing events. Recent events
+    keep their ids so a reconnecting client can resume from Last-Event-ID.
+    One heartbeat thread serves every subscriber.
+
+    `put((event_type, data))` makes it a drop-in for the message queue
+    ShakeTableController and PicoLink publish to.
+    """
+
+    def __init__(self, replay_size=None, max_pending=None):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._replay = deque(maxlen=replay_size or Config.SSE_REPLAY_SIZE)
+        self._next_id = 1
+        self.max_pending = max_pending or Config.SSE_MAX_PENDING
+        self._heartbeat = None
+
+    def publish(self, event_type, data, replay=True):
+        """
+        Sends an event to every subscriber.
+
+        :param replay: Give the event an id and keep it for Last-Event-ID replay.
+        """
+        with self._lock:
+            if replay:
+                event = (self._next_id, event_type, data)
+                self._next_id += 1
+                self._replay.append(event)
+            else:
+                event = (None, event_type, data)
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber._deliver(event)
+
+    def put(self, message):
+        """Queue-style publish of an (event_type, data) tuple."""
+        event_type, data = message
+        self.publish(event_type, data)
+
+    def subscribe(self, last_event_id=None):
+        """
+        Registers a new client, first replaying events after `last_event_id`.
+
+        :param last_event_id: Value of the client's Last-Event-ID header, if any.
+        """
+        subscription = Subscription(self, self.max_pending)
+        with self._lock:
+            if last_event_id is not None:
+                try:
+                    last = int(last_event_id)
+                except ValueError:
+                    last = None
+                if last is not None:
+                    for event in self._replay:
+                        if event[0] > last:
+                            subscription._deliver(event)
+            self._subscribers.add(subscription)
+        log.info(f"SSE client subscribed ({len(self._subscribers)} connected)")
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+        if subscription.dropped:
+            log.warning(f"SSE client dropped {subscription.dropped} events while connected")
+        log.info(f"SSE client unsubscribed ({len(self._subscribers)} connected)")
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def start_heartbeat(self, status_fn, interval=None):
+        """
+        Publishes `status_fn()` as a heartbeat event every `interval` seconds
+        from a single thread shared by all subscribers.
+        """
+        if self._heartbeat is not None:
+            return
+        interval = interval or Config.SSE_HEARTBEAT_TIMEOUT
+
+        def beat():
+            while True:
+                time.sleep(interval)
+                if self._subscribers:
+                    self.publish('heartbeat', status_fn(), replay=False)
+
+        self._heartbeat = threading.Thread(target=beat)
+        self._heartbeat.daemon = True
+        self._heartbeat.start()
+
+
+def format_event(event):
+    """Formats an (id, type, data) tuple as a server-sent event."""
+    event_id, event_type, data = event
+    if event_id is None:
+        return f"event: {event_type}\ndata: {data}\n\n"
+    return f"id: {event_id}\nevent: {event_type}\ndata: {data}\n\n"
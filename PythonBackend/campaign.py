@@ -0,0 +1,311 @@
+# campaign.py
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import feasibility
+from config import Config
+from logger import Logger
+
+# Initialize the logger
+logger = Logger()
+log = logger.get_logger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+STOPPED = 'stopped'
+CANCELLED = 'cancelled'
+FINISHED_STATES = (DONE, FAILED, STOPPED, CANCELLED)
+
+
+def _values(spec, name):
+    """A sweep axis: a number, a list, or {"start", "stop", "step"} with both ends included."""
+    value = spec.get(name)
+    if value is None:
+        raise ValueError(f"Sweep needs {name}")
+    if isinstance(value, dict):
+        start, stop, step = float(value['start']), float(value['stop']), float(value['step'])
+        if step <= 0:
+            raise ValueError(f"{name} step must be positive")
+        return np.round(np.arange(start, stop + step / 2, step), 6).tolist()
+    if isinstance(value, (list, tuple)):
+        return [float(v) for v in value]
+    return [float(value)]
+
+
+def expand_sweep(spec):
+    """
+    Turns a sweep definition into one job per grid point.
+
+    :param spec: {"name", "displacements", "frequencies", "duration", "percentDamped",
+                  "repeats", "settle", "reset"}; displacements and frequencies are
+                  each a number, a list or {"start", "stop", "step"}.
+    :return: (campaign dict, list of job dicts)
+    """
+    displacements = _values(spec, 'displacements')
+    frequencies = _values(spec, 'frequencies')
+    duration = float(spec.get('duration', 0))
+    if duration <= 0:
+        raise ValueError("Sweep needs a positive duration")
+    repeats = max(1, int(spec.get('repeats', 1)))
+    campaign = {
+        "id": uuid.uuid4().hex[:8],
+        "name": spec.get('name') or f"{len(displacements)}x{len(frequencies)} sweep",
+        "settle": float(spec.get('settle', Config.CAMPAIGN_SETTLE)),
+        "reset": bool(spec.get('reset', Config.CAMPAIGN_RESET)),
+        "created": time.time(),
+    }
+    jobs = [
+        {
+            "id": f"{campaign['id']}-{i + 1}",
+            "campaign": campaign['id'],
+            "displacement": displacement,
+            "frequency": frequency,
+            "duration": duration,
+            "percentDamped": float(spec.get('percentDamped', 0)),
+            "state": QUEUED,
+            "message": None,
+            "started": None,
+            "finished": None,
+        }
+        for i, (_, displacement, frequency) in enumerate(
+            itertools.product(range(repeats), displacements, frequencies)
+        )
+    ]
+    if len(jobs) > Config.CAMPAIGN_MAX_JOBS:
+        raise ValueError(f"Sweep of {len(jobs)} runs exceeds CAMPAIGN_MAX_JOBS ({Config.CAMPAIGN_MAX_JOBS})")
+    return campaign, jobs
+
+
+class CampaignScheduler:
+    """
+    Runs queued test campaigns on one table back to back.
+
+    Jobs are kept in a JSON file, so a queue survives a restart; it comes
+    back paused, and jobs that were running are marked stopped. While one
+    job runs, the next Config.CAMPAIGN_WORKERS are compiled and checked
+    for feasibility on a thread pool, so the next upload starts from the
+    profile cache as soon as the table has settled. After each run the
+    scheduler waits the campaign's settle time and, if enabled, sends
+    RESET and waits Config.CAMPAIGN_RESET_TIME for the table to recentre.
+    Every job state change is published as a 'campaign' event.
+    """
+
+    def __init__(self, controller, path=None):
+        """
+        :param controller: ShakeTableController of the table.
+        :param path: Queue file (default: the table's file in Config.CAMPAIGN_DIR).
+        """
+        self.controller = controller
+        self.path = path or os.path.join(Config.CAMPAIGN_DIR, f"{controller.table_id or 'default'}.json")
+        self.campaigns = {}
+        self.jobs = []
+        self._lock = threading.RLock()
+        self._compiled = {}  # job ID -> Future of (ok, message)
+        self._pool = ThreadPoolExecutor(max_workers=Config.CAMPAIGN_WORKERS)
+        self._thread = None
+        self._paused = threading.Event()
+        self._abort = threading.Event()
+        self.started = None
+        self.motion_time = 0.0
+        self._load()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            log.error(f"Could not read campaign queue {self.path}: {e}")
+            return
+        self.campaigns = saved.get("campaigns", {})
+        self.jobs = saved.get("jobs", [])
+        for job in self.jobs:
+            if job["state"] == RUNNING:
+                job.update(state=STOPPED, message="Interrupted by a restart", finished=time.time())
+        queued = sum(job["state"] == QUEUED for job in self.jobs)
+        if queued:
+            self._paused.set()
+            log.info(f"Loaded campaign queue {self.path} with {queued} queued runs, paused")
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({"campaigns": self.campaigns, "jobs": self.jobs}, f)
+        os.replace(tmp, self.path)
+
+    def _update(self, job, **changes):
+        """Changes a job, saves the queue and publishes the job."""
+        with self._lock:
+            job.update(changes)
+            self._save()
+        if self.controller.message_queue:
+            self.controller.message_queue.put(('campaign', json.dumps(job)))
+
+    def submit(self, spec, start=True):
+        """
+        Queues the runs of a sweep definition (see expand_sweep) behind the
+        ones already queued.
+
+        :param start: Start running the queue if it is not already.
+        :return: The campaign dict with its number of runs.
+        """
+        campaign, jobs = expand_sweep(spec)
+        with self._lock:
+            self.campaigns[campaign["id"]] = campaign
+            self.jobs.extend(jobs)
+            self._save()
+        log.info(f"Queued campaign {campaign['name']} ({campaign['id']}) with {len(jobs)} runs")
+        self._precompile()
+        if start:
+            self.resume()
+        return dict(campaign, runs=len(jobs))
+
+    def _queued(self):
+        with self._lock:
+            return [job for job in self.jobs if job["state"] == QUEUED]
+
+    def _compile(self, job):
+        """Worker pool task: compiles a job's profile into the cache and checks it."""
+        batch, _ = self.controller._waveform_batch(job["displacement"], job["frequency"], job["duration"],
+                                                   job["percentDamped"])
+        report = feasibility.analyze(batch)
+        if not report["feasible"]:
+            return False, f"Movement rejected: {feasibility.summarize(report)}"
+        return True, None
+
+    def _precompile(self):
+        """Makes sure the next CAMPAIGN_WORKERS queued jobs are compiling."""
+        with self._lock:
+            # Repeats of a point share one compile, so the cache never writes the same file twice at once
+            by_params = {}
+            for job in self._queued()[:Config.CAMPAIGN_WORKERS + 1]:
+                params = (job["displacement"], job["frequency"], job["duration"], job["percentDamped"])
+                future = self._compiled.get(job["id"]) or by_params.get(params) or self._pool.submit(self._compile, job)
+                self._compiled[job["id"]] = by_params[params] = future
+
+    def resume(self):
+        """Starts or continues running queued jobs."""
+        self._paused.clear()
+        with self._lock:
+            if self.running or not self._queued():
+                return False
+            self._abort.clear()
+            self.started = time.time()
+            self.motion_time = 0.0
+            self._thread = threading.Thread(target=self._run, name=f"campaign-{self.controller.table_id}")
+            self._thread.daemon = True
+            self._thread.start()
+        return True
+
+    def pause(self):
+        """Finishes the current run, then waits with the rest queued."""
+        self._paused.set()
+
+    def stop(self):
+        """Aborts the current run, e.g. after STOP, and pauses the queue."""
+        self._paused.set()
+        self._abort.set()
+
+    def cancel(self, campaign_id=None):
+        """Cancels the queued runs of one campaign, or of all campaigns."""
+        cancelled = 0
+        with self._lock:
+            for job in self._queued():
+                if campaign_id is None or job["campaign"] == campaign_id:
+                    job.update(state=CANCELLED, finished=time.time())
+                    future = self._compiled.pop(job["id"], None)
+                    # Repeats of a point, also in other campaigns, share the compile
+                    if future is not None and future not in self._compiled.values():
+                        future.cancel()
+                    cancelled += 1
+            self._save()
+        return cancelled
+
+    def clear(self):
+        """Forgets finished runs and campaigns with nothing left queued."""
+        with self._lock:
+            self.jobs = [job for job in self.jobs if job["state"] not in FINISHED_STATES]
+            active = {job["campaign"] for job in self.jobs}
+            self.campaigns = {cid: c for cid, c in self.campaigns.items() if cid in active}
+            self._save()
+
+    def _run(self):
+        while not self._paused.is_set():
+            queued = self._queued()
+            if not queued:
+                break
+            job = queued[0]
+            self._precompile()
+            if not self._run_job(job):
+                break
+        log.info(f"Campaign queue {'paused' if self._paused.is_set() else 'finished'}: {self.stats()}")
+
+    def _run_job(self, job):
+        """Runs one job with its settle and reset steps; returns False to stop the queue."""
+        campaign = self.campaigns.get(job["campaign"], {})
+        future = self._compiled.pop(job["id"], None)
+        try:
+            ok, message = future.result() if future is not None else self._compile(job)
+        except Exception as e:
+            ok, message = False, f"Failed to compile waveform: {e}"
+        if not ok:
+            self._update(job, state=FAILED, message=message, finished=time.time())
+            return True
+        if self.controller.conn is None:
+            self._update(job, state=FAILED, message="Table is not connected", finished=time.time())
+            self._paused.set()
+            return False
+
+        self._update(job, state=RUNNING, started=time.time())
+        response = self.controller.run_waveform(job["displacement"], job["frequency"], job["duration"],
+                                                job["percentDamped"])
+        if response["status"] == "error":
+            self._update(job, state=FAILED, message=response["message"], finished=time.time())
+            return True
+        moving = time.time()
+        if self._abort.wait(job["duration"]):
+            self._update(job, state=STOPPED, message="Stopped", finished=time.time())
+            return False
+        self.motion_time += time.time() - moving
+        self._update(job, state=DONE, message=response["message"], finished=time.time())
+
+        if self._abort.wait(campaign.get("settle", Config.CAMPAIGN_SETTLE)):
+            return False
+        if campaign.get("reset", Config.CAMPAIGN_RESET) and self._queued():
+            self.controller.reset_table()
+            if self._abort.wait(Config.CAMPAIGN_RESET_TIME):
+                return False
+        return True
+
+    def stats(self):
+        """Job counts by state and the fraction of time the table was moving since the queue started."""
+        with self._lock:
+            counts = {}
+            for job in self.jobs:
+                counts[job["state"]] = counts.get(job["state"], 0) + 1
+        elapsed = time.time() - self.started if self.started else 0
+        return {
+            "running": self.running,
+            "paused": self._paused.is_set(),
+            "counts": counts,
+            "utilization": self.motion_time / elapsed if elapsed > 0 else 0.0,
+        }
+
+    def status(self):
+        with self._lock:
+            return dict(self.stats(), campaigns=list(self.campaigns.values()), jobs=[dict(job) for job in self.jobs])
@@ -0,0 +1,179 @@
+# compensation.py
+"""
+Tracking-error compensation by iterative learning control (ILC).
+
+The table lags and loses amplitude at higher frequencies, so a target
+displacement sent as is comes out late and small. After each run the
+measured response is compared with the target, the table's transfer
+function from command to response is estimated from every run so far, and
+the command is corrected by the inverse of that estimate applied to the
+error. All of it is done on whole-profile FFTs, so one iteration of a
+5-minute profile is a few transforms of a million points.
+"""
+import numpy as np
+
+from config import Config
+
+# Frequency bins excited this much less than the strongest one are left uncorrected
+MIN_EXCITATION = 1e-6
+
+
+def _fft_length(n):
+    """Power of two of at least n samples."""
+    return 1 << max(int(n) - 1, 1).bit_length()
+
+
+def _smooth(spectrum, bins):
+    """Moving average over `bins` neighbouring frequency bins."""
+    if bins <= 1:
+        return spectrum
+    padded = np.concatenate((np.zeros(1, dtype=spectrum.dtype), np.cumsum(spectrum)))
+    half = bins // 2
+    lo = np.clip(np.arange(len(spectrum)) - half, 0, len(spectrum))
+    hi = np.clip(np.arange(len(spectrum)) + half + 1, 0, len(spectrum))
+    return (padded[hi] - padded[lo]) / (hi - lo)
+
+
+def resample(times, positions, sample_rate, length):
+    """
+    Interpolates telemetry onto a uniform grid from its first sample.
+
+    :param times: Sample times in s, increasing.
+    :param positions: Table positions in mm.
+    :return: `length` positions at `sample_rate`, holding the last sample past the end.
+    """
+    times = np.asarray(times, dtype=np.float64)
+    grid = times[0] + np.arange(length) / sample_rate
+    return np.interp(grid, times, np.asarray(positions, dtype=np.float64))
+
+
+def estimate_delay(reference, measured, max_lag):
+    """
+    Samples by which `measured` lags `reference`, from the peak of their
+    FFT cross-correlation within 0..max_lag.
+    """
+    nfft = _fft_length(len(reference) + len(measured))
+    correlation = np.fft.irfft(
+        np.fft.rfft(measured - measured.mean(), nfft) * np.conj(np.fft.rfft(reference - reference.mean(), nfft)), nfft
+    )
+    return int(np.argmax(correlation[:max(1, min(max_lag, len(measured) - 1) + 1)]))
+
+
+class IterativeLearningController:
+    """
+    Corrects a command profile run by run until the table tracks the target.
+
+    Each update takes the response to the current command. The transfer
+    function H is estimated as the ratio of the cross spectrum of command
+    and response to the command's power spectrum, both summed over every
+    run and smoothed across neighbouring bins, so the estimate improves as
+    runs accumulate. The correction is
+
+        U[k+1] = U[k] + gain * Q * conj(H) / (|H|² + regularization) * (R - Y[k])
+
+    where Q is a zero-phase low-pass that stops learning above the cutoff,
+    where the table cannot follow and the estimate is mostly noise.
+    """
+
+    def __init__(self, target, sample_rate, gain=None, cutoff=None, regularization=None, smoothing=None,
+                 max_delay=None):
+        """
+        :param target: Displacement the table should follow, in mm.
+        :param sample_rate: Samples per second of `target`.
+        :param gain: Fraction of the error corrected per run (default: Config.ILC_GAIN).
+        :param cutoff: Frequency in Hz above which nothing is learned (default: Config.ILC_CUTOFF_HZ).
+        :param regularization: Keeps the inverse bounded where |H| is small (default: Config.ILC_REGULARIZATION).
+        :param smoothing: Bandwidth in Hz the estimate is averaged over (default: Config.ILC_SMOOTHING_HZ).
+        :param max_delay: Longest delay in s searched for between command and response
+                          (default: Config.ILC_MAX_DELAY).
+        """
+        self.target = np.asarray(target, dtype=np.float64)
+        self.sample_rate = float(sample_rate)
+        self.gain = Config.ILC_GAIN if gain is None else gain
+        self.cutoff = Config.ILC_CUTOFF_HZ if cutoff is None else cutoff
+        self.regularization = Config.ILC_REGULARIZATION if regularization is None else regularization
+        smoothing = Config.ILC_SMOOTHING_HZ if smoothing is None else smoothing
+        self.max_delay = Config.ILC_MAX_DELAY if max_delay is None else max_delay
+
+        # Padding to twice the length keeps the correction from wrapping around the end
+        self.nfft = _fft_length(2 * len(self.target))
+        self.freqs = np.fft.rfftfreq(self.nfft, 1 / self.sample_rate)
+        self.smoothing_bins = max(1, int(round(smoothing * self.nfft / self.sample_rate)))
+        self.q_filter = 1 / (1 + (self.freqs / self.cutoff) ** 8)
+        self.target_spectrum = np.fft.rfft(self.target, self.nfft)
+
+        self.command = self.target.copy()
+        self.cross = np.zeros(len(self.freqs), dtype=np.complex128)
+        self.power = np.zeros(len(self.freqs))
+        self.history = []
+
+    @property
+    def duration(self):
+        return len(self.target) / self.sample_rate
+
+    def align(self, times, positions, max_delay=None):
+        """
+        Cuts the response to the current command out of telemetry that
+        starts before the motion, on the target's sample grid. The start
+        latency is found against the target, so the error is measured in
+        the same frame every run.
+
+        :param max_delay: Longest delay in s searched for (default: self.max_delay).
+        :return: (response in mm, delay in s)
+        """
+        max_lag = int((self.max_delay if max_delay is None else max_delay) * self.sample_rate)
+        measured = resample(times, positions, self.sample_rate, len(self.target) + max_lag)
+        lag = estimate_delay(self.target, measured, max_lag)
+        return measured[lag:lag + len(self.target)], lag / self.sample_rate
+
+    def transfer_function(self):
+        """Estimated command-to-response transfer function at self.freqs."""
+        power = _smooth(self.power, self.smoothing_bins)
+        excited = power > MIN_EXCITATION * power.max() if power.any() else np.zeros(len(power), dtype=bool)
+        response = np.ones(len(power), dtype=np.complex128)
+        response[excited] = _smooth(self.cross, self.smoothing_bins)[excited] / power[excited]
+        return response, excited
+
+    def update(self, times, positions, max_delay=None):
+        """
+        Learns from the telemetry of one run of self.command and corrects it.
+
+        :param times: Telemetry times in s, starting before the motion.
+        :param positions: Telemetry positions in mm.
+        :param max_delay: Longest delay in s from the first sample to the motion (default: self.max_delay).
+        :return: Stats of the run: tracking error before correction, delay and gain at the target's peak frequency.
+        """
+        response, delay = self.align(times, positions, max_delay)
+        command_spectrum = np.fft.rfft(self.command, self.nfft)
+        response_spectrum = np.fft.rfft(response, self.nfft)
+        self.cross += response_spectrum * np.conj(command_spectrum)
+        self.power += np.abs(command_spectrum) ** 2
+
+        h, excited = self.transfer_function()
+        learning = self.gain * self.q_filter * np.conj(h) / (np.abs(h) ** 2 + self.regularization)
+        learning[~excited] = 0
+        correction = np.fft.irfft(learning * (self.target_spectrum - response_spectrum), self.nfft)
+        self.command = np.clip(self.command + correction[:len(self.target)],
+                               -Config.MAX_DISPLACEMENT, Config.MAX_DISPLACEMENT)
+
+        error = self.target - response
+        peak = int(np.argmax(np.abs(self.target_spectrum[1:]))) + 1
+        stats = {
+            "iteration": len(self.history) + 1,
+            "rms_error": float(np.sqrt(np.mean(error ** 2))),
+            "peak_error": float(np.abs(error).max()),
+            "delay": delay,
+            "frequency": float(self.freqs[peak]),
+            "gain": float(np.abs(h[peak])),
+            "phase": float(np.degrees(np.angle(h[peak]))),
+        }
+        self.history.append(stats)
+        return stats
+
+    def status(self):
+        return {
+            "duration": self.duration,
+            "sample_rate": self.sample_rate,
+            "iterations": len(self.history),
+            "history": list(self.history),
+        }
@@ -0,0 +1,120 @@
+# feasibility.py
+import numpy as np
+
+from config import Config
+from trajectory_planner import trapezoid_time
+from waveform_compiler import COMMAND_DTYPE, DIR_POSITIVE
+
+# Checks that make a batch unsafe to run, as opposed to late or hot
+HARD_CHECKS = ("acceleration", "speed", "travel")
+
+# Segments may take this much longer than planned before counting as late
+TIMING_TOLERANCE = 0.01
+
+
+def parse_commands(commands):
+    """
+    Converts "MOVE speed accel steps dir" strings into a COMMAND_DTYPE batch.
+
+    The whole list is parsed in one call. Planned durations are unknown, so
+    they are set to NaN and the timing check skips them.
+
+    :raises ValueError: If any command is not a four-argument MOVE.
+    """
+    batch = np.zeros(len(commands), dtype=COMMAND_DTYPE)
+    if not len(commands):
+        return batch
+    text = ' '.join(commands)
+    if text.count('MOVE') != len(commands):
+        raise ValueError("Only MOVE commands can be analysed")
+    fields = np.array(text.replace('MOVE', ' ').split(), dtype=np.float64)
+    if fields.size != 4 * len(commands):
+        raise ValueError("Every MOVE needs speed, accel, steps and direction")
+    fields = fields.reshape(-1, 4)
+    batch['speed'] = fields[:, 0]
+    batch['accel'] = fields[:, 1]
+    batch['steps'] = fields[:, 2]
+    batch['direction'] = fields[:, 3]
+    batch['duration'] = np.nan
+    batch['feasible'] = True
+    return batch
+
+
+def analyze(batch, start=0.0):
+    """
+    Checks a whole command batch against the table limits before upload.
+
+    Every check is a vectorised pass over the batch:
+      - acceleration: commanded acceleration above MAX_ACCELERATION
+      - speed: peak speed actually reached above MAX_SPEED
+      - travel: table position after the segment outside ±MAX_DISPLACEMENT
+      - timing: segment takes longer than its planned, non-zero duration
+      - thermal: RMS acceleration over the preceding THERMAL_WINDOW seconds
+        above MAX_RMS_ACCELERATION, a proxy for motor winding heat
+
+    :param batch: Structured array of COMMAND_DTYPE.
+    :param start: Table position in mm before the batch, 0 is centre.
+    :return: Report dict; `infeasible` maps each check to the indices of the
+             segments that fail it, `feasible` is False if any hard check fails.
+    """
+    steps_per_mm = float(Config.STEPS_PER_MM)
+    distance = batch['steps'].astype(np.float64)
+    speed = np.maximum(batch['speed'].astype(np.float64), 1)
+    accel = np.maximum(batch['accel'].astype(np.float64), 1)
+
+    # Short moves are triangular and never reach their slew speed
+    peak_speed = np.minimum(speed, np.sqrt(distance * accel))
+    seconds = trapezoid_time(distance, speed, accel)
+    accel_time = np.minimum(2 * peak_speed / accel, seconds)
+
+    signed = np.where(batch['direction'] == DIR_POSITIVE, distance, -distance)
+    position = start + np.cumsum(signed) / steps_per_mm
+
+    # A planned duration of 0 means as fast as possible, NaN means unknown
+    planned = batch['duration'].astype(np.float64)
+    late = (planned > 0) & (planned * (1 + TIMING_TOLERANCE) + 1e-4 < seconds)
+
+    # Windowed mean square acceleration from cumulative sums
+    window = float(Config.THERMAL_WINDOW)
+    elapsed = np.concatenate(([0.0], np.cumsum(seconds)))
+    heat = np.concatenate(([0.0], np.cumsum((accel / steps_per_mm) ** 2 * accel_time)))
+    first = np.searchsorted(elapsed, elapsed[1:] - window, 'left')
+    rms = np.sqrt((heat[1:] - heat[first]) / np.maximum(elapsed[1:] - elapsed[first], window))
+
+    infeasible = {
+        "acceleration": np.flatnonzero(accel / steps_per_mm > float(Config.MAX_ACCELERATION) * (1 + 1e-6)),
+        "speed": np.flatnonzero(peak_speed / steps_per_mm > float(Config.MAX_SPEED)),
+        "travel": np.flatnonzero(np.abs(position) > float(Config.MAX_DISPLACEMENT)),
+        "timing": np.flatnonzero(late),
+        "thermal": np.flatnonzero(rms > float(Config.MAX_RMS_ACCELERATION)),
+    }
+
+    total = float(elapsed[-1])
+    return {
+        "segments": len(batch),
+        "feasible": not any(len(infeasible[check]) for check in HARD_CHECKS),
+        "duration": total,
+        "peak_acceleration": float(accel.max() / steps_per_mm) if len(batch) else 0.0,
+        "peak_speed": float(peak_speed.max() / steps_per_mm) if len(batch) else 0.0,
+        "travel": {
+            "min": float(min(position.min(), start)) if len(batch) else start,
+            "max": float(max(position.max(), start)) if len(batch) else start,
+            "total": float(distance.sum() / steps_per_mm),
+        },
+        "thermal": {
+            "peak_rms_acceleration": float(rms.max()) if len(batch) else 0.0,
+            "duty": float(accel_time.sum() / total) if total > 0 else 0.0,
+        },
+        "infeasible": {check: indices.tolist() for check, indices in infeasible.items()},
+    }
+
+
+def summarize(report, limit=5):
+    """One-line description of the failed checks, naming the first few segments of each."""
+    problems = []
+    for check, indices in report["infeasible"].items():
+        if indices:
+            shown = ", ".join(str(i + 1) for i in indices[:limit])
+            more = f" and {len(indices) - limit} more" if len(indices) > limit else ""
+            problems.append(f"{check} exceeded by {len(indices)} segments ({shown}{more})")
+    return "; ".join(problems) if problems else "all checks passed"
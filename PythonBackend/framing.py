@@ -0,0 +1,135 @@
+# framing.py
+import struct
+from binascii import crc_hqx
+from collections import namedtuple
+
+# Frame layout (little endian):
+#   SYNC u8 | LEN u8 | SEQ u16 | TYPE u8 | PAYLOAD (LEN - 1 bytes) | CRC16 u16
+# LEN counts TYPE + PAYLOAD. The CRC is CRC-CCITT (init 0xFFFF) over LEN..PAYLOAD.
+SYNC = 0xA5
+HEADER = struct.Struct('<BBHB')
+CRC = struct.Struct('<H')
+MAX_PAYLOAD = 254
+
+# Host -> Pico record types
+TYPE_TEXT = 0x00
+TYPE_MOVE = 0x01
+
+# Pico -> host record types
+TYPE_ACK = 0x80
+TYPE_NACK = 0x81
+TYPE_EVENT = 0x82
+TYPE_TELEMETRY = 0x83  # payload: repeated (time_us u32, position_steps i32), see telemetry.py
+
+# MOVE record: speed (steps/s) u32 | accel (steps/s²) u32 | steps i32, negative when direction is 1
+MOVE = struct.Struct('<IIi')
+MOVE_FRAME_SIZE = HEADER.size + MOVE.size + CRC.size
+
+Frame = namedtuple('Frame', ['seq', 'type', 'payload'])
+
+
+def _crc(buf, start, end):
+    return crc_hqx(memoryview(buf)[start:end], 0xFFFF)
+
+
+def encode_frame(seq, frame_type, payload=b''):
+    """Encodes a single frame."""
+    if len(payload) > MAX_PAYLOAD:
+        raise ValueError(f"Payload of {len(payload)} bytes exceeds {MAX_PAYLOAD}")
+    frame = bytearray(HEADER.size + len(payload) + CRC.size)
+    HEADER.pack_into(frame, 0, SYNC, len(payload) + 1, seq & 0xFFFF, frame_type)
+    frame[HEADER.size:HEADER.size + len(payload)] = payload
+    CRC.pack_into(frame, len(frame) - CRC.size, _crc(frame, 1, len(frame) - CRC.size))
+    return bytes(frame)
+
+
+def encode_move(seq, speed, accel, steps, direction):
+    """Encodes a MOVE command as a fixed-size record."""
+    signed_steps = -steps if int(direction) else steps
+    return encode_frame(seq, TYPE_MOVE, MOVE.pack(int(speed), int(accel), int(signed_steps)))
+
+
+def encode_command(seq, command):
+    """
+    Encodes a text protocol command as a frame.
+
+    "MOVE speed accel steps dir" becomes a packed MOVE record, anything else
+    is carried verbatim in a TEXT record.
+    """
+    command = command.strip()
+    parts = command.split()
+    if len(parts) == 5 and parts[0].upper() == 'MOVE':
+        return encode_move(seq, *(int(p) for p in parts[1:]))
+    return encode_frame(seq, TYPE_TEXT, command.encode('utf-8'))
+
+
+def encode_moves(first_seq, speeds, accels, steps, directions):
+    """
+    Packs many MOVE records into one buffer for a single serial write.
+
+    :return: (buffer, list of sequence numbers used)
+    """
+    count = len(steps)
+    buf = bytearray(MOVE_FRAME_SIZE * count)
+    seqs = []
+    payload_end = HEADER.size + MOVE.size
+    for i in range(count):
+        offset = i * MOVE_FRAME_SIZE
+        seq = (first_seq + i) & 0xFFFF
+        signed_steps = -int(steps[i]) if int(directions[i]) else int(steps[i])
+        HEADER.pack_into(buf, offset, SYNC, MOVE.size + 1, seq, TYPE_MOVE)
+        MOVE.pack_into(buf, offset + HEADER.size, int(speeds[i]), int(accels[i]), signed_steps)
+        CRC.pack_into(buf, offset + payload_end, _crc(buf, offset + 1, offset + payload_end))
+        seqs.append(seq)
+    return bytes(buf), seqs
+
+
+def decode_move(payload):
+    """Returns (speed, accel, steps, direction) from a MOVE payload."""
+    speed, accel, signed_steps = MOVE.unpack(payload)
+    return speed, accel, abs(signed_steps), 1 if signed_steps < 0 else 0
+
+
+class FrameDecoder:
+    """
+    Incremental decoder for a stream of frames.
+
+    Bytes can be fed in arbitrarily sized chunks. Corrupt frames are dropped
+    and the decoder resynchronises on the next SYNC byte.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.crc_errors = 0
+
+    def feed(self, data):
+        """Adds received bytes and returns the list of complete frames."""
+        self.buffer += data
+        frames = []
+        buf = self.buffer
+        pos = 0
+        while True:
+            start = buf.find(SYNC, pos)
+            if start < 0:
+                pos = len(buf)
+                break
+            if len(buf) - start < HEADER.size:
+                pos = start
+                break
+            _, length, seq, frame_type = HEADER.unpack_from(buf, start)
+            end = start + HEADER.size - 1 + length
+            if length == 0 or end + CRC.size > len(buf):
+                if length == 0:
+                    pos = start + 1
+                    continue
+                pos = start
+                break
+            (crc,) = CRC.unpack_from(buf, end)
+            if crc != _crc(buf, start + 1, end):
+                self.crc_errors += 1
+                pos = start + 1
+                continue
+            frames.append(Frame(seq, frame_type, bytes(buf[start + HEADER.size:end])))
+            pos = end + CRC.size
+        del buf[:pos]
+        return frames
@@ -1,7 +1,137 @@
+import atexit
 import logging
+import logging.handlers
+import queue
+import struct
 import sys
+import threading
+import time
 from pathlib import Path
 
+from config import Config
+
+# Binary log record header: created (s since epoch), level, logger name length, message length
+_BINARY_RECORD = struct.Struct('<dBHI')
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the listener thread without ever waiting.
+
+    Unlike QueueHandler, the message is not formatted here: the record is
+    queued with its format string and arguments and only the listener
+    thread builds the text. When the queue is full the record is dropped
+    and counted instead of blocking the caller.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class HotPathLogger(logging.LoggerAdapter):
+    """
+    Logger for per-message logging that lets each distinct message through
+    at most `rate` times per second.
+
+    Messages are told apart by their format string, so "Decoded message: %s"
+    is limited as one message whatever its arguments. The check runs before
+    a LogRecord is created, so a suppressed call costs a dict lookup under
+    a lock shared by the serial threads. The first record let through after
+    a suppressed stretch says how many were skipped.
+    """
+
+    def __init__(self, logger, rate):
+        super().__init__(logger, {})
+        self.rate = rate
+        self._windows = {}  # format string -> [window start, passed, suppressed]
+        self._lock = threading.Lock()
+
+    def log(self, level, msg, *args, **kwargs):
+        if not self.logger.isEnabledFor(level):
+            return
+        now = time.monotonic()
+        suppressed = 0
+        with self._lock:
+            window = self._windows.get(msg)
+            if window is None or now - window[0] >= 1.0:
+                suppressed = window[2] if window else 0
+                self._windows[msg] = [now, 1, 0]
+            elif window[1] < self.rate:
+                window[1] += 1
+            else:
+                window[2] += 1
+                return
+        if suppressed:
+            msg = f"{msg} (%d similar suppressed)"
+            args = args + (suppressed,)
+        self.logger.log(level, msg, *args, **kwargs)
+
+
+class BinaryLogHandler(logging.Handler):
+    """
+    Appends records to a compact binary file instead of formatted text.
+
+    Each record is a fixed header (time, level, name and message lengths)
+    followed by the UTF-8 logger name and message, so no timestamp or
+    layout formatting is done. Read the file back with read_binary_log().
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.stream = open(path, 'ab', buffering=1 << 16)
+
+    def emit(self, record):
+        try:
+            name = record.name.encode('utf-8')
+            message = record.getMessage().encode('utf-8')
+            self.stream.write(_BINARY_RECORD.pack(record.created, record.levelno, len(name), len(message)))
+            self.stream.write(name)
+            self.stream.write(message)
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        with self.lock:
+            if not self.stream.closed:
+                self.stream.flush()
+
+    def close(self):
+        with self.lock:
+            if not self.stream.closed:
+                self.stream.close()
+        super().close()
+
+
+def read_binary_log(path):
+    """
+    Reads a file written by BinaryLogHandler.
+
+    :return: Generator of (created, level, logger name, message) tuples.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    offset = 0
+    while offset + _BINARY_RECORD.size <= len(data):
+        created, level, name_length, message_length = _BINARY_RECORD.unpack_from(data, offset)
+        offset += _BINARY_RECORD.size
+        name = data[offset:offset + name_length].decode('utf-8')
+        offset += name_length
+        message = data[offset:offset + message_length].decode('utf-8', errors='replace')
+        offset += message_length
+        yield created, level, name, message
+
 
 class Logger:
     _instance = None
@@ -13,13 +143,16 @@ class Logger:
             cls._instance._initialized = False
         return cls._instance
 
-    def __init__(self, log_file='app.log', log_level=logging.DEBUG, console_level=logging.INFO):
+    def __init__(self, log_file='app.log', log_level=logging.DEBUG, console_level=logging.INFO,
+                 async_mode=None, binary_file=None):
         """
         Initialize the logger.
 
         :param log_file: File to write logs to (default: 'app.log').
         :param log_level: Logging level for the file (default: logging.DEBUG).
         :param console_level: Logging level for the console (default: logging.INFO).
+        :param async_mode: Run the handlers on a background thread (default: Config.LOG_ASYNC).
+        :param binary_file: Also write a binary log to this file (default: Config.LOG_BINARY_FILE).
         """
         if self._initialized:
             return
@@ -27,6 +160,10 @@ class Logger:
         self.log_file = log_file
         self.log_level = log_level
         self.console_level = console_level
+        self.async_mode = Config.LOG_ASYNC if async_mode is None else async_mode
+        self.binary_file = Config.LOG_BINARY_FILE if binary_file is None else binary_file
+        self.queue_handler = None
+        self.listener = None
         self._setup_logger()
         self._initialized = True
 
@@ -57,13 +194,51 @@ class Logger:
         )
         file_handler.setLevel(self.log_level)
         file_handler.setFormatter(formatter)
-        root_logger.addHandler(file_handler)
 
         # Console handler
         console_handler = logging.StreamHandler(sys.stdout)
         console_handler.setLevel(self.console_level)
         console_handler.setFormatter(formatter)
-        root_logger.addHandler(console_handler)
+
+        handlers = [file_handler, console_handler]
+        if self.binary_file:
+            binary_handler = BinaryLogHandler(self.binary_file)
+            binary_handler.setLevel(self.log_level)
+            handlers.append(binary_handler)
+
+        if not self.async_mode:
+            for handler in handlers:
+                root_logger.addHandler(handler)
+            return
+
+        # Callers only queue the record; formatting and I/O happen on the listener thread
+        self.queue_handler = NonBlockingQueueHandler(queue.Queue(Config.LOG_QUEUE_SIZE))
+        root_logger.addHandler(self.queue_handler)
+        self.listener = logging.handlers.QueueListener(
+            self.queue_handler.queue, *handlers, respect_handler_level=True
+        )
+        self.listener.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Writes out every queued record and stops the listener thread."""
+        listener, self.listener = self.listener, None
+        if listener is None:
+            return
+        # Nothing may be queued once the listener is gone
+        logging.getLogger().removeHandler(self.queue_handler)
+        listener.stop()
+        for handler in listener.handlers:
+            if self.queue_handler.dropped:
+                handler.handle(logging.makeLogRecord({
+                    "name": __name__, "levelno": logging.WARNING, "levelname": "WARNING",
+                    "msg": f"Log queue full, dropped {self.queue_handler.dropped} records",
+                }))
+            handler.close()
+
+    def dropped(self):
+        """Number of records dropped because the log queue was full."""
+        return self.queue_handler.dropped if self.queue_handler else 0
 
     @staticmethod
     def get_logger(name=None):
@@ -73,4 +248,18 @@ class Logger:
         :param name: Name of the logger (default: None for root logger).
         :return: Logger instance.
         """
-        return logging.getLogger(name)
\ No newline at end of file
+        return logging.getLogger(name)
+
+    @staticmethod
+    def get_hot_path_logger(name, rate=None):
+        """
+        Get a rate-limited logger for per-message logging on the serial threads.
+
+        Pass arguments instead of f-strings, e.g. log.debug("Decoded: %s", line),
+        so nothing is formatted for records that are filtered or dropped.
+
+        :param name: Name of the module; the logger is its '.hot' child.
+        :param rate: Records per second let through per message (default: Config.LOG_HOT_PATH_RATE).
+        :return: HotPathLogger instance.
+        """
+        return HotPathLogger(logging.getLogger(f"{name}.hot"), Config.LOG_HOT_PATH_RATE if rate is None else rate)
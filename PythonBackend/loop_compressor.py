@@ -0,0 +1,150 @@
+# loop_compressor.py
+"""
+Loop compression of command batches.
+
+A sine compiles into the same two MOVE segments for every cycle, and a
+frequency whose period is not a whole number of samples into the same
+few segments every few cycles. compress() finds blocks of up to
+`max_period` segments that repeat back to back and sends one copy of
+each behind a REPEAT primitive:
+
+    REPEAT count length    the next `length` commands run `count` times
+
+which generalises MANUAL fwd bwd to any block and a finite count.
+Firmware that answers LOOPS runs the loops itself; for any other the
+host sends the batch as is.
+"""
+import numpy as np
+
+from config import Config
+from waveform_compiler import to_commands
+
+FIELDS = ('speed', 'accel', 'steps', 'direction')
+
+# A loop costs its REPEAT line
+REPEAT_COST = 1
+
+
+class LoopProgram:
+    """
+    A compressed batch. `rows` are the moves sent, in order, and each
+    (offset, length, count) in `loops` makes rows[offset:offset + length]
+    run `count` times.
+    """
+
+    def __init__(self, rows, loops, move_count):
+        self.rows = rows
+        self.loops = loops
+        self.move_count = move_count
+
+    @property
+    def sent_count(self):
+        """Commands sent, REPEAT lines included."""
+        return len(self.rows) + len(self.loops)
+
+    @property
+    def ratio(self):
+        """Moves run per command sent."""
+        return self.move_count / self.sent_count if self.sent_count else 1.0
+
+    def commands(self):
+        """The program as "REPEAT ..." and "MOVE ..." strings."""
+        moves = to_commands(self.rows)
+        commands = []
+        previous = 0
+        for offset, length, count in self.loops:
+            commands.extend(moves[previous:offset])
+            commands.append(f"REPEAT {count} {length}")
+            previous = offset
+        commands.extend(moves[previous:])
+        return commands
+
+    def expand(self):
+        """The batch the firmware runs, loops unrolled."""
+        pieces = []
+        previous = 0
+        for offset, length, count in self.loops:
+            pieces.append(self.rows[previous:offset])
+            pieces.append(np.tile(self.rows[offset:offset + length], count))
+            previous = offset + length
+        pieces.append(self.rows[previous:])
+        return np.concatenate(pieces)
+
+    def runs(self, batch):
+        """Whether the program runs exactly the moves of `batch`."""
+        expanded = self.expand()
+        return len(expanded) == len(batch) and all(np.array_equal(expanded[name], batch[name]) for name in FIELDS)
+
+    def stats(self):
+        return {"moves": self.move_count, "sent": self.sent_count, "loops": len(self.loops),
+                "ratio": round(self.ratio, 3)}
+
+
+def _repeats(batch, period):
+    """Whether each segment runs identically to the one `period` later."""
+    same = np.ones(len(batch) - period, dtype=bool)
+    for name in FIELDS:
+        column = batch[name]
+        same &= column[:-period] == column[period:]
+    return same
+
+
+def _run_lengths(matches):
+    """Number of consecutive True values starting at each index."""
+    index = np.arange(len(matches))
+    # Index of the first False at or after each position, len(matches) when there is none
+    next_end = np.minimum.accumulate(np.where(matches, len(matches), index)[::-1])[::-1]
+    return next_end - index
+
+
+def compress(batch, max_period=None):
+    """
+    Replaces back-to-back repetitions of blocks of segments with loops.
+
+    For every block length p up to max_period, comparing each segment with
+    the one p later gives, at each start, how many copies of the block
+    follow. The loop saving the most commands at each start is kept and
+    the batch is then walked once, jumping over whole loops and literal
+    stretches, so the Python work grows with the number of loops rather
+    than segments.
+
+    :param batch: Structured array of COMMAND_DTYPE.
+    :param max_period: Longest block looped (default: Config.LOOP_MAX_PERIOD).
+    :return: LoopProgram.
+    """
+    max_period = max_period or Config.LOOP_MAX_PERIOD
+    n = len(batch)
+    best_saving = np.zeros(n, dtype=np.int64)
+    best_period = np.zeros(n, dtype=np.int64)
+    best_count = np.zeros(n, dtype=np.int64)
+    for period in range(1, min(max_period, n // 2) + 1):
+        runs = _run_lengths(_repeats(batch, period))
+        count = (runs + period) // period
+        saving = (count - 1) * period - REPEAT_COST
+        better = saving > best_saving[:n - period]
+        best_saving[:n - period][better] = saving[better]
+        best_period[:n - period][better] = period
+        best_count[:n - period][better] = count[better]
+
+    starts = np.flatnonzero(best_saving > 0)
+    pieces = []
+    loops = []
+    sent = 0
+    i = 0
+    while i < n:
+        k = np.searchsorted(starts, i)
+        if k == len(starts):
+            pieces.append(batch[i:])
+            break
+        start = int(starts[k])
+        if start > i:
+            pieces.append(batch[i:start])
+            sent += start - i
+        period, count = int(best_period[start]), int(best_count[start])
+        loops.append((sent, period, count))
+        pieces.append(batch[start:start + period])
+        sent += period
+        i = start + period * count
+
+    rows = np.concatenate(pieces) if pieces else batch[:0]
+    return LoopProgram(rows, loops, n)
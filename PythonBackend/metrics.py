@@ -0,0 +1,269 @@
+# metrics.py
+"""
+Hot-path instrumentation exposed in the Prometheus text format.
+
+Latencies are kept as summaries: every observation goes into a fixed-size
+ring per label set, and p50/p99 are computed over the ring when /metrics is
+scraped, so observing costs a lock and an array store. SamplingProfiler
+is an opt-in statistical profiler for finding where the time goes once a
+metric shows that it does.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter as _StackCounter
+from contextlib import contextmanager
+
+import numpy as np
+
+from config import Config
+
+QUANTILES = (0.5, 0.99)
+
+# Every metric in creation order, rendered by render()
+REGISTRY = []
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value != value:
+        return 'NaN'
+    return repr(float(value))
+
+
+class _Series:
+    __slots__ = ('ring', 'count', 'sum')
+
+    def __init__(self, window):
+        self.ring = np.zeros(window)
+        self.count = 0
+        self.sum = 0.0
+
+
+class Summary:
+    """Latency summary with p50/p99 over the last `window` observations of each label set."""
+
+    def __init__(self, name, documentation, labelnames=(), window=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.window = window or Config.METRICS_WINDOW
+        self._series = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = _Series(self.window)
+            series.ring[series.count % self.window] = value
+            series.count += 1
+            series.sum += value
+
+    @contextmanager
+    def time(self, *labels):
+        """Observes the time spent in a `with` block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def quantiles(self, *labels):
+        """{quantile: value} over the recent observations, NaN before the first one."""
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None or series.count == 0:
+                return {q: float('nan') for q in QUANTILES}
+            recent = series.ring[:min(series.count, self.window)].copy()
+        return dict(zip(QUANTILES, np.quantile(recent, QUANTILES).tolist()))
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} summary"]
+        with self._lock:
+            series = {labels: (s.ring[:min(s.count, self.window)].copy(), s.count, s.sum)
+                      for labels, s in self._series.items()}
+        for labels, (recent, count, total) in sorted(series.items()):
+            values = np.quantile(recent, QUANTILES).tolist() if len(recent) else [float('nan')] * len(QUANTILES)
+            for q, value in zip(QUANTILES, values):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labels, ('quantile', q))} "
+                             f"{_format_value(value)}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Counter:
+    """Monotonic count per label set."""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount=1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        lines += [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+                  for labels, value in values]
+        return lines
+
+
+class Callback:
+    """
+    Metric read from elsewhere when scraped, e.g. reader byte totals.
+
+    :param fn: Returns a number, or a list of (label values tuple, number).
+    :param kind: Prometheus type, 'gauge' or 'counter'.
+    """
+
+    def __init__(self, name, documentation, fn, labelnames=(), kind='gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+        REGISTRY.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        values = self.fn()
+        if not isinstance(values, list):
+            values = [((), values)]
+        lines += [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+                  for labels, value in values]
+        return lines
+
+
+def render():
+    """Every registered metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        try:
+            lines += metric.render()
+        except Exception:
+            # A failing callback must not take the other metrics down with it
+            continue
+    return '\n'.join(lines) + '\n'
+
+
+# Serial path, from a command being queued to its reply
+QUEUE_WAIT = Summary('pico_command_queue_wait_seconds', 'Time commands wait in the transport queue before being written.')
+SERIAL_WRITE = Summary('pico_serial_write_seconds', 'Time spent in each serial port write.')
+SERIAL_BYTES = Counter('pico_serial_written_bytes_total', 'Bytes written to the serial port.')
+ROUND_TRIP = Summary('pico_command_round_trip_seconds', 'Time from a command being written to its reply arriving.')
+SEND = Summary('pico_send_seconds', 'Time callers of PicoLink.send wait for a reply, queueing included.')
+REPLIES = Counter('pico_replies_total', 'Replies received from the Pico.', ('result',))
+TIMEOUTS = Counter('pico_command_timeouts_total', 'Commands that got no reply in time.')
+LISTENER_DISPATCH = Summary('pico_listener_dispatch_seconds', 'Listener thread time spent handling each read from the port.')
+
+# Uploads and clients
+UPLOAD = Summary('movement_upload_seconds', 'Time to send a movement batch to the Pico.', ('mode',))
+UPLOAD_COMMANDS = Counter('movement_upload_commands_total', 'Movement commands sent to the Pico.', ('mode',))
+LOOP_COMPRESSION = Summary('movement_loop_compression_ratio', 'Moves per command sent when batches are loop compressed.')
+SSE_LAG = Summary('sse_delivery_lag_seconds', 'Time from an event being published to a client stream picking it up.')
+HTTP_REQUEST = Summary('http_request_seconds', 'Time spent in Flask routes.', ('method', 'route', 'status'))
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler over every Python thread.
+
+    While running, a background thread snapshots all thread stacks every
+    `interval` seconds with sys._current_frames() and counts each distinct
+    stack. The counts come out in the collapsed format flame graph tools
+    read ("thread;file:function;... count"). The profiled code is not
+    touched, so the cost is one stack walk per thread per sample.
+    """
+
+    def __init__(self):
+        self.interval = Config.PROFILER_INTERVAL
+        self.samples = 0
+        self._stacks = _StackCounter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.started = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval=None):
+        """Starts sampling, keeping the stacks collected so far."""
+        if self.running:
+            return
+        self.interval = interval or Config.PROFILER_INTERVAL
+        self._stop.clear()
+        self.started = time.time()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+        self._thread = None
+
+    def reset(self):
+        with self._lock:
+            self._stacks.clear()
+            self.samples = 0
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks = []
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                stacks.append(';'.join(reversed(stack)))
+            with self._lock:
+                self._stacks.update(stacks)
+                self.samples += 1
+
+    def collapsed(self, limit=None):
+        """Sampled stacks in collapsed format, most frequent first."""
+        with self._lock:
+            stacks = self._stacks.most_common(limit)
+        return '\n'.join(f"{stack} {count}" for stack, count in stacks) + '\n'
+
+    def status(self):
+        with self._lock:
+            distinct = len(self._stacks)
+        return {"running": self.running, "interval": self.interval, "samples": self.samples,
+                "stacks": distinct, "started": self.started}
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,299 @@
+# pico_emulator.py
+"""
+Software stand-in for the Quake_Drive firmware.
+
+Exposes a pseudo-terminal that PicoLink can open like the real Pico's USB
+serial port and answers the OK/CONF/MANUAL/BATCH_SIZE/MOVE/STOP/RESET
+protocol, plus PROTO BIN framing and, with a loop body set, LOOPS/REPEAT,
+with configurable latency, buffer size and injected faults.
+
+Usage:
+    python pico_emulator.py [--latency 0.0005] [--buffer-size 10000] [--loop-body 16]
+    COM_PORT=<printed port> python app.py
+"""
+import argparse
+import heapq
+import os
+import random
+import select
+import threading
+import time
+import tty
+
+import framing
+
+
+class PicoEmulator:
+    def __init__(self, latency=0.0, buffer_size=10000, drop_rate=0.0, nack_rate=0.0,
+                 limit_after=None, binary=True, telemetry_hz=0, seed=None, loop_body=0, silent=()):
+        """
+        :param latency: Seconds the emulated firmware spends on each command.
+                        Commands are processed one after another like the real loop.
+        :param buffer_size: MOVE commands the batch buffer holds before answering ERR FULL.
+        :param drop_rate: Probability of never answering a command.
+        :param nack_rate: Probability of answering ERR CRC to a MOVE.
+        :param limit_after: Report LIMIT TRIGGERED after this many MOVE commands.
+        :param binary: Accept PROTO BIN and switch to framed replies.
+        :param telemetry_hz: Emit TLM position samples at this rate, 0 to disable.
+        :param seed: Seed for fault injection.
+        :param loop_body: Longest block a REPEAT may loop, answered to LOOPS; 0 for firmware without loops.
+        :param silent: Commands never answered, like firmware that predates them (e.g. "PROFILES").
+        """
+        self.latency = latency
+        self.buffer_size = buffer_size
+        self.drop_rate = drop_rate
+        self.nack_rate = nack_rate
+        self.limit_after = limit_after
+        self.supports_binary = binary
+        self.telemetry_hz = telemetry_hz
+        self.random = random.Random(seed)
+        self.loop_body = loop_body
+        self.silent = {command.upper() for command in silent}
+
+        self.binary = False
+        self.batch = []
+        self.moves_received = 0
+        self.position = 0
+        self.commands = []  # (arrival time, command) of every command received
+        self.stop_received_at = None
+        self.batch_expected = 0
+        self.batch_started_at = None  # when the last command of the announced batch arrived
+        self._loop = None  # [moves of the body still to come, count, displacement of one pass]
+        self._outbox = []
+        self._outbox_cond = threading.Condition()
+        self._busy_until = 0.0
+        self._order = 0
+        self._running = False
+        self._announcing = False
+        self._decoder = None
+        self._pending = b''
+        self._master = None
+        self.port = None
+
+    def start(self):
+        """Creates the pseudo-terminal and starts the emulator threads; returns the port path."""
+        master, slave = os.openpty()
+        tty.setraw(master)
+        tty.setraw(slave)
+        self._master = master
+        self._slave = slave
+        self.port = os.ttyname(slave)
+        self._running = True
+        for target in (self._read_loop, self._write_loop) + ((self._telemetry_loop,) if self.telemetry_hz else ()):
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+        return self.port
+
+    def close(self):
+        self._running = False
+        with self._outbox_cond:
+            self._outbox_cond.notify()
+        for fd in (self._master, self._slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def _schedule(self, data, immediate=False):
+        """Queues bytes for the host, after the emulated processing time unless immediate."""
+        with self._outbox_cond:
+            now = time.monotonic()
+            if immediate:
+                due = now
+            else:
+                self._busy_until = max(now, self._busy_until) + self.latency
+                due = self._busy_until
+            self._order += 1
+            heapq.heappush(self._outbox, (due, self._order, data))
+            self._outbox_cond.notify()
+
+    def _write_loop(self):
+        while self._running:
+            with self._outbox_cond:
+                while self._running and not self._outbox:
+                    self._outbox_cond.wait()
+                if not self._running:
+                    return
+                due, _, data = self._outbox[0]
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self._outbox_cond.wait(delay)
+                    continue
+                heapq.heappop(self._outbox)
+            try:
+                os.write(self._master, data)
+            except OSError:
+                return
+
+    def _reply(self, text, seq=None, immediate=False):
+        if self.binary:
+            if text == 'OK':
+                data = framing.encode_frame(seq or 0, framing.TYPE_ACK)
+            elif text.startswith('ERR'):
+                data = framing.encode_frame(seq or 0, framing.TYPE_NACK, text[3:].strip().encode('utf-8'))
+            else:
+                data = framing.encode_frame(seq or 0, framing.TYPE_EVENT, text.encode('utf-8'))
+        else:
+            data = f"{text}\n".encode('utf-8')
+        self._schedule(data, immediate)
+
+    def reboot(self):
+        """Clears all device state and announces OK again, like a power cycle."""
+        with self._outbox_cond:
+            self._outbox.clear()
+            self._busy_until = 0.0
+        self.binary = False
+        self.batch.clear()
+        self.position = 0
+        self.stop_received_at = None
+        self.batch_expected = 0
+        self.batch_started_at = None
+        self._loop = None
+        self._decoder = framing.FrameDecoder()
+        self._pending = b''
+        self._announcing = True
+
+    def _read_loop(self):
+        self.reboot()
+        while self._running:
+            try:
+                if not select.select([self._master], [], [], 0.05)[0]:
+                    # The host flushes its input when it opens the port, so keep announcing until it talks
+                    if self._announcing:
+                        os.write(self._master, b'OK\n')
+                    continue
+                data = os.read(self._master, 4096)
+            except (OSError, ValueError):
+                return
+            self._announcing = False
+            if self.binary:
+                for frame in self._decoder.feed(data):
+                    self._handle_frame(frame)
+                continue
+            self._pending += data
+            while b'\n' in self._pending:
+                line, self._pending = self._pending.split(b'\n', 1)
+                text = line.decode('utf-8', errors='replace').strip()
+                if text:
+                    self._handle(text)
+                if self.binary:
+                    for frame in self._decoder.feed(self._pending):
+                        self._handle_frame(frame)
+                    self._pending = b''
+                    break
+
+    def _handle_frame(self, frame):
+        if frame.type == framing.TYPE_MOVE:
+            speed, accel, steps, direction = framing.decode_move(frame.payload)
+            self._handle(f"MOVE {speed} {accel} {steps} {direction}", frame.seq)
+        elif frame.type == framing.TYPE_TEXT:
+            self._handle(frame.payload.decode('utf-8', errors='replace'), frame.seq)
+
+    def _handle(self, text, seq=None):
+        now = time.monotonic()
+        self.commands.append((now, text))
+        parts = text.upper().split()
+        command = parts[0]
+
+        if command == 'STOP':
+            self.stop_received_at = now
+            self.batch.clear()
+            # The firmware checks for STOP between steps, ahead of queued work
+            self._reply('OK', seq, immediate=True)
+            return
+        if command in self.silent or self.random.random() < self.drop_rate:
+            return
+
+        if command == 'MOVE':
+            self.moves_received += 1
+            if self.random.random() < self.nack_rate:
+                self._reply('ERR CRC', seq)
+            elif len(self.batch) >= self.buffer_size:
+                self._reply('ERR FULL', seq)
+            else:
+                self.batch.append(text)
+                steps, direction = int(parts[3]), int(parts[4])
+                self.position += steps if direction else -steps
+                if self._loop is not None:
+                    self._loop[0] -= 1
+                    self._loop[2] += steps if direction else -steps
+                    if self._loop[0] == 0:
+                        # The body has run once, the other passes end up this much further on
+                        self.position += (self._loop[1] - 1) * self._loop[2]
+                        self._loop = None
+                if len(self.batch) == self.batch_expected:
+                    self.batch_started_at = now
+                self._reply('OK', seq)
+            if self.limit_after is not None and self.moves_received == self.limit_after:
+                self._reply('LIMIT TRIGGERED')
+        elif command == 'REPEAT' and self.loop_body:
+            try:
+                count, length = int(parts[1]), int(parts[2])
+            except (IndexError, ValueError):
+                count = length = 0
+            if count < 1 or not 1 <= length <= self.loop_body or self._loop is not None:
+                self._reply('ERR LOOP', seq)
+            elif len(self.batch) >= self.buffer_size:
+                self._reply('ERR FULL', seq)
+            else:
+                self.batch.append(text)
+                self._loop = [length, count, 0]
+                self._reply('OK', seq)
+        elif command == 'LOOPS' and self.loop_body:
+            self._reply(f'LOOPS {self.loop_body}', seq)
+        elif command == 'BATCH_SIZE':
+            self.batch.clear()
+            self._loop = None
+            self.batch_expected = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 0
+            self.batch_started_at = None
+            self._reply('OK', seq)
+        elif command == 'PROTO' and parts[1:] == ['BIN']:
+            if self.supports_binary:
+                self._reply('OK', seq)
+                self.binary = True
+            else:
+                self._reply('UNKNOWN', seq)
+        elif command == 'RESET':
+            self.position = 0
+            self.batch.clear()
+            self._loop = None
+            self._reply('OK', seq)
+        elif command in ('CONF', 'MANUAL'):
+            self._reply('OK', seq)
+        else:
+            self._reply('UNKNOWN', seq)
+
+    def _telemetry_loop(self):
+        interval = 1 / self.telemetry_hz
+        start = time.monotonic()
+        while self._running:
+            time.sleep(interval)
+            time_us = int((time.monotonic() - start) * 1e6) & 0xFFFFFFFF
+            if self.binary:
+                payload = time_us.to_bytes(4, 'little') + self.position.to_bytes(4, 'little', signed=True)
+                self._schedule(framing.encode_frame(0, framing.TYPE_TELEMETRY, payload), immediate=True)
+            else:
+                self._schedule(f"TLM {time_us} {self.position}\n".encode('utf-8'), immediate=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Emulated Pico on a pseudo-terminal")
+    parser.add_argument('--latency', type=float, default=0.0005)
+    parser.add_argument('--buffer-size', type=int, default=10000)
+    parser.add_argument('--drop-rate', type=float, default=0.0)
+    parser.add_argument('--nack-rate', type=float, default=0.0)
+    parser.add_argument('--limit-after', type=int, default=None)
+    parser.add_argument('--text-only', action='store_true', help="Refuse PROTO BIN")
+    parser.add_argument('--telemetry-hz', type=float, default=0)
+    parser.add_argument('--loop-body', type=int, default=0, help="Accept REPEAT loops of up to this many commands")
+    args = parser.parse_args()
+
+    emulator = PicoEmulator(args.latency, args.buffer_size, args.drop_rate, args.nack_rate,
+                            args.limit_after, not args.text_only, args.telemetry_hz, loop_body=args.loop_body)
+    print(f"Emulated Pico listening on {emulator.start()}", flush=True)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        emulator.close()
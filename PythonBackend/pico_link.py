@@ -3,41 +3,137 @@ import threading
 import queue
 import serial
 import time
-import serial.tools.list_ports
+from collections import OrderedDict
+from concurrent.futures import Future, CancelledError, TimeoutError as FutureTimeout
+import numpy as np
+import framing
+import metrics
+import waveform_compiler
+from serial_reader import SerialReader
+from serial_transport import SerialTransport, command_priority, PRIORITY_BULK
 from logger import Logger
 from config import Config
 
 # Initialize the logger
 logger = Logger()
 log = logger.get_logger(__name__)
+# Per-message logging from the listener and upload threads, rate limited and formatted off-thread
+hot_log = logger.get_hot_path_logger(__name__)
+
+# Lines the Pico sends on its own rather than in reply to a command, matched on the first word
+EVENTS = ("LIMIT", "FREE", "UNDERRUN")
+# Streaming flow-control reports, only delivered to event listeners
+FLOW_EVENTS = ("FREE", "UNDERRUN")
+# Seconds a text protocol reply may arrive after its command timed out and still be matched to it
+LATE_REPLY = 2.0
+# Lines kept for open() to read; only the handshake reads them, so older ones are dropped
+EVENT_QUEUE_SIZE = 64
+
+
+class LimitTriggered(Exception):
+    """Set on commands still awaiting a reply when a limit switch fires."""
+
+
+def describe_command(commands, index):
+    """Text of commands[index], for log and error messages; also formats a COMMAND_DTYPE row."""
+    if isinstance(commands, np.ndarray):
+        return waveform_compiler.to_commands(commands[index:index + 1])[0]
+    return commands[index]
+
 
 class PicoLink:
-    def __init__(self, message_queue=None):
+    def __init__(self, message_queue=None, port=None, on_progress=None):
+        """
+        Opens the serial port and starts listening; open() then waits for the Pico.
+
+        :param message_queue: Queue for status and limit events.
+        :param port: Serial port (default: Config.COM_PORT).
+        :param on_progress: Called as `on_progress(stage, message)` as the connection is set up.
+        """
         self.serial = None
         self.connected = False
-        self.picoPort = Config.COM_PORT
+        self.picoPort = port or Config.COM_PORT
         self.baudRate = Config.BAUD_RATE
         self.ack = Config.ACK
-        self.controllerQueue = queue.Queue()
+        self.eventQueue = queue.Queue(EVENT_QUEUE_SIZE)
         self.message_queue = message_queue
+        self.binary = False
+        self._negotiating = False
+        self._decoder = framing.FrameDecoder()
+        self._seq = 0
+        self._pending = OrderedDict()
+        self._pending_lock = threading.Lock()
+        self._upload_generation = 0
+        self.transport = None
+        self._event_listeners = []
+        self.telemetry = None
+        self.recorder = None
+        self.reader = None
+        self._closed = False
+        self._closing = threading.Event()
+        self._listener = None
+        self.on_progress = on_progress
         self.configureController()
 
-    def open(self):
-        """Opens the connection to the microcontroller."""
-        start = time.time()
-        log.info(f"Waiting for '{self.ack}' from Pico on port {self.picoPort} ...")
-        while time.time() - start <= Config.CONNECTION_TIMEOUT:
-            if not self.controllerQueue.empty():
-                if self.controllerQueue.get() == self.ack:
-                    log.info("Connection established")
-                    self.send("CONF")
-                    self.connected = True
-                    return
-        log.error(f"*** Unable to establish connection within {Config.CONNECTION_TIMEOUT} seconds")
+    def _progress(self, stage, message):
+        log.info(message)
+        if self.on_progress:
+            self.on_progress(stage, message)
+
+    def open(self, timeout=None):
+        """
+        Waits for the microcontroller's OK, then configures it.
+
+        The wait blocks on the event queue the listener thread fills, so it
+        uses no CPU and ends as soon as the OK arrives, the timeout expires
+        or close() is called.
+
+        :param timeout: Seconds to wait for the OK (default: Config.CONNECTION_TIMEOUT).
+        :return: True if connected.
+        """
+        if self.serial is None or not self.serial.is_open:
+            self._progress('failed', f"Serial port {self.picoPort} is not open")
+            return False
+        timeout = float(Config.CONNECTION_TIMEOUT if timeout is None else timeout)
+        deadline = time.monotonic() + timeout
+        self._progress('waiting', f"Waiting for '{self.ack}' from Pico on port {self.picoPort} ...")
+        while (remaining := deadline - time.monotonic()) > 0:
+            try:
+                message = self.eventQueue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if self._closed:
+                return False
+            if message == self.ack:
+                log.info("Connection established")
+                self._handshake()
+                return True
+        log.error(f"*** Unable to establish connection within {timeout:g} seconds")
+        self._progress('failed', f"No response from Pico on port {self.picoPort} within {timeout:g} s")
+        return False
+
+    def _handshake(self):
+        """Configures a Pico that has announced itself and picks the protocol."""
+        self._progress('configuring', "Configuring controller")
+        self.send("CONF")
+        self.connected = True
+        if Config.BINARY_PROTOCOL:
+            self._progress('negotiating', "Negotiating binary protocol")
+            self.negotiate_binary()
 
     def close(self):
         """Closes the serial connection."""
+        self._closed = True
+        self._closing.set()
+        # Wake open() if it is still waiting for the Pico
+        self._queue_event(None)
         if self.serial and self.serial.is_open:
+            # Let the listener leave its read before the port goes away under it
+            self.serial.cancel_read()
+            if self._listener and self._listener is not threading.current_thread():
+                self._listener.join(timeout=2)
+            if self.transport:
+                self.transport.close()
             self.serial.close()
             self.connected = False
             log.info("Serial connection closed.")
@@ -57,81 +153,569 @@ class PicoLink:
                 self.message_queue.put(('error', error_msg))
 
     def listenToController(self):
-        message = b''
+        reader = self.reader
         while True:
             try:
+                if self._closed:
+                    break
                 if not self.serial or not self.serial.is_open:
+                    self._fail_pending(serial.SerialException("Serial connection lost"))
                     self.update_connection_status(False, "Serial connection lost")
                     break
 
-                incoming = self.serial.read()
-                if not incoming:  # Timeout occurred
+                if not reader.fill():  # Timeout occurred
                     continue
 
-                if incoming == b'\n':
-                    decoded_message = message.decode('utf-8').strip().upper()
-                    log.info(f"Decoded message: '{decoded_message}'")
+                dispatch_start = time.perf_counter()
+                if self.binary:
+                    self._dispatch_frames(reader.drain())
+                    metrics.LISTENER_DISPATCH.observe(time.perf_counter() - dispatch_start)
+                    continue
 
-                    if decoded_message == "LIMIT TRIGGERED":
-                        log.info("Limit trigger detected, sending to queue")
-                        if self.message_queue:
-                            self.message_queue.put(('limit_triggered', 'Limit switch triggered'))
-                            log.info("Limit message sent to queue")
-                    self.controllerQueue.put(decoded_message)
-                    message = b''
-                elif incoming not in [b'', b'\r']:
-                    message += incoming
+                line = reader.next_line()
+                while line is not None:
+                    self._dispatch_line(line)
+                    if self.binary:
+                        # Anything after the negotiation ACK is already framed
+                        self._dispatch_frames(reader.drain())
+                        break
+                    line = reader.next_line()
+                metrics.LISTENER_DISPATCH.observe(time.perf_counter() - dispatch_start)
 
-            except serial.SerialException as e:
+            except (serial.SerialException, OSError) as e:
+                if self._closed:
+                    break
                 error_msg = f"Serial connection issue: {e}"
                 log.error(error_msg)  # Log the error
+                self._fail_pending(e)
                 self.update_connection_status(False, error_msg)
                 self.reconnect()
                 break
 
+    def _dispatch_line(self, line):
+        """Handles one text protocol line; a line that cannot be handled is logged and skipped."""
+        try:
+            if line.startswith(b'TLM '):
+                # High-rate telemetry skips decoding and logging
+                if self.telemetry is not None and not self.telemetry.ingest_line(line):
+                    hot_log.warning("Skipping malformed telemetry line: %r", line)
+                return
+            decoded_message = line.decode('utf-8').strip().upper()
+            hot_log.info("Decoded message: '%s'", decoded_message)
+            self._handle_message(decoded_message)
+        except (serial.SerialException, OSError):
+            raise
+        except Exception as e:
+            hot_log.error("Skipping line %r: %s: %s", line, type(e).__name__, e)
+
+    def _dispatch_frames(self, data):
+        """Handles the frames in `data`; a frame that cannot be handled is logged and skipped."""
+        for frame in self._decoder.feed(data):
+            try:
+                self._handle_frame(frame)
+            except (serial.SerialException, OSError):
+                raise
+            except Exception as e:
+                hot_log.error("Skipping frame of type %#04x: %s: %s", frame.type, type(e).__name__, e)
+
+    def reader_stats(self):
+        """Returns byte and line throughput of the listener thread."""
+        if self.reader is None:
+            return {"bytes_total": 0, "lines_total": 0, "bytes_per_sec": 0.0, "lines_per_sec": 0.0}
+        return self.reader.stats()
+
+    def _handle_message(self, decoded_message, seq=None):
+        """
+        Routes a decoded line or frame from the microcontroller.
+
+        Replies complete the future of the command they answer: the one with
+        the same sequence number on the binary protocol, the oldest pending
+        command on the text protocol. Events and lines nobody is waiting for
+        go to eventQueue instead.
+        """
+        event = decoded_message.split(' ', 1)[0]
+        if event in EVENTS:
+            if self.recorder is not None and event not in FLOW_EVENTS:
+                self.recorder.event(decoded_message)
+            if decoded_message == "LIMIT TRIGGERED":
+                log.info("Limit trigger detected, sending to queue")
+                if self.message_queue:
+                    self.message_queue.put(('limit_triggered', 'Limit switch triggered'))
+                    log.info("Limit message sent to queue")
+                self.cancel_uploads()
+                self._fail_pending(LimitTriggered(decoded_message))
+            for listener in list(self._event_listeners):
+                listener(decoded_message)
+            if event not in FLOW_EVENTS:
+                self._queue_event(decoded_message)
+            return
+
+        if self._negotiating and decoded_message == self.ack:
+            # Switch before reading any further bytes, the Pico answers in frames from here on
+            self._negotiating = False
+            self.binary = True
+
+        future = self._pop_pending(seq)
+        if future is None:
+            self._queue_event(decoded_message)
+        elif getattr(future, 'expired', None) is not None:
+            hot_log.warning("Late reply to a command that timed out: '%s'", decoded_message)
+        else:
+            metrics.ROUND_TRIP.observe(time.perf_counter() - future.written)
+            metrics.REPLIES.inc(1, 'ok' if decoded_message == self.ack else 'error')
+            if self.recorder is not None:
+                self.recorder.reply(future.seq, decoded_message)
+            future.set_result(decoded_message)
+
+    def _queue_event(self, message):
+        """Queues a line for open() without blocking, dropping the oldest one when full."""
+        while True:
+            try:
+                self.eventQueue.put_nowait(message)
+                return
+            except queue.Full:
+                try:
+                    self.eventQueue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def add_event_listener(self, listener):
+        """Calls `listener(message)` from the listener thread for every event line."""
+        self._event_listeners.append(listener)
+
+    def remove_event_listener(self, listener):
+        if listener in self._event_listeners:
+            self._event_listeners.remove(listener)
+
+    def _handle_frame(self, frame):
+        """Converts a decoded frame into a reply for the controller queue."""
+        if frame.type == framing.TYPE_ACK:
+            self._handle_message(self.ack, frame.seq)
+        elif frame.type == framing.TYPE_NACK:
+            reason = frame.payload.decode('utf-8', errors='replace').strip().upper()
+            self._handle_message(f"{Config.NACK} {reason}".strip(), frame.seq)
+        elif frame.type == framing.TYPE_TELEMETRY:
+            if self.telemetry is not None and not self.telemetry.ingest_frame(frame.payload):
+                hot_log.warning("Skipping telemetry frame of %d bytes", len(frame.payload))
+        elif frame.type == framing.TYPE_EVENT:
+            decoded_message = frame.payload.decode('utf-8', errors='replace').strip().upper()
+            hot_log.info("Decoded event: '%s'", decoded_message)
+            self._handle_message(decoded_message, frame.seq)
+        else:
+            hot_log.warning("Ignoring frame of unknown type %#04x", frame.type)
+
+    def negotiate_binary(self):
+        """
+        Asks the microcontroller to switch to the binary framed protocol.
+
+        Firmware without framing support answers with something other than the
+        ACK, in which case the link stays on the text protocol.
+        """
+        self._negotiating = True
+        response = self.probe("PROTO BIN")
+        self._negotiating = False
+        if self.binary:
+            log.info("Binary framed protocol negotiated")
+        else:
+            log.info(f"Binary protocol not supported (response: {response}), using text protocol")
+        return self.binary
+
+    def _next_seq(self):
+        self._seq = (self._seq + 1) & 0xFFFF
+        return self._seq
+
+    def _encode(self, msg, seq):
+        """Encodes a command for the active protocol."""
+        if self.binary:
+            return framing.encode_command(seq, msg)
+        return f"{msg.rstrip()}\n".encode('utf-8')
+
+    def _submit(self, msg):
+        """
+        Queues a command on the transport and returns a Future that the
+        listener thread completes with its reply. The future's `seq`
+        attribute identifies it.
+        """
+        if self.transport is None:
+            raise serial.SerialException(f"Serial port {self.picoPort} is not open")
+        future = self._new_future()
+        self.transport.submit(command_priority(msg), lambda: self._prepare(msg, future), future)
+        return future
+
+    def _new_future(self):
+        future = Future()
+        with self._pending_lock:
+            future.seq = self._next_seq()
+        future.submitted = time.perf_counter()
+        return future
+
+    def _prepare(self, msg, future):
+        """Encodes a command and registers its future, just before it is written."""
+        data = self._encode(msg, future.seq)
+        self._register(future)
+        if self.recorder is not None:
+            self.recorder.command(future.seq, msg)
+        return data
+
+    def _register(self, future):
+        future.written = time.perf_counter()
+        metrics.QUEUE_WAIT.observe(future.written - future.submitted)
+        with self._pending_lock:
+            self._pending[future.seq] = future
+
+    def _submit_moves(self, rows):
+        """
+        Queues COMMAND_DTYPE rows as MOVE frames, packed together by
+        framing.encode_moves instead of formatting and parsing a string per
+        move. Binary protocol only.
+
+        :return: List of futures, one per row.
+        """
+        if self.transport is None:
+            raise serial.SerialException(f"Serial port {self.picoPort} is not open")
+        count = len(rows)
+        with self._pending_lock:
+            first_seq = self._next_seq()
+            self._seq = (first_seq + count - 1) & 0xFFFF
+        data, seqs = framing.encode_moves(first_seq, rows['speed'], rows['accel'], rows['steps'], rows['direction'])
+        submitted = time.perf_counter()
+        futures = []
+        for i, seq in enumerate(seqs):
+            future = Future()
+            future.seq = seq
+            future.submitted = submitted
+            frame = data[i * framing.MOVE_FRAME_SIZE:(i + 1) * framing.MOVE_FRAME_SIZE]
+            self.transport.submit(PRIORITY_BULK, lambda f=future, d=frame, r=rows[i]: self._prepare_move(d, f, r), future)
+            futures.append(future)
+        return futures
+
+    def _prepare_move(self, frame, future, row):
+        """_prepare for a MOVE frame packed by _submit_moves."""
+        self._register(future)
+        if self.recorder is not None:
+            steps = int(row['steps'])
+            self.recorder.move(future.seq, int(row['speed']), int(row['accel']), -steps if row['direction'] else steps)
+        return frame
+
+    def _submit_range(self, commands, start, stop):
+        """Queues commands[start:stop], see send_pipelined for the accepted sequences."""
+        if isinstance(commands, np.ndarray):
+            if self.binary:
+                return self._submit_moves(commands[start:stop])
+            return [self._submit(msg) for msg in waveform_compiler.to_commands(commands[start:stop])]
+        return [self._submit(commands[i]) for i in range(start, stop)]
+
+    def hold_writes(self):
+        """
+        Parks the transport writer, see SerialTransport.hold. While held,
+        commands can only be written with write_held.
+
+        :return: threading.Event that resumes the writer when set.
+        """
+        if self.transport is None:
+            raise serial.SerialException(f"Serial port {self.picoPort} is not open")
+        return self.transport.hold()
+
+    def prepare_held(self, msg):
+        """
+        Encodes a command for write_held ahead of time, so the write itself
+        does no work.
+
+        :return: (bytes to write, Future of the reply)
+        """
+        future = self._new_future()
+        future.set_running_or_notify_cancel()
+        return self._prepare(msg, future), future
+
+    def write_held(self, data, future):
+        """Writes bytes from prepare_held straight to the port while the writer is held."""
+        try:
+            self.serial.write(data)
+        except (serial.SerialException, OSError) as e:
+            self._write_failed([future], e)
+
+    def _write_failed(self, futures, exc):
+        """Fails commands whose write did not reach the port."""
+        for future in futures:
+            self._pop_pending(future.seq)
+            if not future.done():
+                future.set_exception(serial.SerialException(str(exc)))
+
+    def cancel_uploads(self):
+        """
+        Abandons uploads in progress: queued MOVE commands are dropped and
+        send_pipelined stops submitting more.
+        """
+        self._upload_generation += 1
+        if self.transport:
+            self.transport.cancel(PRIORITY_BULK)
+
+    def _pop_pending(self, seq=None):
+        """
+        Removes and returns the future for `seq`, or the oldest one when seq
+        is None. Commands that expired more than LATE_REPLY seconds ago are
+        skipped, their reply is not coming.
+        """
+        with self._pending_lock:
+            if seq is not None:
+                return self._pending.pop(seq, None)
+            now = time.perf_counter()
+            while self._pending:
+                future = self._pending.popitem(last=False)[1]
+                expired = getattr(future, 'expired', None)
+                if expired is None or now - expired <= LATE_REPLY:
+                    return future
+            return None
+
+    def _expire(self, future):
+        """
+        Gives up waiting for the reply to a command. On the binary protocol
+        its sequence number is forgotten. The text protocol matches replies
+        by order, so the command keeps its place for LATE_REPLY seconds and
+        a reply that turns up late is taken by it instead of by the next
+        command.
+        """
+        future.cancel()
+        if self.binary:
+            self._pop_pending(future.seq)
+        else:
+            future.expired = time.perf_counter()
+
+    def _forget_expired(self):
+        """Drops expired commands still holding a place, once nothing more is expected for them."""
+        with self._pending_lock:
+            for seq in [seq for seq, future in self._pending.items() if getattr(future, 'expired', None) is not None]:
+                del self._pending[seq]
+
+    def _fail_pending(self, exc):
+        """Fails every command still waiting for a reply."""
+        with self._pending_lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for future in pending:
+            future.set_exception(exc)
+
     def configureController(self):
         """Configures the microcontroller connection and starts the listening thread."""
         try:
-            self.serial = serial.Serial(self.picoPort, self.baudRate, timeout=1)
+            self.serial = serial.serial_for_url(self.picoPort, self.baudRate, timeout=1)
+            self.reader = SerialReader(self.serial)
+            self.transport = SerialTransport(self.serial, self._write_failed)
             controllerThread = threading.Thread(target=self.listenToController)
             controllerThread.daemon = True
             controllerThread.start()
+            self._listener = controllerThread
         except serial.SerialException as e:
             log.error(f"Could not open serial port {self.picoPort}: {e}")
 
     def reconnect(self):
-        """Handles reconnection logic if the microcontroller disconnects."""
-        retries = 0
-        while retries < Config.MAX_RECONNECT_ATTEMPTS:
+        """
+        Reopens the port after the microcontroller disconnects.
+
+        Attempts back off exponentially from Config.RECONNECT_BACKOFF_INITIAL
+        up to Config.RECONNECT_BACKOFF_MAX seconds. The waits return at once
+        when close() is called.
+        """
+        delay = Config.RECONNECT_BACKOFF_INITIAL
+        for attempt in range(1, Config.MAX_RECONNECT_ATTEMPTS + 1):
+            self._progress('reconnecting', f"Reconnecting in {delay:g} s (attempt {attempt}/{Config.MAX_RECONNECT_ATTEMPTS})")
+            if self._closing.wait(delay):
+                return
             try:
-                log.info("Attempting to reconnect to the microcontroller...")
-                self.serial = serial.Serial(self.picoPort, self.baudRate, timeout=1)
-                log.info("Successfully reconnected to the microcontroller. Listening for commands from the controller.")  # Log successful reconnection
-                self.send("CONF")
+                self.serial = serial.serial_for_url(self.picoPort, self.baudRate, timeout=1)
+                self.reader = SerialReader(self.serial)
+                if self.transport:
+                    self.transport.close()
+                self.transport = SerialTransport(self.serial, self._write_failed)
+                self.binary = False
+                self._decoder = framing.FrameDecoder()
+                # The listener has to be running before the handshake can read replies
                 controllerThread = threading.Thread(target=self.listenToController)
                 controllerThread.daemon = True
                 controllerThread.start()
-                self.connected = True
+                self._listener = controllerThread
+                log.info("Successfully reconnected to the microcontroller. Listening for commands from the controller.")  # Log successful reconnection
+                self._handshake()
+                self.update_connection_status(True)
+                self._progress('connected', f"Reconnected to Pico on port {self.picoPort}")
                 return
             except serial.SerialException as e:
                 log.error(f"Reconnection failed: {e}")
-                retries += 1
-                time.sleep(5)  # Wait before retrying
+            delay = min(delay * 2, Config.RECONNECT_BACKOFF_MAX)
         log.error(f"*** Reconnection failed after {Config.MAX_RECONNECT_ATTEMPTS} attempts.")
+        self._progress('failed', f"Reconnection failed after {Config.MAX_RECONNECT_ATTEMPTS} attempts")
 
     def send(self, msg, timeout=5):
         """Sends a message to the microcontroller and waits for a response."""
         try:
-            self.serial.write(msg.encode('utf-8'))
-            self.serial.write(bytes('\n', encoding='utf-8'))
-            start_time = time.time()
-            while self.controllerQueue.empty():
-                if time.time() - start_time > timeout:
-                    log.error(f"Timeout waiting for response to message: {msg}")
-                    return None
-                time.sleep(0.01)
-            return self.controllerQueue.get()
+            future = self._submit(msg)
+            reply = future.result(timeout)
+            metrics.SEND.observe(time.perf_counter() - future.submitted)
+            return reply
+        except FutureTimeout:
+            metrics.TIMEOUTS.inc()
+            self._expire(future)
+            hot_log.error("Timeout waiting for response to message: %s", msg.strip())
+            return None
+        except CancelledError:
+            hot_log.warning("Command cancelled before it was sent: %s", msg.strip())
+            return None
+        except LimitTriggered:
+            log.error(f"Limit triggered while waiting for response to message: {msg.strip()}")
+            return None
         except serial.SerialException as e:
             log.error(f"Failed to send message: {e}")
             self.connected = False
-            return None
\ No newline at end of file
+            return None
+
+    def probe(self, msg):
+        """
+        Sends a capability query that firmware without the feature may not
+        answer at all, waiting Config.PROBE_TIMEOUT rather than the usual
+        5 s. An unanswered query is forgotten straight away, so on the text
+        protocol the next command's reply is not matched to it.
+
+        :return: The reply, or None.
+        """
+        try:
+            future = self._submit(msg)
+        except serial.SerialException as e:
+            log.error(f"Failed to send message: {e}")
+            return None
+        reply = self.wait_reply(future, Config.PROBE_TIMEOUT)
+        if reply is None:
+            self._forget_expired()
+        return reply
+
+    def send_nowait(self, msg):
+        """
+        Queues a command without waiting for its reply.
+
+        :return: Future completed with the reply, to be collected with wait_reply.
+        """
+        return self._submit(msg)
+
+    def wait_reply(self, future, timeout=5):
+        """Waits for the reply to a command from send_nowait; None when it timed out or failed."""
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            metrics.TIMEOUTS.inc()
+            self._expire(future)
+            return None
+        except (CancelledError, LimitTriggered, serial.SerialException):
+            return None
+
+    def send_pipelined(self, commands, window=None, timeout=5, announce=None):
+        """
+        Sends a list of commands keeping up to `window` of them in flight.
+
+        Each command gets a future that the listener thread completes with its
+        reply, matched by sequence number on the binary protocol and by write
+        order on the text protocol.
+
+        The Pico stores commands in the order they arrive, so a command that
+        is rejected (reply starts with Config.NACK) or times out is never
+        resent on its own behind the ones after it. Sending stops, the
+        commands in flight are drained, and when `announce` is given it is
+        sent again and the whole batch resent, up to Config.MAX_RETRANSMITS
+        times. Without `announce` the upload fails from that command on.
+
+        :param commands: Sequence of command strings (without trailing newline), or a
+                         COMMAND_DTYPE batch, which goes out as packed MOVE frames on the binary protocol.
+        :param window: Maximum number of unacknowledged commands (default: Config.UPLOAD_WINDOW).
+        :param timeout: Seconds to wait for the reply to the oldest in-flight command.
+        :param announce: Commands that (re)start the batch on the Pico, e.g. ["BATCH_SIZE n"],
+                         sent and acknowledged one at a time before the batch.
+        :return: List of indices into `commands` that could not be delivered.
+        """
+        window = max(1, window or Config.UPLOAD_WINDOW)
+        generation = self._upload_generation
+        # Set by every attempt, the first attempt always runs
+        index, reason = 0, None
+        for attempt in range(Config.MAX_RETRANSMITS + 1):
+            if attempt:
+                hot_log.warning("Command %d/%d failed (%s), resending the batch (attempt %d/%d)",
+                                index + 1, len(commands), reason, attempt, Config.MAX_RETRANSMITS)
+            if self._upload_generation != generation:
+                log.warning("Upload cancelled, aborting remaining commands")
+                return list(range(len(commands)))
+            index, reason, retry = self._announce(announce or (), timeout)
+            if index is None:
+                index, reason, retry = self._send_window(commands, window, timeout, generation)
+            if index is None:
+                return []
+            if not retry or not announce:
+                break
+        hot_log.error("Giving up on command %d/%d (%s): %s", index + 1, len(commands), reason,
+                      describe_command(commands, index))
+        return list(range(index, len(commands)))
+
+    def _announce(self, announce, timeout):
+        """
+        Sends the commands that (re)start a batch, one at a time.
+
+        :return: Same shape as _send_window; a failed announcement fails the whole batch.
+        """
+        for command in announce:
+            reply = self.send(command, timeout)
+            if reply != self.ack:
+                hot_log.warning("Batch announcement %s failed (%s)", command, reply)
+                return 0, reply or "timeout", reply is None or reply.startswith(Config.NACK)
+        return None, None, False
+
+    def _send_window(self, commands, window, timeout, generation):
+        """
+        One in-order pass of send_pipelined, stopping at the first failure.
+
+        :return: (index of the first command not delivered, reason, whether resending can help),
+                 or (None, None, False) when every command was acknowledged.
+        """
+        in_flight = OrderedDict()
+        next_index = 0
+        first_failure = None
+        try:
+            while in_flight or (next_index < len(commands) and first_failure is None):
+                if self._upload_generation != generation:
+                    raise CancelledError()
+                if first_failure is None and next_index < len(commands) and len(in_flight) < window:
+                    stop = min(next_index + window - len(in_flight), len(commands))
+                    sent_at = time.time()
+                    for future in self._submit_range(commands, next_index, stop):
+                        in_flight[future.seq] = (next_index, future, sent_at)
+                        next_index += 1
+
+                seq, (index, future, sent_at) = next(iter(in_flight.items()))
+                try:
+                    reply = future.result(max(timeout - (time.time() - sent_at), 0))
+                except FutureTimeout:
+                    metrics.TIMEOUTS.inc()
+                    self._expire(future)
+                    reply = None
+                del in_flight[seq]
+                if first_failure is None and (reply is None or reply.startswith(Config.NACK)):
+                    # Stop sending, the rest of the window is drained so no reply is left over
+                    first_failure = (index, reply or "timeout")
+        except CancelledError:
+            log.warning("Upload cancelled, aborting remaining commands")
+            return self._abort_window(in_flight, next_index, first_failure, "cancelled")
+        except LimitTriggered:
+            log.error("Limit triggered during upload, aborting remaining commands")
+            return self._abort_window(in_flight, next_index, first_failure, "limit triggered")
+        except serial.SerialException as e:
+            log.error(f"Failed to send message: {e}")
+            self.connected = False
+            return self._abort_window(in_flight, next_index, first_failure, str(e))
+
+        if first_failure is None:
+            return None, None, False
+        self._forget_expired()
+        return first_failure[0], first_failure[1], True
+
+    def _abort_window(self, in_flight, next_index, first_failure, reason):
+        for _, future, _ in in_flight.values():
+            future.cancel()
+        indices = [i for i, _, _ in in_flight.values()] + [next_index]
+        if first_failure is not None:
+            indices.append(first_failure[0])
+        return min(indices), reason, False
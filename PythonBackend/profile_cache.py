@@ -0,0 +1,211 @@
+# profile_cache.py
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from config import Config
+from logger import Logger
+
+# Initialize the logger
+logger = Logger()
+log = logger.get_logger(__name__)
+
+# A <key>.tmp file older than this (s) was left by a writer that died, newer ones are still being written
+STALE_TMP = 60
+
+
+def profile_key(kind, **params):
+    """
+    Hashes a motion profile's parameters together with the table constants
+    that affect compilation, so a changed STEPS_PER_MM, MAX_ACCELERATION or
+    MAX_JERK never reuses stale commands.
+    """
+    raw = json.dumps({
+        "kind": kind,
+        "params": params,
+        "steps_per_mm": float(Config.STEPS_PER_MM),
+        "max_acceleration": float(Config.MAX_ACCELERATION),
+        "max_jerk": float(Config.MAX_JERK),
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def commands_key(commands):
+    """Hashes a list of preformatted commands, or the moves of a typed upload."""
+    digest = hashlib.sha256()
+    if isinstance(commands, np.ndarray):
+        for name in ('speed', 'accel', 'steps', 'direction'):
+            digest.update(np.ascontiguousarray(commands[name]).tobytes())
+        return digest.hexdigest()
+    for command in commands:
+        digest.update(command.strip().encode('utf-8'))
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+class ProfileCache:
+    """
+    Two-tier cache of compiled command arrays.
+
+    Recently used profiles stay in memory with LRU eviction. Every profile is
+    also written to `cache_dir` as .npy and memory-mapped back on a memory
+    miss; once the files take more than `max_bytes`, the least recently
+    used are deleted. The cache also tracks which profiles are stored on the Pico so they
+    can be replayed by slot instead of uploaded again.
+    """
+
+    def __init__(self, max_entries=None, cache_dir=None, max_bytes=None):
+        self.max_entries = max_entries or Config.PROFILE_CACHE_SIZE
+        self.cache_dir = cache_dir or Config.PROFILE_CACHE_DIR
+        self.max_bytes = Config.PROFILE_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._resident = OrderedDict()  # key -> slot on the Pico
+        self.slots = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.disk_evictions = 0
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npy")
+
+    def get(self, key):
+        """Returns the cached array for `key` or None."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+        path = self._path(key)
+        if os.path.exists(path):
+            batch = np.load(path, mmap_mode='r')
+            self.disk_hits += 1
+            try:
+                # Disk eviction goes by mtime, so a hit counts as a use
+                os.utime(path)
+            except OSError:
+                pass
+            self._remember(key, batch)
+            return batch
+        self.misses += 1
+        return None
+
+    def put(self, key, batch):
+        """Stores a compiled array in memory and on disk."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = os.path.join(self.cache_dir, f"{key}.tmp")
+        f = self._create_tmp(tmp_path)
+        self._remember(key, batch)
+        if f is None:
+            # Another table is storing the same profile, keys are hashes of the contents
+            return
+        with f:
+            np.save(f, batch)
+        os.replace(tmp_path, self._path(key))
+        if self.max_bytes:
+            self._evict_disk(keep=self._path(key))
+
+    @staticmethod
+    def _create_tmp(tmp_path):
+        """Opens a new temporary file exclusively, or returns None while another writer holds it."""
+        try:
+            return open(tmp_path, 'xb')
+        except FileExistsError:
+            pass
+        try:
+            if time.time() - os.path.getmtime(tmp_path) < STALE_TMP:
+                return None
+            os.remove(tmp_path)
+            return open(tmp_path, 'xb')
+        except (FileExistsError, FileNotFoundError):
+            return None
+
+    def _evict_disk(self, keep):
+        """Deletes the least recently used .npy files until the disk tier fits in max_bytes."""
+        files = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.npy') and entry.is_file():
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.disk_evictions += 1
+
+    def get_or_compile(self, key, compile_fn):
+        """Returns the cached array for `key`, compiling and storing it on a miss."""
+        batch = self.get(key)
+        if batch is None:
+            batch = compile_fn()
+            self.put(key, batch)
+        return batch
+
+    def _remember(self, key, batch):
+        with self._lock:
+            self._memory[key] = batch
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def set_slots(self, slots):
+        """Sets how many profiles the Pico can hold and forgets what it held."""
+        with self._lock:
+            self.slots = slots
+            self._resident.clear()
+
+    def resident_slot(self, key):
+        """Returns the Pico slot holding `key`, or None."""
+        with self._lock:
+            slot = self._resident.get(key)
+            if slot is not None:
+                self._resident.move_to_end(key)
+            return slot
+
+    def assign_slot(self, key):
+        """
+        Picks the Pico slot a profile should be stored in, reusing the least
+        recently played slot once all are taken. Returns None when the
+        firmware cannot store profiles.
+        """
+        with self._lock:
+            if not self.slots:
+                return None
+            if key in self._resident:
+                return self._resident[key]
+            if len(self._resident) < self.slots:
+                used = set(self._resident.values())
+                slot = next(s for s in range(self.slots) if s not in used)
+            else:
+                _, slot = self._resident.popitem(last=False)
+            self._resident[key] = slot
+            return slot
+
+    def forget_slot(self, key):
+        """Drops `key` from the resident set, e.g. after a failed upload."""
+        with self._lock:
+            self._resident.pop(key, None)
+
+    def stats(self):
+        return {
+            "memory_entries": len(self._memory),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "disk_evictions": self.disk_evictions,
+            "resident": len(self._resident),
+            "slots": self.slots,
+        }
@@ -0,0 +1,416 @@
+# run_recorder.py
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from config import Config
+from logger import Logger
+
+# Initialize the logger
+logger = Logger()
+log = logger.get_logger(__name__)
+
+INDEX_FILE = 'index.json'
+TEXT_FILE = 'messages.txt'
+FORMAT_VERSION = 2
+
+SOURCE_HOST = 0
+SOURCE_PICO = 1
+
+# One append-only file of fixed-size records per stream. `time` is seconds since the run started.
+# Message text has no length limit: each record points at its bytes in TEXT_FILE.
+STREAMS = {
+    'moves': np.dtype([('time', '<f8'), ('seq', '<u4'), ('speed', '<u4'), ('accel', '<u4'), ('steps', '<i4')]),
+    'messages': np.dtype([('time', '<f8'), ('seq', '<u4'), ('source', 'u1'), ('offset', '<u8'), ('length', '<u4')]),
+    'replies': np.dtype([('time', '<f8'), ('seq', '<u4'), ('ok', 'u1'), ('latency', '<f4')]),
+    'telemetry': np.dtype([('time', '<f8'), ('time_us', '<u4'), ('position', '<i4')]),
+}
+
+# Setup traffic that belongs to the connection rather than the run, never replayed
+SETUP_COMMANDS = ("CONF", "PROTO", "PROFILES", "LOOPS")
+
+# Run directories being written, never pruned
+_recording = set()
+_recording_lock = threading.Lock()
+
+
+class _Stream:
+    """Buffered writer for one stream, flushed to disk a block at a time."""
+
+    def __init__(self, path, dtype, block_records):
+        self.file = open(path, 'ab')
+        self.buffer = np.zeros(block_records, dtype=dtype)
+        self.fill = 0
+        self.count = 0
+        self.blocks = []  # [first record, record count, first time, last time]
+        self.lock = threading.Lock()
+
+    def append(self, record):
+        """Adds one record; returns True when the block filled up and was written."""
+        with self.lock:
+            self.buffer[self.fill] = record
+            self.fill += 1
+            if self.fill == len(self.buffer):
+                self._flush()
+                return True
+        return False
+
+    def extend(self, records):
+        """Adds an array of records."""
+        flushed = False
+        with self.lock:
+            while len(records):
+                n = min(len(records), len(self.buffer) - self.fill)
+                self.buffer[self.fill:self.fill + n] = records[:n]
+                self.fill += n
+                records = records[n:]
+                if self.fill == len(self.buffer):
+                    self._flush()
+                    flushed = True
+        return flushed
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if self.fill == 0:
+            return
+        block = self.buffer[:self.fill]
+        self.file.write(block.tobytes())
+        self.file.flush()
+        self.blocks.append([self.count, self.fill, float(block['time'][0]), float(block['time'][-1])])
+        self.count += self.fill
+        self.fill = 0
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+class RunRecorder:
+    """
+    Records one session: every command sent, the time of every reply, events
+    from the Pico and telemetry.
+
+    Each stream is an append-only binary file of fixed-size records and
+    index.json lists the record layout, counts and the time range of every
+    block written, so a run can be read back with np.memmap and searched
+    by time without parsing anything. Message text goes to messages.txt. The index is rewritten after each
+    block, which keeps everything up to the last block readable if the
+    process dies mid-run.
+
+    Hooks are cheap enough for the listener thread: a record is copied into
+    a preallocated block and only whole blocks touch the disk.
+    """
+
+    def __init__(self, path=None, metadata=None, block_records=None):
+        """
+        :param path: Run directory (default: a timestamped directory in Config.RUN_DIR).
+        :param metadata: JSON-serialisable description stored in the index.
+        :param block_records: Records buffered per stream before writing (default: Config.RUN_BLOCK_RECORDS).
+        """
+        self.path = path or os.path.join(Config.RUN_DIR, time.strftime('%Y%m%d-%H%M%S'))
+        with _recording_lock:
+            _recording.add(os.path.abspath(self.path))
+        os.makedirs(self.path, exist_ok=True)
+        self.started = time.time()
+        self._t0 = time.monotonic()
+        self.metadata = dict(metadata or {})
+        block_records = block_records or Config.RUN_BLOCK_RECORDS
+        self.streams = {
+            name: _Stream(os.path.join(self.path, f"{name}.bin"), dtype, block_records)
+            for name, dtype in STREAMS.items()
+        }
+        # Unbuffered, messages are rare and the index must never point past the text written
+        self._text = open(os.path.join(self.path, TEXT_FILE), 'ab', buffering=0)
+        self._text_size = 0
+        self._text_lock = threading.Lock()
+        self._index_lock = threading.Lock()
+        self._sent = {}  # seq -> time written, until the reply arrives
+        self.closed = False
+        self._write_index()
+        log.info(f"Recording run to {self.path}")
+        if os.path.dirname(os.path.abspath(self.path)) == os.path.abspath(Config.RUN_DIR):
+            try:
+                prune_runs()
+            except OSError as e:
+                log.warning(f"Could not prune old runs: {e}")
+
+    def _now(self):
+        return time.monotonic() - self._t0
+
+    def _write_index(self):
+        streams = {}
+        for name, stream in self.streams.items():
+            with stream.lock:
+                streams[name] = {"dtype": STREAMS[name].descr, "count": stream.count, "blocks": list(stream.blocks)}
+        index = {
+            "version": FORMAT_VERSION,
+            "started": self.started,
+            "metadata": self.metadata,
+            "streams": streams,
+        }
+        with self._index_lock:
+            tmp = os.path.join(self.path, INDEX_FILE + '.tmp')
+            with open(tmp, 'w') as f:
+                json.dump(index, f)
+            os.replace(tmp, os.path.join(self.path, INDEX_FILE))
+
+    def _append(self, name, record):
+        if not self.closed and self.streams[name].append(record):
+            self._write_index()
+
+    def _message(self, now, seq, source, text):
+        data = text.encode('utf-8')
+        with self._text_lock:
+            if self.closed:
+                return
+            offset = self._text_size
+            self._text.write(data)
+            self._text_size += len(data)
+            self._append('messages', (now, seq, source, offset, len(data)))
+
+    def command(self, seq, msg):
+        """Called just before a command is written to the port."""
+        now = self._now()
+        self._sent[seq] = now
+        parts = msg.split()
+        if len(parts) == 5 and parts[0].upper() == 'MOVE':
+            steps = int(parts[3])
+            self._append('moves', (now, seq, int(parts[1]), int(parts[2]), -steps if int(parts[4]) else steps))
+        else:
+            self._message(now, seq, SOURCE_HOST, msg.strip())
+
+    def move(self, seq, speed, accel, steps):
+        """Like command, for a MOVE sent as a packed frame; `steps` is negative when direction is 1."""
+        now = self._now()
+        self._sent[seq] = now
+        self._append('moves', (now, seq, speed, accel, steps))
+
+    def reply(self, seq, message):
+        """Called when the reply to command `seq` arrives."""
+        now = self._now()
+        sent = self._sent.pop(seq, None)
+        self._append('replies', (now, seq, message == Config.ACK, np.nan if sent is None else now - sent))
+        if message != Config.ACK:
+            self._message(now, seq, SOURCE_PICO, message)
+
+    def event(self, message):
+        """Called for lines the Pico sends on its own, e.g. LIMIT TRIGGERED."""
+        self._message(self._now(), 0, SOURCE_PICO, message)
+
+    def telemetry(self, time_us, positions):
+        """Called with each batch of telemetry samples."""
+        if self.closed:
+            return
+        records = np.empty(len(positions), dtype=STREAMS['telemetry'])
+        records['time'] = self._now()
+        records['time_us'] = time_us
+        records['position'] = positions
+        if self.streams['telemetry'].extend(records):
+            self._write_index()
+
+    def close(self):
+        """Writes the remaining records and the final index."""
+        if self.closed:
+            return
+        with self._text_lock:
+            self.closed = True
+            self._text.close()
+        for stream in self.streams.values():
+            stream.close()
+        self.metadata["duration"] = self._now()
+        self._write_index()
+        with _recording_lock:
+            _recording.discard(os.path.abspath(self.path))
+        log.info(f"Run recorded to {self.path}: " + ", ".join(
+            f"{stream.count} {name}" for name, stream in self.streams.items()
+        ))
+
+
+class RunReader:
+    """
+    Read-only view of a recorded run.
+
+    `reader['moves']` and the other streams are np.memmap arrays, so opening
+    a run costs nothing and only the pages that are used get read.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, INDEX_FILE)) as f:
+            self.index = json.load(f)
+        if self.index.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported run format version {self.index.get('version')}")
+        self.metadata = self.index["metadata"]
+        self._arrays = {}
+        self._text = None
+
+    def __getitem__(self, name):
+        if name not in self._arrays:
+            info = self.index["streams"][name]
+            dtype = np.dtype([tuple(field) for field in info["dtype"]])
+            if info["count"] == 0:
+                self._arrays[name] = np.zeros(0, dtype=dtype)
+            else:
+                self._arrays[name] = np.memmap(os.path.join(self.path, f"{name}.bin"), dtype=dtype,
+                                               mode='r', shape=(info["count"],))
+        return self._arrays[name]
+
+    def between(self, name, start=None, end=None):
+        """Records of a stream with start <= time <= end, as a memmap slice."""
+        data = self[name]
+        blocks = self.index["streams"][name]["blocks"]
+        lo, hi = 0, len(data)
+        if blocks:
+            # Narrow the search to the blocks covering the range before touching the data
+            if start is not None:
+                first = np.searchsorted([b[3] for b in blocks], start, 'left')
+                lo = blocks[first][0] if first < len(blocks) else len(data)
+            if end is not None:
+                last = np.searchsorted([b[2] for b in blocks], end, 'right')
+                hi = blocks[last][0] if last < len(blocks) else len(data)
+        times = data['time'][lo:hi]
+        if start is not None:
+            lo += np.searchsorted(times, start, 'left')
+        if end is not None:
+            hi = lo + np.searchsorted(data['time'][lo:hi], end, 'right')
+        return data[lo:hi]
+
+    def text(self, messages):
+        """Text of records of the messages stream."""
+        if self._text is None:
+            with open(os.path.join(self.path, TEXT_FILE), 'rb') as f:
+                self._text = f.read()
+        return [self._text[offset:offset + length].decode('utf-8')
+                for offset, length in zip(messages['offset'].tolist(), messages['length'].tolist())]
+
+    def reply_latency(self):
+        """Seconds from each command being written to its reply."""
+        return self['replies']['latency']
+
+    def commands(self):
+        """
+        Host commands in the order they were sent, excluding connection setup.
+
+        :return: List of (time, command) tuples.
+        """
+        moves = self['moves']
+        messages = self['messages']
+        host = messages[messages['source'] == SOURCE_HOST]
+        items = [(t, f"MOVE {speed} {accel} {abs(steps)} {1 if steps < 0 else 0}")
+                 for t, speed, accel, steps in zip(moves['time'].tolist(), moves['speed'].tolist(),
+                                                   moves['accel'].tolist(), moves['steps'].tolist())]
+        items += [(t, text) for t, text in zip(host['time'].tolist(), self.text(host))
+                  if text.split(' ', 1)[0].upper() not in SETUP_COMMANDS]
+        items.sort(key=lambda item: item[0])
+        return items
+
+
+def replay(reader, conn, speed=1.0, stop=None, timeout=5):
+    """
+    Re-sends a recorded run's commands, each at its recorded offset from the
+    first one, without waiting for replies in between.
+
+    :param reader: RunReader of the recorded run.
+    :param conn: Connected PicoLink.
+    :param speed: Playback rate, 2.0 replays twice as fast.
+    :param stop: threading.Event that aborts the replay.
+    :return: dict with the number of commands sent, failures and how late
+             commands were sent relative to the recording.
+    """
+    commands = reader.commands()
+    if not commands:
+        return {"sent": 0, "failed": 0, "max_lateness": 0.0, "mean_lateness": 0.0}
+    first = commands[0][0]
+    futures = []
+    lateness = np.zeros(len(commands))
+    start = time.monotonic()
+    for i, (t, command) in enumerate(commands):
+        if stop is not None and stop.is_set():
+            break
+        due = start + (t - first) / speed
+        delay = due - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        lateness[i] = max(0.0, time.monotonic() - due)
+        futures.append(conn.send_nowait(command))
+
+    failed = 0
+    for future in futures:
+        reply = conn.wait_reply(future, timeout)
+        if reply is None or reply.startswith(Config.NACK):
+            failed += 1
+    sent = len(futures)
+    return {
+        "sent": sent,
+        "failed": failed,
+        "max_lateness": float(lateness[:sent].max()) if sent else 0.0,
+        "mean_lateness": float(lateness[:sent].mean()) if sent else 0.0,
+    }
+
+
+def list_runs(run_dir=None):
+    """Returns the recorded runs, newest first, with their metadata."""
+    run_dir = run_dir or Config.RUN_DIR
+    if not os.path.isdir(run_dir):
+        return []
+    runs = []
+    for name in sorted(os.listdir(run_dir), reverse=True):
+        index_path = os.path.join(run_dir, name, INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                index = json.load(f)
+            runs.append({
+                "name": name,
+                "started": index["started"],
+                "metadata": index["metadata"],
+                "counts": {stream: info["count"] for stream, info in index["streams"].items()},
+            })
+    return runs
+
+
+def _run_size(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+def prune_runs(run_dir=None, max_runs=None, max_bytes=None):
+    """
+    Deletes the oldest runs so that at most `max_runs` are kept, taking at
+    most `max_bytes` together. Runs still being recorded are never deleted.
+
+    :param max_runs: Runs kept (default: Config.RUN_MAX_RUNS), 0 for no limit.
+    :param max_bytes: Total size kept (default: Config.RUN_MAX_BYTES), 0 for no limit.
+    :return: Names of the deleted runs.
+    """
+    run_dir = run_dir or Config.RUN_DIR
+    max_runs = Config.RUN_MAX_RUNS if max_runs is None else max_runs
+    max_bytes = Config.RUN_MAX_BYTES if max_bytes is None else max_bytes
+    if not os.path.isdir(run_dir):
+        return []
+    with _recording_lock:
+        recording = set(_recording)
+    kept, total, full = 0, 0, False
+    deleted = []
+    for name in sorted(os.listdir(run_dir), reverse=True):
+        path = os.path.join(run_dir, name)
+        if not os.path.exists(os.path.join(path, INDEX_FILE)):
+            continue
+        size = _run_size(path)
+        if os.path.abspath(path) not in recording:
+            # Everything older than the first run over a limit goes too
+            full = full or (max_runs and kept >= max_runs) or (max_bytes and total + size > max_bytes)
+            if full:
+                shutil.rmtree(path, ignore_errors=True)
+                deleted.append(name)
+                continue
+        kept += 1
+        total += size
+    if deleted:
+        log.info(f"Deleted {len(deleted)} old runs from {run_dir}")
+    return deleted
@@ -0,0 +1,104 @@
+# serial_reader.py
+import time
+
+# Rates are measured over at least this many seconds, so callers reading
+# them back to back (e.g. the gauges of one /metrics scrape) see the same values
+RATE_INTERVAL = 1.0
+
+
+class SerialReader:
+    """
+    Buffered reader for a serial port.
+
+    Each fill() pulls everything the port reports as waiting into a reusable
+    bytearray. Complete lines are split out with a memoryview and handed back
+    as raw bytes, so decoding only happens when a consumer needs the text.
+    """
+
+    def __init__(self, serial_port, buffer_size=4096):
+        """
+        :param serial_port: Open pyserial port (or any object with read/readinto/in_waiting).
+        :param buffer_size: Initial buffer size in bytes, grows if a line does not fit.
+        """
+        self.serial = serial_port
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+        self._scan = 0
+        self.bytes_total = 0
+        self.lines_total = 0
+        self._mark = (time.monotonic(), 0, 0)
+        self._rates = (0.0, 0.0)
+
+    def _reserve(self, size):
+        """Makes room for `size` more bytes after the buffered data."""
+        if self._end + size <= len(self._buffer):
+            return
+        pending = self._end - self._start
+        if pending + size > len(self._buffer):
+            new_size = len(self._buffer)
+            while pending + size > new_size:
+                new_size *= 2
+            buffer = bytearray(new_size)
+            buffer[:pending] = self._buffer[self._start:self._end]
+            self._buffer = buffer
+            self._view = memoryview(self._buffer)
+        else:
+            self._view[:pending] = self._view[self._start:self._end]
+        self._scan -= self._start
+        self._start = 0
+        self._end = pending
+
+    def fill(self):
+        """
+        Reads whatever the port has waiting, blocking for at most the port
+        timeout when nothing is available.
+
+        :return: Number of bytes read, 0 on timeout.
+        """
+        size = self.serial.in_waiting or 1
+        self._reserve(size)
+        count = self.serial.readinto(self._view[self._end:self._end + size])
+        self._end += count
+        self.bytes_total += count
+        return count
+
+    def next_line(self):
+        """Returns the next complete line as bytes without the newline, or None."""
+        index = self._buffer.find(b'\n', self._scan, self._end)
+        if index < 0:
+            self._scan = self._end
+            return None
+        line = bytes(self._view[self._start:index])
+        self._start = self._scan = index + 1
+        if self._start == self._end:
+            self._start = self._end = self._scan = 0
+        self.lines_total += 1
+        return line
+
+    def drain(self):
+        """Returns and discards all buffered bytes, complete lines or not."""
+        data = bytes(self._view[self._start:self._end])
+        self._start = self._end = self._scan = 0
+        return data
+
+    def stats(self):
+        """
+        Returns totals and the byte and line rates since the previous call,
+        or the previous rates when that was less than RATE_INTERVAL ago.
+
+        :return: dict with bytes_total, lines_total, bytes_per_sec and lines_per_sec.
+        """
+        now = time.monotonic()
+        then, bytes_then, lines_then = self._mark
+        if now - then >= RATE_INTERVAL:
+            self._rates = ((self.bytes_total - bytes_then) / (now - then),
+                           (self.lines_total - lines_then) / (now - then))
+            self._mark = (now, self.bytes_total, self.lines_total)
+        return {
+            "bytes_total": self.bytes_total,
+            "lines_total": self.lines_total,
+            "bytes_per_sec": self._rates[0],
+            "lines_per_sec": self._rates[1],
+        }
@@ -0,0 +1,188 @@
+# serial_transport.py
+import asyncio
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+
+import serial
+
+import metrics
+from logger import Logger
+
+# Initialize the logger
+logger = Logger()
+log = logger.get_logger(__name__)
+
+# Lower values are written first
+PRIORITY_URGENT = 0   # STOP / RESET
+PRIORITY_CONTROL = 1  # configuration and one-off commands
+PRIORITY_BULK = 2     # MOVE traffic
+
+URGENT_COMMANDS = ("STOP", "RESET")
+# Batch contents, kept in order with each other
+BULK_COMMANDS = ("MOVE", "REPEAT")
+
+# Queued commands of one priority are joined into writes of up to this many bytes
+MAX_WRITE = 4096
+
+
+def command_priority(msg):
+    """Queue priority of a text protocol command."""
+    parts = msg.split(None, 1)
+    word = parts[0].upper() if parts else ''
+    if word in URGENT_COMMANDS:
+        return PRIORITY_URGENT
+    if word in BULK_COMMANDS:
+        return PRIORITY_BULK
+    return PRIORITY_CONTROL
+
+
+class SerialTransport:
+    """
+    Single writer for a serial port, run as an asyncio task on its own thread.
+
+    Commands from any thread go through one priority queue, so a STOP or
+    RESET is the next thing written even while an upload has MOVE commands
+    queued. Each command is only encoded (and registered for its reply) when
+    the writer takes it off the queue, which keeps reply order equal to
+    write order on the text protocol.
+    """
+
+    def __init__(self, serial_port, on_write_error=None):
+        """
+        :param serial_port: Open pyserial port.
+        :param on_write_error: Called as `on_write_error(futures, exc)` when a write fails.
+        """
+        self.serial = serial_port
+        self.on_write_error = on_write_error
+        self._order = itertools.count()
+        self._loop = asyncio.new_event_loop()
+        self._queue = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run_loop)
+        self._thread.daemon = True
+        self._thread.start()
+        self._ready.wait()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.PriorityQueue()
+        self._ready.set()
+        self._loop.run_until_complete(self._writer())
+        self._loop.close()
+
+    def submit(self, priority, prepare, future):
+        """
+        Queues a command from any thread.
+
+        :param priority: One of the PRIORITY_* constants.
+        :param prepare: Called by the writer just before writing, returns the bytes to write.
+        :param future: concurrent.futures.Future of the reply, skipped if cancelled before writing.
+        """
+        try:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, (priority, next(self._order), prepare, future))
+        except RuntimeError:
+            raise serial.SerialException("Transport is closed")
+
+    def cancel(self, priority=PRIORITY_BULK):
+        """Cancels every queued, not yet written command of `priority`."""
+        try:
+            self._loop.call_soon_threadsafe(self._cancel, priority)
+        except RuntimeError:
+            pass
+
+    def _cancel(self, priority):
+        kept = []
+        cancelled = 0
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item[0] == priority and item[3] is not None:
+                item[3].cancel()
+                cancelled += 1
+            else:
+                kept.append(item)
+        for item in kept:
+            self._queue.put_nowait(item)
+        if cancelled:
+            log.info(f"Cancelled {cancelled} queued commands")
+
+    def hold(self, timeout=5):
+        """
+        Parks the writer between writes so the caller can write to the port
+        directly, e.g. to start several tables within microseconds of each
+        other. Commands submitted meanwhile stay queued.
+
+        :return: threading.Event; set it to let the writer continue.
+        :raises serial.SerialException: If the writer did not stop within `timeout`.
+        """
+        parked = threading.Event()
+        release = threading.Event()
+
+        def prepare():
+            parked.set()
+            release.wait(timeout)
+            return b''
+
+        self.submit(PRIORITY_URGENT, prepare, Future())
+        if not parked.wait(timeout):
+            release.set()
+            raise serial.SerialException("Serial writer did not yield")
+        return release
+
+    def close(self):
+        """Stops the writer; queued commands are cancelled."""
+        try:
+            # The sentinel sorts ahead of every command
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, (-1, -1, None, None))
+        except RuntimeError:
+            return
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout=2)
+
+    async def _writer(self):
+        while True:
+            item = await self._queue.get()
+            futures = []
+            chunks = []
+            size = 0
+            while True:
+                priority, _, prepare, future = item
+                if future is None:
+                    self._cancel_all()
+                    return
+                if future.set_running_or_notify_cancel():
+                    try:
+                        data = prepare()
+                    except Exception as e:
+                        future.set_exception(e)
+                    else:
+                        chunks.append(data)
+                        futures.append(future)
+                        size += len(data)
+                if size >= MAX_WRITE or self._queue.empty():
+                    break
+                item = self._queue.get_nowait()
+                if item[0] != priority:
+                    self._queue.put_nowait(item)
+                    break
+
+            data = b''.join(chunks)
+            if not data:
+                continue
+            try:
+                # The loop has no other work, so a blocking write only delays queueing
+                start = time.perf_counter()
+                self.serial.write(data)
+                metrics.SERIAL_WRITE.observe(time.perf_counter() - start)
+                metrics.SERIAL_BYTES.inc(len(data))
+            except (serial.SerialException, OSError) as e:
+                log.error(f"Serial write failed: {e}")
+                if self.on_write_error:
+                    self.on_write_error(futures, e)
+
+    def _cancel_all(self):
+        while not self._queue.empty():
+            future = self._queue.get_nowait()[3]
+            if future is not None:
+                future.cancel()
@@ -1,8 +1,27 @@
+import json
 import math
+import threading
 import time
 
+import os
+
+import numpy as np
+
+import accelerogram
+import campaign
+import compensation
+import feasibility
+import loop_compressor
+import metrics
+import run_recorder
+import synthetic_motion
+import trajectory_planner
+import waveform_compiler
 from config import Config
-from pico_link import PicoLink
+from pico_link import PicoLink, describe_command
+from profile_cache import ProfileCache, commands_key, profile_key
+from stream_player import StreamPlayer
+from telemetry import TelemetryBuffer
 from logger import Logger
 
 # Initialize the logger
@@ -45,15 +64,61 @@ def _calculate_slew_speed(freq, a_max_steps, D_steps):
 
     return slew_speed_steps, None
 
+
+def _compile_manual(freq, displacement):
+    """
+    Builds the forward and backward moves of a manual routine.
+
+    :return: Two-row array of waveform_compiler.COMMAND_DTYPE.
+    :raises ValueError: If the motion needs more than MAX_ACCELERATION.
+    """
+    # Convert displacement to steps
+    steps = int(displacement * Config.STEPS_PER_MM)
+
+    # Acceleration in mm/s² - convert to steps/s²
+    a_max_steps = Config.MAX_ACCELERATION * Config.STEPS_PER_MM  # steps/s²
+
+    # Calculate slew speed
+    slew_speed_steps, error_msg = _calculate_slew_speed(
+        freq, a_max_steps, steps
+    )
+    if error_msg:
+        raise ValueError(error_msg)
+
+    batch = np.zeros(2, dtype=waveform_compiler.COMMAND_DTYPE)
+    batch['speed'] = int(slew_speed_steps)
+    batch['accel'] = int(a_max_steps)
+    batch['steps'] = steps
+    batch['direction'] = [0, 1]
+    batch['duration'] = 1 / (2 * freq)
+    batch['feasible'] = True
+    return batch
+
+
 class ShakeTableController:
-    def __init__(self, queue=None):
+    def __init__(self, queue=None, port=None, table_id=None):
         """
         Initialize the Shake Table Controller.
         :param queue: Message queue for status updates
+        :param port: Serial port of the table's Pico (default: Config.COM_PORT)
+        :param table_id: Name of the table when several are connected
         """
         self.conn = None
+        self.port = port or Config.COM_PORT
+        self.table_id = table_id
         self.message_queue = queue
         self.last_status = None
+        self.profile_cache = ProfileCache()
+        self.loop_body = 0  # longest REPEAT body the firmware runs, 0 without loop support
+        self.stream_player = None
+        self.telemetry = TelemetryBuffer()
+        self.recorder = None
+        self._connect_thread = None
+        self._connect_lock = threading.Lock()
+        self.compensator = None
+        self._compensation_position = 0.0
+        self._compensation_abort = threading.Event()
+        self.campaign = campaign.CampaignScheduler(self)
 
     def update_status(self, status, error_msg=None):
         """Update status and send through message queue if changed"""
@@ -65,16 +130,32 @@ class ShakeTableController:
                     self.message_queue.put(('error', error_msg))
             log.info(f"Status updated to: {status}")
 
+    def publish_progress(self, stage, message):
+        """Publishes a step of connecting as a 'connection' SSE event."""
+        if self.message_queue:
+            self.message_queue.put(('connection', json.dumps({"stage": stage, "message": message})))
+
     def open_connection(self):
         """Opens the connection to the microcontroller."""
         try:
-            self.conn = PicoLink(self.message_queue)
-            self.conn.open()
+            self.publish_progress('opening', f"Opening serial port {self.port}")
+            conn = PicoLink(self.message_queue, port=self.port, on_progress=self.publish_progress)
+            conn.telemetry = self.telemetry
+            conn.open()
 
-            if self.conn.is_connected():
+            if conn.is_connected():
+                # Routes only see the link once the handshake is done
+                self.conn = conn
+                if Config.RECORD_RUNS:
+                    self.start_recording()
+                self.publish_progress('probing', "Probing stored profile slots and loop support")
+                self._probe_profile_slots()
+                self._probe_loops()
                 self.update_status('connected')
+                self.publish_progress('connected', f"Connected to Pico on port {self.port}")
                 return "Connection established."
             else:
+                conn.close()
                 self.update_status('disconnected', "Failed to establish connection")
                 self.conn = None
                 return "Failed to establish connection."
@@ -84,8 +165,180 @@ class ShakeTableController:
             self.conn = None
             return error_msg
 
+    def connect_async(self):
+        """
+        Runs open_connection on a background thread and returns straight
+        away. Progress arrives as 'connection' events, the outcome as a
+        'status' event. Does nothing while a connection attempt is running.
+
+        :return: True if a new attempt was started.
+        """
+        with self._connect_lock:
+            if self._connect_thread is not None and self._connect_thread.is_alive():
+                return False
+            self._connect_thread = threading.Thread(target=self.open_connection,
+                                                    name=f"connect-{self.table_id or self.port}")
+            self._connect_thread.daemon = True
+            self._connect_thread.start()
+            return True
+
+    def connecting(self):
+        """True while a connect_async attempt is running."""
+        return self._connect_thread is not None and self._connect_thread.is_alive()
+
+    def _probe_profile_slots(self):
+        """
+        Asks the firmware how many profiles it can keep for replay. Firmware
+        that does not understand PROFILES leaves replay disabled.
+        """
+        response = self.conn.probe("PROFILES")
+        slots = 0
+        if response and response.startswith("PROFILES "):
+            try:
+                slots = int(response.split()[1])
+            except ValueError:
+                pass
+        self.profile_cache.set_slots(slots)
+        log.info(f"Pico profile slots: {slots or 'not supported'}")
+
+    def _probe_loops(self):
+        """
+        Asks the firmware for the longest block it can REPEAT. Firmware that
+        does not understand LOOPS is sent batches uncompressed.
+        """
+        response = self.conn.probe("LOOPS")
+        body = 0
+        if response and response.startswith("LOOPS "):
+            try:
+                body = int(response.split()[1])
+            except ValueError:
+                pass
+        self.loop_body = body
+        log.info(f"Pico loop body: {body or 'not supported'}")
+
+    def _encode_batch(self, batch):
+        """
+        Prepares a COMMAND_DTYPE batch for upload, sending blocks that repeat
+        back to back as REPEAT loops when the firmware runs them.
+
+        :return: (the batch itself or, when loop compressed, a list of command strings;
+                  compression stats or None when sent as is)
+        """
+        if not (Config.LOOP_COMPRESSION and self.loop_body):
+            return batch, None
+        program = loop_compressor.compress(batch, max_period=min(self.loop_body, Config.LOOP_MAX_PERIOD))
+        metrics.LOOP_COMPRESSION.observe(program.ratio)
+        if not program.loops:
+            return batch, None
+        if not program.runs(batch):
+            log.error("Loop compression does not reproduce the batch, sending it uncompressed")
+            return batch, None
+        return program.commands(), program.stats()
+
+    def start_recording(self, metadata=None):
+        """Starts recording commands, replies, events and telemetry to a new run directory."""
+        self.stop_recording()
+        metadata = dict(metadata or {})
+        metadata.setdefault("port", self.port)
+        metadata.setdefault("steps_per_mm", float(Config.STEPS_PER_MM))
+        path = None
+        if self.table_id:
+            # Tables connected together must not share a run directory
+            metadata.setdefault("table", self.table_id)
+            path = os.path.join(Config.RUN_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{self.table_id}")
+        self.recorder = run_recorder.RunRecorder(path, metadata=metadata)
+        self.telemetry.recorder = self.recorder
+        if self.conn:
+            self.conn.recorder = self.recorder
+        return self.recorder.path
+
+    def stop_recording(self):
+        """Finishes the current recording, if any."""
+        recorder, self.recorder = self.recorder, None
+        if recorder is None:
+            return None
+        self.telemetry.recorder = None
+        if self.conn:
+            self.conn.recorder = None
+        recorder.close()
+        return recorder.path
+
+    def replay_run(self, name, speed=1.0):
+        """
+        Re-sends the commands of a recorded run with the timing they were
+        originally sent with.
+
+        :param name: Run directory name in Config.RUN_DIR.
+        :param speed: Playback rate, 1.0 for the recorded timing.
+        """
+        if self.conn is None:
+            error_msg = "Connection not established. Ensure table is connected."
+            return {"status": "error", "message": error_msg}
+        try:
+            path = os.path.join(Config.RUN_DIR, os.path.basename(name))
+            if self.recorder is not None and os.path.abspath(self.recorder.path) == os.path.abspath(path):
+                return {"status": "error", "message": "Cannot replay the run that is being recorded."}
+            reader = run_recorder.RunReader(path)
+            stats = run_recorder.replay(reader, self.conn, speed=speed)
+            log.info(f"Replayed run {name}: {stats}")
+            if stats["failed"]:
+                error_msg = f"Replay of {name}: {stats['failed']}/{stats['sent']} commands failed"
+                return {"status": "error", "message": error_msg, "stats": stats}
+            return {"status": "success", "message": f"Replayed {stats['sent']} commands from {name}.", "stats": stats}
+        except Exception as e:
+            error_msg = f"Failed to replay run: {e}"
+            return {"status": "error", "message": error_msg}
+
+    def _preflight(self, batch):
+        """
+        Checks a compiled batch against the table limits before anything is sent.
+
+        :return: Error response if the batch must not run, otherwise None.
+        """
+        report = feasibility.analyze(batch)
+        if not report["feasible"]:
+            error_msg = f"Movement rejected: {feasibility.summarize(report)}"
+            log.error(error_msg)
+            return {"status": "error", "message": error_msg}
+        if any(report["infeasible"].values()):
+            log.warning(f"Movement will run late or hot: {feasibility.summarize(report)}")
+        return None
+
+    def _waveform_batch(self, displacement, frequency, duration, percent_damped=0):
+        """Compiled and planned damped cosine, from the profile cache when possible."""
+        key = profile_key('waveform', displacement=displacement, frequency=frequency,
+                          duration=duration, percent_damped=percent_damped)
+        batch = self.profile_cache.get_or_compile(
+            key,
+            lambda: trajectory_planner.plan_batch(
+                waveform_compiler.compile_waveform(displacement, frequency, duration, percent_damped)
+            )
+        )
+        return batch, key
+
+    def _commands_batch(self, commands):
+        """Planned "MOVE ..." strings, from the profile cache when possible."""
+        key = profile_key('commands', commands=commands_key(commands))
+        return self.profile_cache.get_or_compile(key, lambda: trajectory_planner.plan_commands(commands)), key
+
+    def check_movement(self, waveform=None, commands=None):
+        """
+        Compiles a waveform or plans commands like run_waveform / run_commands
+        and returns the feasibility report without sending anything.
+        """
+        try:
+            if waveform is not None:
+                batch = trajectory_planner.plan_batch(waveform_compiler.compile_waveform(*waveform))
+            else:
+                batch = trajectory_planner.plan_commands(commands)
+            return {"status": "success", "report": feasibility.analyze(batch)}
+        except Exception as e:
+            error_msg = f"Failed to check movement: {e}"
+            return {"status": "error", "message": error_msg}
+
     def close_connection(self):
         """Closes the connection to the microcontroller."""
+        self.stop_recording()
         if self.conn:
             self.conn.close()
             self.conn = None
@@ -100,31 +353,27 @@ class ShakeTableController:
             return {"status": "error", "message": error_msg}
 
         try:
-
-            # Convert displacement to steps
-            steps = int(displacement * Config.STEPS_PER_MM)
-
-            # Acceleration in mm/s² - convert to steps/s²
-            a_max_steps = Config.MAX_ACCELERATION * Config.STEPS_PER_MM  # steps/s²
-
-            # Calculate slew speed
-            slew_speed_steps, error_msg = _calculate_slew_speed(
-                freq, a_max_steps, steps
-            )
-
-            if error_msg:
+            key = profile_key('manual', freq=freq, displacement=displacement)
+            try:
+                batch = self.profile_cache.get_or_compile(key, lambda: _compile_manual(freq, displacement))
+            except ValueError as e:
+                error_msg = str(e)
                 log.error(error_msg)
                 return {"status": "error", "message": error_msg}
+            rejected = self._preflight(batch)
+            if rejected:
+                return rejected
 
             # Format commands with integer values
-            forwardCMD = f"{int(slew_speed_steps)} {int(a_max_steps)} {steps} 0"
-            backwardCMD = f"{int(slew_speed_steps)} {int(a_max_steps)} {steps} 1"
+            forward, backward = batch[0], batch[1]
+            forwardCMD = f"{forward['speed']} {forward['accel']} {forward['steps']} {forward['direction']}"
+            backwardCMD = f"{backward['speed']} {backward['accel']} {backward['steps']} {backward['direction']}"
 
-            log.info(f"Forward command: {forwardCMD}")
-            log.info(f"Backward command: {backwardCMD}")
+            log.debug("Forward command: %s", forwardCMD)
+            log.debug("Backward command: %s", backwardCMD)
 
             response = self.conn.send(f"MANUAL {forwardCMD} {backwardCMD}\n")
-            log.info(f"Manual routine response: {response}")
+            log.info("Manual routine response: %s", response)
             return {
                 "status": "success",
                 "message": f"Manual routine started. Response: {response}"
@@ -133,36 +382,397 @@ class ShakeTableController:
             error_msg = f"Failed to start manual routine: {e}"
             return {"status": "error", "message": error_msg}
 
-    def send_movement_data(self, command_batch):
-        """Sends a batch of movement commands to the microcontroller."""
+    def send_movement_data(self, command_batch, window=None, key=None):
+        """
+        Sends a batch of movement commands to the microcontroller.
+
+        Batches already stored on the Pico are replayed by slot instead of
+        being uploaded again. A COMMAND_DTYPE batch is loop compressed when
+        the firmware supports it (see _encode_batch).
+
+        :param command_batch: List of "MOVE speed accel steps dir" strings, or a COMMAND_DTYPE batch.
+        :param window: Commands kept in flight during upload (default: Config.UPLOAD_WINDOW).
+                       A window of 1 sends each command and waits for its reply.
+        :param key: Profile cache key of the batch (default: hash of the commands).
+        """
         if self.conn is None:
             error_msg = "Connection not established. Ensure table is connected."
             return {"status": "error", "message": error_msg}
         try:
+            window = Config.UPLOAD_WINDOW if window is None else window
+            key = key or commands_key(command_batch)
+            start = time.perf_counter()
+            slot = self.profile_cache.resident_slot(key)
+            if slot is not None:
+                response = self.conn.send(f"PLAY {slot}")
+                if response == self.conn.ack:
+                    metrics.UPLOAD.observe(time.perf_counter() - start, 'replay')
+                    log.info(f"Replaying batch of {len(command_batch)} commands from Pico slot {slot}")
+                    return {"status": "success", "message": f"Batch of {len(command_batch)} commands replayed."}
+                log.warning(f"Replay from slot {slot} failed ({response}), uploading again")
+                self.profile_cache.forget_slot(key)
+
+            compression = None
+            if isinstance(command_batch, np.ndarray):
+                command_batch, compression = self._encode_batch(command_batch)
+                if compression:
+                    log.info("Loop compressed %d moves into %d commands (%.1fx)",
+                             compression["moves"], compression["sent"], compression["ratio"])
+
+            slot = self.profile_cache.assign_slot(key)
+            if slot is not None:
+                self.conn.send(f"STORE {slot}")
+
             batch_size_command = f"BATCH_SIZE {len(command_batch)}"
-            log.info(f"Sending batch size: {batch_size_command}")
-            self.conn.send(batch_size_command + '\n')
+            log.debug("Sending batch size: %s", batch_size_command)
 
-            for i, command in enumerate(command_batch):
-                response = self.conn.send(command + '\n')
-                if response is None:
-                    error_msg = f"Failed to send command {i + 1}/{len(command_batch)}: {command}"
+            mode = 'pipelined' if window > 1 else 'sequential'
+            if window > 1:
+                # BATCH_SIZE goes with the batch, so a failed command restarts the batch instead of reordering it
+                failed = self.conn.send_pipelined(command_batch, window=window, announce=[batch_size_command])
+                if failed:
+                    self.profile_cache.forget_slot(key)
+                    error_msg = (
+                        f"Failed to send {len(failed)}/{len(command_batch)} commands, "
+                        f"first failure at command {failed[0] + 1}: {describe_command(command_batch, failed[0])}"
+                    )
                     log.error(error_msg)
                     return {"status": "error", "message": error_msg}
-                time.sleep(0.01)
+                log.info("Pipelined upload of %d commands took %.3fs", len(command_batch), time.perf_counter() - start)
+            else:
+                if isinstance(command_batch, np.ndarray):
+                    command_batch = waveform_compiler.to_commands(command_batch)
+                self.conn.send(batch_size_command + '\n')
+                for i, command in enumerate(command_batch):
+                    response = self.conn.send(command + '\n')
+                    if response is None:
+                        self.profile_cache.forget_slot(key)
+                        error_msg = f"Failed to send command {i + 1}/{len(command_batch)}: {command}"
+                        log.error(error_msg)
+                        return {"status": "error", "message": error_msg}
+                    time.sleep(0.01)
 
+            metrics.UPLOAD.observe(time.perf_counter() - start, mode)
+            metrics.UPLOAD_COMMANDS.inc(len(command_batch), mode)
             log.info(f"Successfully sent batch of {len(command_batch)} commands")
+            if compression:
+                return {"status": "success", "compression": compression,
+                        "message": f"Batch of {compression['moves']} moves sent as {len(command_batch)} commands."}
             return {"status": "success", "message": f"Batch of {len(command_batch)} commands sent."}
         except Exception as e:
             error_msg = f"Failed to send movement data: {e}"
             return {"status": "error", "message": error_msg}
 
+    def run_waveform(self, displacement, frequency, duration, percent_damped=0):
+        """
+        Compiles the damped cosine server-side and uploads it as a movement batch.
+
+        :param displacement: Peak displacement in mm.
+        :param frequency: Frequency in Hz.
+        :param duration: Length of the motion in s.
+        :param percent_damped: Amplitude lost by the end of the motion, 0-99 %.
+        """
+        if self.conn is None:
+            error_msg = "Connection not established. Ensure table is connected."
+            return {"status": "error", "message": error_msg}
+        try:
+            batch, key = self._waveform_batch(displacement, frequency, duration, percent_damped)
+            rejected = self._preflight(batch)
+            if rejected:
+                return rejected
+            log.info(f"Compiled waveform into {len(batch)} segments")
+            return self.send_movement_data(batch, key=key)
+        except Exception as e:
+            error_msg = f"Failed to compile waveform: {e}"
+            return {"status": "error", "message": error_msg}
+
+    def run_record(self, path, fmt=None, dt=None, units=None):
+        """
+        Replays a recorded earthquake from an AT2, CSV or binary accelerogram.
+
+        The record is converted to displacement (or loaded from the motion
+        cache), scaled to the table limits and uploaded as a movement batch.
+        """
+        if self.conn is None:
+            error_msg = "Connection not established. Ensure table is connected."
+            return {"status": "error", "message": error_msg}
+        try:
+            stat = os.stat(path)
+            key = profile_key('record', path=os.path.abspath(path), size=stat.st_size,
+                              mtime=stat.st_mtime_ns, fmt=fmt, dt=dt, units=units,
+                              sample_rate=Config.RECORD_SAMPLE_RATE,
+                              max_displacement=Config.MAX_DISPLACEMENT)
+
+            def compile_record():
+                motion = accelerogram.load(path, fmt=fmt, dt=dt, units=units)
+                log.info(f"Record {path}: {motion.duration:.1f}s at scale {motion.scale:.3f}")
+                return trajectory_planner.plan_batch(
+                    waveform_compiler.compile_displacement(motion.scaled(), motion.sample_rate, start=0.0)
+                )
+
+            batch = self.profile_cache.get_or_compile(key, compile_record)
+            log.info(f"Record {path} compiled into {len(batch)} segments")
+            rejected = self._preflight(batch)
+            if rejected:
+                return rejected
+            return self.send_movement_data(batch, key=key)
+        except Exception as e:
+            error_msg = f"Failed to load record: {e}"
+            return {"status": "error", "message": error_msg}
+
+    def run_synthetic(self, duration, spectrum=None, seed=None):
+        """
+        Generates a ground motion matching a design response spectrum (see
+        synthetic_motion.generate), scaled to the table limits, and uploads
+        it like a record.
+
+        :param duration: Length of the motion in s.
+        :param spectrum: Target spectrum, see synthetic_motion.target_spectrum.
+        :param seed: Seed of the random phases, the same seed gives the same motion and is cached.
+        :return: Response dict with the matching report under "synthetic", only the seed when cached.
+        """
+        if self.conn is None:
+            error_msg = "Connection not established. Ensure table is connected."
+            return {"status": "error", "message": error_msg}
+        try:
+            key = batch = None
+            if seed is not None:
+                # Everything the motion depends on, so a cached one is not generated again
+                settings = {name: getattr(Config, name) for name in dir(Config) if name.startswith('SYNTH_')}
+                key = profile_key('synthetic', duration=float(duration), spectrum=spectrum, seed=int(seed),
+                                  settings=settings, sample_rate=Config.RECORD_SAMPLE_RATE,
+                                  max_displacement=Config.MAX_DISPLACEMENT)
+                batch = self.profile_cache.get(key)
+            if batch is not None:
+                report = {"seed": int(seed), "cached": True}
+            else:
+                start = time.perf_counter()
+                motion, report = synthetic_motion.generate(duration, spectrum=spectrum, seed=seed)
+                log.info(f"Generated {motion.duration:.1f}s synthetic motion in {time.perf_counter() - start:.3f}s")
+                batch = trajectory_planner.plan_batch(
+                    waveform_compiler.compile_displacement(motion.scaled(), motion.sample_rate, start=0.0)
+                )
+                # A random seed is not asked for again, so its motion stays out of the cache
+                if key is not None:
+                    self.profile_cache.put(key, batch)
+            rejected = self._preflight(batch)
+            if rejected:
+                return rejected
+            response = self.send_movement_data(batch, key=key)
+            if response["status"] == "success":
+                response["synthetic"] = report
+            return response
+        except Exception as e:
+            error_msg = f"Failed to generate synthetic motion: {e}"
+            return {"status": "error", "message": error_msg}
+
+    def run_commands(self, commands):
+        """
+        Plans and uploads preformatted "MOVE ..." strings, or the
+        COMMAND_DTYPE batch of a typed upload (see upload_format).
+
+        Consecutive moves in the same direction are merged, so a trace sent
+        as one move per point runs without stopping at every point.
+        """
+        if self.conn is None:
+            error_msg = "Connection not established. Ensure table is connected."
+            return {"status": "error", "message": error_msg}
+        try:
+            batch, key = self._commands_batch(commands)
+            rejected = self._preflight(batch)
+            if rejected:
+                return rejected
+            log.info(f"Planned {len(commands)} commands into {len(batch)} segments")
+            return self.send_movement_data(batch, key=key)
+        except Exception as e:
+            error_msg = f"Failed to plan commands: {e}"
+            return {"status": "error", "message": error_msg}
+
+    def arm_movement(self, waveform=None, commands=None, window=None):
+        """
+        Uploads a waveform or commands like run_waveform / run_commands, except
+        for the last command. The Pico starts a batch once all of it has
+        arrived, so the movement begins when that command is sent, which
+        TableRegistry.start_synchronized does on several tables at once.
+
+        :param waveform: (displacement, frequency, duration, percent_damped) tuple.
+        :param commands: "MOVE ..." strings, used when no waveform is given.
+        :return: Response dict; on success "trigger" holds the command that starts the movement.
+        """
+        if self.conn is None:
+            error_msg = "Connection not established. Ensure table is connected."
+            return {"status": "error", "message": error_msg}
+        try:
+            if waveform is not None:
+                batch, _ = self._waveform_batch(*waveform)
+            else:
+                batch, _ = self._commands_batch(commands)
+            rejected = self._preflight(batch)
+            if rejected:
+                return rejected
+            if not len(batch):
+                return {"status": "error", "message": "Movement has no commands."}
+
+            # Stored profiles start on PLAY, so armed batches are always uploaded
+            failed = self.conn.send_pipelined(batch[:-1], window=window or Config.UPLOAD_WINDOW,
+                                              announce=[f"BATCH_SIZE {len(batch)}"])
+            if failed:
+                error_msg = f"Failed to arm {len(failed)}/{len(batch)} commands"
+                log.error(error_msg)
+                return {"status": "error", "message": error_msg}
+            log.info("Armed batch of %d commands", len(batch))
+            return {"status": "success", "message": f"Batch of {len(batch)} commands armed.",
+                    "trigger": describe_command(batch, len(batch) - 1)}
+        except Exception as e:
+            error_msg = f"Failed to arm movement: {e}"
+            return {"status": "error", "message": error_msg}
+
+    def disarm_movement(self):
+        """Discards a batch armed by arm_movement, so its trigger can no longer start it."""
+        if self.conn is None:
+            error_msg = "Connection not established. Ensure table is connected."
+            return {"status": "error", "message": error_msg}
+        response = self.conn.send("BATCH_SIZE 0")
+        if response != self.conn.ack:
+            error_msg = f"Failed to disarm movement: {response}"
+            log.error(error_msg)
+            return {"status": "error", "message": error_msg}
+        return {"status": "success", "message": "Movement disarmed."}
+
+    def prepare_compensation(self, waveform=None, record=None):
+        """
+        Builds the learning controller for a new compensation target without
+        touching the current one. run_compensation starts learning from
+        scratch with it.
+
+        :param waveform: (displacement, frequency, duration, percent_damped) tuple.
+        :param record: {"path", "format", "dt", "units"} of an accelerogram, used when no waveform is given.
+        """
+        try:
+            if waveform is not None:
+                _, target = waveform_compiler.damped_cosine(*waveform)
+                sample_rate = 1000
+            else:
+                motion = accelerogram.load(record["path"], fmt=record.get("format"), dt=record.get("dt"),
+                                           units=record.get("units"))
+                target, sample_rate = motion.scaled(), motion.sample_rate
+            compensator = compensation.IterativeLearningController(target, sample_rate)
+            return {"status": "success", "message": "Compensation target ready.", "compensator": compensator}
+        except Exception as e:
+            error_msg = f"Failed to set compensation target: {e}"
+            return {"status": "error", "message": error_msg}
+
+    def _compensation_command_batch(self):
+        """The current corrected command, compiled from where the last run left the table."""
+        compensator = self.compensator
+        batch = trajectory_planner.plan_batch(waveform_compiler.compile_displacement(
+            compensator.command, compensator.sample_rate, start=self._compensation_position
+        ))
+        return batch
+
+    def run_compensation(self, iterations=None, learn=True, compensator=None):
+        """
+        Runs the corrected command of the current compensation target,
+        learning from the telemetry of each run.
+
+        Each run is uploaded through send_movement_data, then the telemetry
+        from the start of the upload until Config.ILC_SETTLE after the
+        motion is handed to the learning controller, which corrects the
+        command for the next run. Progress is published as 'compensation'
+        events. STOP aborts the remaining runs.
+
+        :param iterations: Number of runs (default: Config.ILC_ITERATIONS).
+        :param learn: False runs the corrected command once without learning.
+        :param compensator: New target from prepare_compensation, replaces the current one.
+        """
+        if self.conn is None:
+            error_msg = "Connection not established. Ensure table is connected."
+            return {"status": "error", "message": error_msg}
+        if compensator is not None:
+            self.compensator = compensator
+            self._compensation_position = 0.0
+            log.info(f"Compensating a {compensator.duration:.1f}s target at {compensator.sample_rate:g} Hz")
+        if self.compensator is None:
+            return {"status": "error", "message": "No compensation target set."}
+        iterations = (Config.ILC_ITERATIONS if iterations is None else iterations) if learn else 1
+        self._compensation_abort.clear()
+        try:
+            for _ in range(iterations):
+                batch = self._compensation_command_batch()
+                rejected = self._preflight(batch)
+                if rejected:
+                    return rejected
+                index = self.telemetry.count
+                start = time.perf_counter()
+                response = self.send_movement_data(batch)
+                if response["status"] == "error":
+                    return response
+                uploaded = time.perf_counter() - start
+                self._compensation_position = float(self.compensator.command[-1])
+                if self._compensation_abort.wait(self.compensator.duration + Config.ILC_SETTLE):
+                    return {"status": "error", "message": "Compensation stopped."}
+                if not learn:
+                    break
+
+                _, times, positions = self.telemetry.since(index)
+                if len(times) < 2:
+                    return {"status": "error", "message": "No telemetry received during the run, cannot compensate."}
+                learn_start = time.perf_counter()
+                stats = self.compensator.update(times, positions, max_delay=Config.ILC_MAX_DELAY + uploaded)
+                log.info("Compensation run %d: RMS error %.3f mm, learned in %.3fs",
+                         stats["iteration"], stats["rms_error"], time.perf_counter() - learn_start)
+                if self.message_queue:
+                    self.message_queue.put(('compensation', json.dumps(stats)))
+            history = self.compensator.history
+            message = (f"Compensated over {len(history)} runs, RMS error {history[-1]['rms_error']:.3f} mm."
+                       if learn and history else "Compensated command sent.")
+            return {"status": "success", "message": message, "compensation": self.compensator.status()}
+        except Exception as e:
+            error_msg = f"Failed to run compensation: {e}"
+            return {"status": "error", "message": error_msg}
+
+    def start_stream(self, producer):
+        """
+        Streams commands from `producer` with flow control, for profiles that
+        do not fit in the Pico's memory. Returns once streaming has started.
+
+        :param producer: Iterable of "MOVE ..." strings, may be unbounded.
+        """
+        if self.conn is None:
+            error_msg = "Connection not established. Ensure table is connected."
+            return {"status": "error", "message": error_msg}
+        if self.stream_player and self.stream_player.running:
+            return {"status": "error", "message": "A stream is already running."}
+        try:
+            self.stream_player = StreamPlayer(self.conn, producer)
+            return self.stream_player.start()
+        except Exception as e:
+            error_msg = f"Failed to start stream: {e}"
+            return {"status": "error", "message": error_msg}
+
+    def stream_waveform(self, displacement, frequency, duration=None, percent_damped=0):
+        """Streams the damped cosine, indefinitely when duration is None."""
+        return self.start_stream(waveform_compiler.iter_waveform_commands(
+            displacement, frequency, duration, percent_damped
+        ))
+
+    def stream_stats(self):
+        """Returns buffer depth and underrun statistics of the current or last stream."""
+        if self.stream_player is None:
+            return {"status": "error", "message": "No stream has been started."}
+        return {"status": "success", "stats": self.stream_player.stats()}
+
     def stop_table(self):
         """Sends a stop command to the microcontroller."""
         if self.conn is None:
             error_msg = "Connection not established. Ensure table is connected."
             return {"status": "error", "message": error_msg}
         try:
+            if self.stream_player:
+                self.stream_player.stop()
+            self._compensation_abort.set()
+            self.campaign.stop()
+            self.conn.cancel_uploads()
             response = self.conn.send("STOP\n")
             log.info(f"Stop command sent. Response: {response}")
             return {"status": "success", "message": f"Stop command sent. Response: {response}"}
@@ -176,6 +786,7 @@ class ShakeTableController:
             error_msg = "Connection not established. Ensure table is connected."
             return {"status": "error", "message": error_msg}
         try:
+            self.conn.cancel_uploads()
             response = self.conn.send("RESET\n")
             log.info(f"Reset command sent. Response: {response}")
             return {"status": "success", "message": f"Reset command sent. Response: {response}"}
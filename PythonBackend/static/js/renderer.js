@@ -9,6 +9,10 @@ const state = {
         pointsPerSecond: 20,
         windowDuration: 10, timeStep: 0.01
     },
+    telemetry: {
+        origin: null, // Pico time (s) matching animation time 0
+        maxPoints: 4000
+    },
     sliders: {
         freq: 0,
         disp: 0,
@@ -44,6 +48,13 @@ const chartConfig = {
                 pointRadius: 5,
                 pointBackgroundColor: 'rgb(255, 99, 132)',
                 showLine: false
+            },
+            {
+                label: 'Measured',
+                data: [],
+                borderColor: 'rgb(54, 162, 235)',
+                borderWidth: 1,
+                pointRadius: 0
             }
         ]
     },
@@ -102,36 +113,15 @@ const api = {
         }
     },
 
-    convertWaveformToCommands(yData) {
-        const commands = [];
-        let previousPosition = 0;
-        const { stepsPerMm, defaultAcceleration } = state.constants;
-
-        for (let i = 1; i < yData.length; i += 2) { // Skip every other point (down sampling)
-            const positionDiff = yData[i] - previousPosition;
-            const steps = Math.round(positionDiff * stepsPerMm);
-
-            if (Math.abs(steps) < 79) continue; // Skip very small movements
-
-            const direction = steps > 0 ? 1 : 0;
-            const speed = Math.max(1000, Math.round(state.sliders.gs * 1000));
-
-            commands.push(`MOVE ${speed} ${defaultAcceleration} ${Math.abs(steps)} ${direction}`);
-            previousPosition = yData[i];
-        }
-
-        return commands;
-    },
-
     async startMovement() {
-        const numPoints = Math.round(state.sliders.simDuration * state.animation.pointsPerSecond);
-        const lambda = -Math.log(1 - state.sliders.percentDamped / 100) / Math.max(0.1, state.sliders.simDuration);
-
-        const { yData } = chartFunctions.calculateWaveformData(numPoints, 0, lambda, state.sliders);
-        const commands = this.convertWaveformToCommands(yData);
-
+        // The backend samples and compiles the waveform into MOVE commands
         const data = {
-            commands: commands,
+            waveform: {
+                displacement: state.sliders.waveGenDisp,
+                frequency: state.sliders.gs,
+                duration: state.sliders.simDuration,
+                percentDamped: state.sliders.percentDamped
+            },
             parameters: {
                 gs: state.sliders.gs,
                 ga: state.sliders.ga,
@@ -330,6 +320,8 @@ const chartFunctions = {
         } else {
             animation.startTime = null;
             animation.isPaused = false;
+            state.telemetry.origin = null;
+            if (state.chart) state.chart.data.datasets[2].data = [];
         }
         animation.frame = requestAnimationFrame(chartFunctions.update);
     },
@@ -341,6 +333,27 @@ const chartFunctions = {
         }
     },
 
+    addTelemetry(batch) {
+        const { chart, animation, telemetry } = state;
+        if (!chart || !animation.frame || !animation.startTime || batch.t.length === 0) return;
+
+        // Align the Pico clock with the animation clock on the first batch of a run
+        if (telemetry.origin === null) {
+            const elapsedSeconds = (performance.now() - animation.startTime) / 1000;
+            telemetry.origin = batch.t[batch.t.length - 1] - elapsedSeconds;
+        }
+
+        const measured = chart.data.datasets[2].data;
+        for (let i = 0; i < batch.t.length; i++) {
+            const x = batch.t[i] - telemetry.origin;
+            measured.push({ x, y: batch.min[i] });
+            if (batch.max[i] !== batch.min[i]) measured.push({ x, y: batch.max[i] });
+        }
+        if (measured.length > telemetry.maxPoints) {
+            measured.splice(0, measured.length - telemetry.maxPoints);
+        }
+    },
+
     pause() {
         state.animation.isPaused = true;
         state.animation.pauseTime = null;
@@ -469,6 +482,26 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }, 1000);
 
+    // Measured position, batched and min/max decimated by the backend
+    eventSource.addEventListener('telemetry', (event) => {
+        chartFunctions.addTelemetry(JSON.parse(event.data));
+    });
+
+    // Progress of the connection the backend opens in the background
+    eventSource.addEventListener('connection', (event) => {
+        const progress = JSON.parse(event.data);
+        console.log(`Connection ${progress.stage}: ${progress.message}`);
+        document.getElementById('response').innerText = progress.message;
+    });
+
+    // Outcome of an upload the backend ran in the background
+    eventSource.addEventListener('movement', (event) => {
+        const result = JSON.parse(event.data);
+        if (result.status === 'success' && result.message) {
+            document.getElementById('response').innerText = `Response: ${result.message}`;
+        }
+    });
+
     eventSource.addEventListener('limit_triggered', (event) => {
         console.log('Limit triggered event received:', event);
         const message = event.data;
@@ -0,0 +1,207 @@
+# stream_player.py
+import queue
+import threading
+
+from config import Config
+from logger import Logger
+
+# Initialize the logger
+logger = Logger()
+log = logger.get_logger(__name__)
+hot_log = logger.get_hot_path_logger(__name__)
+
+_END = object()
+
+
+class StreamPlayer:
+    """
+    Plays a command stream of any length with credit-based flow control.
+
+    A producer thread pulls commands from a generator into a bounded
+    host-side ring buffer, so host memory stays constant however long the
+    run is. The sender thread tops the Pico up whenever it reports free
+    slots, never sending more than its buffer can hold.
+
+    Firmware protocol:
+        STREAM          -> "STREAM <capacity>", switches the Pico to streaming playback
+        FREE <free> [<executed>]
+                        <- sent by the Pico as moves complete
+        UNDERRUN        <- sent by the Pico when its buffer ran dry mid-stream
+        STREAM END      -> no more commands follow
+    """
+
+    def __init__(self, conn, producer, ring_size=None):
+        """
+        :param conn: Connected PicoLink.
+        :param producer: Iterable of "MOVE ..." command strings, may be unbounded.
+        :param ring_size: Host ring buffer size in commands (default: Config.STREAM_RING_SIZE).
+        """
+        self.conn = conn
+        self.producer = producer
+        self.ring = queue.Queue(maxsize=ring_size or Config.STREAM_RING_SIZE)
+        self.capacity = 0
+        self.sent = 0
+        self.executed = 0
+        self.underruns = 0
+        self.host_starved = 0
+        self.depth_min = None
+        self.depth_max = 0
+        self._depth_sum = 0
+        self._depth_samples = 0
+        self.running = False
+        self.error = None
+        self._credit = threading.Condition()
+        self._stop = threading.Event()
+
+    def start(self):
+        """Switches the Pico to streaming and starts the producer and sender threads."""
+        response = self.conn.send("STREAM")
+        if not response or not response.startswith("STREAM "):
+            return {"status": "error", "message": f"Firmware does not support streaming (response: {response})"}
+        try:
+            self.capacity = int(response.split()[1])
+        except ValueError:
+            return {"status": "error", "message": f"Invalid STREAM reply: {response}"}
+
+        self.running = True
+        self.conn.add_event_listener(self._on_event)
+        for target in (self._fill, self._run):
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+        log.info(f"Streaming started, Pico buffer holds {self.capacity} commands")
+        return {"status": "success", "message": f"Streaming started with a {self.capacity} command buffer."}
+
+    def stop(self):
+        """Stops feeding the Pico. The caller is responsible for sending STOP."""
+        self._stop.set()
+        with self._credit:
+            self._credit.notify_all()
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self.ring.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self):
+        while not self._stop.is_set():
+            try:
+                return self.ring.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return None
+
+    def _fill(self):
+        try:
+            for command in self.producer:
+                if not self._put(command):
+                    return
+        except Exception as e:
+            self.error = f"Producer failed: {e}"
+            log.error(self.error)
+        self._put(_END)
+
+    def _parse_free(self, parts):
+        """(free, executed or None) of a FREE report, None when it is malformed or out of range."""
+        try:
+            free = int(parts[1])
+            executed = int(parts[2]) if len(parts) > 2 else None
+        except (IndexError, ValueError):
+            return None
+        if len(parts) > 3 or not 0 <= free <= self.capacity or (executed is not None and executed < 0):
+            return None
+        return free, executed
+
+    def _on_event(self, message):
+        parts = message.split()
+        if not parts:
+            return
+        if parts[0] == "FREE":
+            report = self._parse_free(parts)
+            if report is None:
+                hot_log.warning("Ignoring malformed flow report: '%s'", message)
+                return
+            free, executed = report
+            with self._credit:
+                if executed is not None:
+                    # The Pico cannot have run more than was sent
+                    self.executed = max(self.executed, min(executed, self.sent))
+                else:
+                    self.executed = max(self.executed, self.sent - (self.capacity - free))
+                depth = self.sent - self.executed
+                self.depth_min = depth if self.depth_min is None else min(self.depth_min, depth)
+                self.depth_max = max(self.depth_max, depth)
+                self._depth_sum += depth
+                self._depth_samples += 1
+                self._credit.notify()
+        elif parts[0] == "UNDERRUN" and self.running:
+            self.underruns += 1
+            hot_log.warning("Pico buffer underrun after %d commands", self.executed)
+
+    def _run(self):
+        finished = False
+        try:
+            while not finished and not self._stop.is_set():
+                with self._credit:
+                    while not self._stop.is_set() and self.capacity - (self.sent - self.executed) <= 0:
+                        self._credit.wait(timeout=1)
+                    credit = self.capacity - (self.sent - self.executed)
+                if self._stop.is_set():
+                    break
+
+                if self.ring.empty():
+                    self.host_starved += 1
+                batch = []
+                item = self._get()
+                if item is None:
+                    break
+                while True:
+                    if item is _END:
+                        finished = True
+                        break
+                    batch.append(item)
+                    if len(batch) >= credit:
+                        break
+                    try:
+                        item = self.ring.get_nowait()
+                    except queue.Empty:
+                        break
+
+                if batch:
+                    with self._credit:
+                        self.sent += len(batch)
+                    failed = self.conn.send_pipelined(batch)
+                    if failed:
+                        self.error = f"Failed to stream {len(failed)} commands"
+                        log.error(self.error)
+                        break
+
+            if finished and not self._stop.is_set():
+                self.conn.send("STREAM END")
+                log.info(f"Stream complete after {self.sent} commands")
+        finally:
+            self.running = False
+            self.conn.remove_event_listener(self._on_event)
+
+    def stats(self):
+        """Returns buffer depth, throughput and underrun statistics."""
+        with self._credit:
+            return {
+                "running": self.running,
+                "error": self.error,
+                "capacity": self.capacity,
+                "sent": self.sent,
+                "executed": self.executed,
+                "pico_depth": self.sent - self.executed,
+                "pico_depth_min": self.depth_min,
+                "pico_depth_max": self.depth_max,
+                "pico_depth_avg": self._depth_sum / self._depth_samples if self._depth_samples else None,
+                "host_ring_depth": self.ring.qsize(),
+                "host_ring_size": self.ring.maxsize,
+                "host_starved": self.host_starved,
+                "underruns": self.underruns,
+            }
@@ -0,0 +1,272 @@
+# synthetic_motion.py
+"""
+Spectrum-compatible synthetic ground motion.
+
+A record is generated by random-phase noise under an amplitude envelope,
+then its Fourier amplitudes are corrected until its pseudo-acceleration
+response spectrum matches a design spectrum. The spectra of every damping
+ratio and period are computed together: the record's FFT is multiplied by
+the transfer functions of all oscillators as one 2-D array and transformed
+back in a single batched irfft, so an iteration costs one batched
+transform however many oscillators there are.
+"""
+import numpy as np
+
+from accelerogram import G, GroundMotion
+from config import Config
+from logger import Logger
+
+# Initialize the logger
+logger = Logger()
+log = logger.get_logger(__name__)
+
+# Damping ratio design spectra are given for, and the one matched
+DESIGN_DAMPING = 0.05
+
+# Free vibration time constants kept after the record so responses do not wrap around
+DECAY_CONSTANTS = 3
+
+
+def _fft_length(n):
+    """Power of two of at least n samples."""
+    return 1 << max(int(n) - 1, 1).bit_length()
+
+
+def default_periods():
+    """Config.SYNTH_PERIOD_COUNT log-spaced periods from SYNTH_MIN_PERIOD to SYNTH_MAX_PERIOD."""
+    return np.geomspace(Config.SYNTH_MIN_PERIOD, Config.SYNTH_MAX_PERIOD, Config.SYNTH_PERIOD_COUNT)
+
+
+def damping_factor(damping):
+    """Scale from a 5 % damped spectrum to other damping ratios (Eurocode 8 eta, at least 0.55)."""
+    return np.maximum(np.sqrt(0.10 / (0.05 + np.asarray(damping, dtype=np.float64))), 0.55)
+
+
+def target_spectrum(periods, spec=None):
+    """
+    5 % damped design pseudo-acceleration in g at `periods`.
+
+    :param spec: Either {"sds", "sd1", "tl"}, the short-period and 1 s
+                 spectral accelerations in g and the long-period transition
+                 in s of an ASCE 7 design spectrum, or {"periods", "sa"}
+                 points interpolated log-log. Missing values default to
+                 Config.SYNTH_SDS, SYNTH_SD1 and SYNTH_TL.
+    """
+    spec = spec or {}
+    periods = np.asarray(periods, dtype=np.float64)
+    if 'periods' in spec or 'sa' in spec:
+        points = np.asarray(spec.get('periods', ()), dtype=np.float64)
+        values = np.asarray(spec.get('sa', ()), dtype=np.float64)
+        if len(points) < 2 or points.shape != values.shape or (points <= 0).any() or (values <= 0).any():
+            raise ValueError("Spectrum needs matching lists of at least two positive periods and sa values")
+        order = np.argsort(points)
+        return np.exp(np.interp(np.log(periods), np.log(points[order]), np.log(values[order])))
+
+    sds = float(spec.get('sds', Config.SYNTH_SDS))
+    sd1 = float(spec.get('sd1', Config.SYNTH_SD1))
+    tl = float(spec.get('tl', Config.SYNTH_TL))
+    if sds <= 0 or sd1 <= 0 or tl <= 0:
+        raise ValueError("sds, sd1 and tl must be positive")
+    ts = sd1 / sds
+    t0 = 0.2 * ts
+    return np.select(
+        [periods < t0, periods <= ts, periods <= tl],
+        [sds * (0.4 + 0.6 * periods / t0), np.full_like(periods, sds), sd1 / np.maximum(periods, 1e-9)],
+        sd1 * tl / periods ** 2,
+    )
+
+
+def envelope(count, sample_rate, rise=None, strong=None):
+    """
+    Amplitude envelope: quadratic build-up over `rise` s, full amplitude
+    for `strong` s, then exponential decay to 1 % at the end.
+
+    :param rise: Build-up time (default: 15 % of the record).
+    :param strong: Strong-motion time (default: 45 % of the record).
+    """
+    times = np.arange(count) / sample_rate
+    duration = count / sample_rate
+    rise = 0.15 * duration if rise is None else rise
+    strong = 0.45 * duration if strong is None else strong
+    decay_start = min(rise + strong, duration)
+    decay = np.log(100) / max(duration - decay_start, 1 / sample_rate)
+    return np.where(times < rise, (times / max(rise, 1e-9)) ** 2,
+                    np.exp(-decay * np.maximum(times - decay_start, 0)))
+
+
+def _band(freqs, low_hz, high_hz):
+    """Cosine-tapered band-pass weights, an octave of taper at each corner."""
+    weights = np.ones(len(freqs))
+    with np.errstate(divide='ignore'):
+        octaves_low = np.log2(np.maximum(freqs, 1e-12) / low_hz)
+        octaves_high = np.log2(high_hz / np.maximum(freqs, 1e-12))
+    weights = np.where(octaves_low < 1, 0.5 - 0.5 * np.cos(np.pi * np.clip(octaves_low, 0, 1)), weights)
+    weights = np.where(octaves_high < 1, weights * (0.5 - 0.5 * np.cos(np.pi * np.clip(octaves_high, 0, 1))),
+                       weights)
+    return weights
+
+
+class ResponseSpectra:
+    """
+    Pseudo-acceleration response spectra of records of one length.
+
+    The transfer functions of every (damping, period) oscillator are
+    computed once for the FFT grid, so each call is one rfft, one
+    elementwise product and one batched irfft. The batch is single
+    precision, which halves its cost and is far finer than any matching
+    tolerance.
+    """
+
+    def __init__(self, count, sample_rate, periods, dampings):
+        """
+        :param count: Samples per record.
+        :param sample_rate: Samples per second.
+        :param periods: Oscillator periods in s.
+        :param dampings: Damping ratios, e.g. (0.02, 0.05, 0.1).
+        """
+        self.count = count
+        self.sample_rate = float(sample_rate)
+        self.periods = np.asarray(periods, dtype=np.float64)
+        self.dampings = np.asarray(dampings, dtype=np.float64)
+        omega = 2 * np.pi / self.periods
+        # The slowest oscillator's free vibration must decay before it wraps around to the start
+        tail = DECAY_CONSTANTS / (self.dampings.min() * omega.min())
+        self.nfft = _fft_length(count + int(tail * self.sample_rate))
+        w = 2 * np.pi * np.fft.rfftfreq(self.nfft, 1 / self.sample_rate)
+
+        wn = omega[None, :, None]
+        zeta = self.dampings[:, None, None]
+        # Relative displacement per unit ground acceleration, scaled by wn² to pseudo-acceleration
+        self.transfer = (-wn ** 2 / (wn ** 2 - w ** 2 + 2j * zeta * wn * w)).reshape(-1, len(w)).astype(np.complex64)
+
+    def __call__(self, accel):
+        """
+        :param accel: Ground acceleration, `count` samples.
+        :return: (len(dampings), len(periods)) pseudo-accelerations in the units of `accel`.
+        """
+        spectrum = np.fft.rfft(accel, self.nfft).astype(np.complex64)
+        response = np.fft.irfft(self.transfer * spectrum, self.nfft, axis=-1)
+        peaks = np.abs(response).max(axis=-1).astype(np.float64)
+        return peaks.reshape(len(self.dampings), len(self.periods))
+
+
+def generate(duration, spectrum=None, seed=None, sample_rate=None, periods=None, dampings=None,
+             iterations=None, tolerance=None, rise=None, strong=None):
+    """
+    Generates a ground motion whose response spectra match a design spectrum.
+
+    Random-phase noise, band-limited to the matched periods, is shaped by
+    the envelope. Each iteration computes the spectra at every damping
+    ratio in one batched pass and scales the Fourier amplitudes at each
+    period by target / achieved at DESIGN_DAMPING, interpolated across
+    frequency. The phases and envelope stay fixed, so a few iterations
+    suffice. The other damping ratios are reported against the design
+    spectrum scaled by damping_factor; one record cannot follow that
+    scaling exactly, so they are not matched.
+
+    The acceleration is integrated twice in the frequency domain and
+    resampled to Config.RECORD_SAMPLE_RATE by zero-padding the spectrum.
+    The displacement is tapered to rest at both ends. Like a loaded record,
+    it is scaled to fit ±MAX_DISPLACEMENT and MAX_ACCELERATION.
+
+    :param duration: Length of the motion in s.
+    :param spectrum: Target spectrum, see target_spectrum.
+    :param seed: Seed of the random phases (default: a new one, returned in the report).
+    :param sample_rate: Rate in Hz spectra are matched at (default: Config.SYNTH_SAMPLE_RATE).
+    :param periods: Matched periods in s (default: default_periods()).
+    :param dampings: Damping ratios of the reported spectra, DESIGN_DAMPING is always included
+                     (default: Config.SYNTH_DAMPINGS).
+    :param iterations: Most correction passes (default: Config.SYNTH_ITERATIONS).
+    :param tolerance: Largest relative spectral error accepted (default: Config.SYNTH_TOLERANCE).
+    :param rise: Envelope build-up time in s, see envelope.
+    :param strong: Envelope strong-motion time in s, see envelope.
+    :return: (GroundMotion, report dict)
+    """
+    duration = float(duration)
+    if duration <= 0:
+        raise ValueError("Synthetic motion needs a positive duration")
+    sample_rate = float(sample_rate or Config.SYNTH_SAMPLE_RATE)
+    periods = np.sort(np.asarray(default_periods() if periods is None else periods, dtype=np.float64))
+    dampings = np.union1d(Config.SYNTH_DAMPINGS if dampings is None else dampings, [DESIGN_DAMPING])
+    iterations = Config.SYNTH_ITERATIONS if iterations is None else int(iterations)
+    tolerance = Config.SYNTH_TOLERANCE if tolerance is None else float(tolerance)
+    if periods[0] * sample_rate < 4:
+        raise ValueError(f"Shortest period {periods[0]:g}s needs a sample rate above {4 / periods[0]:g} Hz")
+    if seed is None:
+        seed = int(np.random.SeedSequence().entropy % 2 ** 32)
+
+    count = int(round(duration * sample_rate))
+    spectra = ResponseSpectra(count, sample_rate, periods, dampings)
+    target = target_spectrum(periods, spectrum)[None, :] * damping_factor(dampings)[:, None]
+    matched = int(np.flatnonzero(dampings == DESIGN_DAMPING)[0])
+
+    nfft = spectra.nfft
+    freqs = np.fft.rfftfreq(nfft, 1 / sample_rate)
+    band = _band(freqs, 0.5 / periods[-1], min(1.5 / periods[0], 0.45 * sample_rate))
+    shape = envelope(count, sample_rate, rise, strong)
+    rng = np.random.default_rng(seed)
+    phases = np.exp(2j * np.pi * rng.random(len(freqs)))
+    amplitude = band.copy()
+    log_freqs = np.log(np.maximum(freqs, 1e-12))
+    log_period_freqs = np.log(1 / periods[::-1])
+
+    def realise(amplitude):
+        return np.fft.irfft(amplitude * phases, nfft)[:count] * shape
+
+    accel = realise(amplitude)
+    achieved = spectra(accel)
+    # Noise of any level: start at the right overall level
+    amplitude *= np.exp(np.mean(np.log(target[matched] / achieved[matched])))
+    accel = realise(amplitude)
+    achieved = spectra(accel)
+    done = 0
+    for done in range(1, iterations + 1):
+        ratio = target[matched] / achieved[matched]
+        amplitude *= np.exp(np.interp(log_freqs, log_period_freqs, np.log(ratio[::-1])))
+        accel = realise(amplitude)
+        achieved = spectra(accel)
+        if np.abs(achieved[matched] / target[matched] - 1).max() <= tolerance:
+            break
+    error = np.abs(achieved[matched] / target[matched] - 1)
+
+    # Displacement in mm from g, double integrated with the band's high-pass and resampled spectrally
+    out_rate = float(Config.RECORD_SAMPLE_RATE)
+    out_nfft = max(2, int(round(nfft * out_rate / sample_rate)))
+    out_rate = out_nfft * sample_rate / nfft
+    w = 2 * np.pi * freqs
+    with np.errstate(divide='ignore', invalid='ignore'):
+        displacement_spectrum = np.where(w > 0, -np.fft.rfft(accel, nfft) * band / w ** 2, 0)
+    displacement = np.fft.irfft(displacement_spectrum, out_nfft) * (out_nfft / nfft) * G
+    displacement = displacement[:int(round(count * out_rate / sample_rate))]
+    taper = min(len(displacement) // 10, int(out_rate))
+    if taper > 1:
+        ramp = 0.5 - 0.5 * np.cos(np.pi * np.arange(taper) / taper)
+        displacement[:taper] *= ramp
+        displacement[-taper:] *= ramp[::-1]
+
+    peak_displacement = float(np.abs(displacement).max()) if len(displacement) else 0.0
+    peak_acceleration = float(np.abs(np.diff(displacement, 2)).max()) * out_rate ** 2 if len(displacement) > 2 else 0.0
+    scale = 1.0
+    if peak_displacement > 0:
+        scale = min(scale, float(Config.MAX_DISPLACEMENT) / peak_displacement)
+    if peak_acceleration > 0:
+        scale = min(scale, float(Config.MAX_ACCELERATION) / peak_acceleration)
+    log.info(f"Synthetic motion: {duration:g}s matched to {error.max():.1%} in {done} iterations, "
+             f"scaled by {scale:.3f} to fit the table")
+
+    motion = GroundMotion(displacement.astype(np.float32), out_rate, scale, peak_displacement, peak_acceleration,
+                          f"synthetic:{seed}")
+    report = {
+        "seed": seed,
+        "iterations": done,
+        "converged": bool(error.max() <= tolerance),
+        "max_error": float(error.max()),
+        "mean_error": float(error.mean()),
+        "scale": scale,
+        "pga": float(np.abs(accel).max()),
+        "periods": periods.tolist(),
+        "dampings": dampings.tolist(),
+        "target": target.tolist(),
+        "achieved": achieved.tolist(),
+    }
+    return motion, report
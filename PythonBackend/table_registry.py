@@ -0,0 +1,222 @@
+# table_registry.py
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import serial.tools.list_ports
+
+from config import Config
+from shake_table_controller import ShakeTableController
+from logger import Logger
+
+# Initialize the logger
+logger = Logger()
+log = logger.get_logger(__name__)
+
+
+def _table_id(text):
+    """URL-safe table ID from a USB serial number or port name."""
+    return re.sub(r'[^A-Za-z0-9_-]', '_', text)
+
+
+def discover_tables():
+    """
+    Finds the tables to control.
+
+    Config.TABLE_PORTS lists them explicitly. Otherwise every serial port
+    whose USB vendor ID is Config.PICO_USB_VID is a table, identified by the
+    Pico's USB serial number so its ID survives being plugged into another
+    port. Without either, the single Config.COM_PORT table is used.
+
+    :return: List of (table ID, port) tuples.
+    """
+    ports = [port.strip() for port in Config.TABLE_PORTS.split(',') if port.strip()]
+    if ports:
+        return [(_table_id(os.path.basename(port)), port) for port in ports]
+    found = sorted(
+        (port for port in serial.tools.list_ports.comports() if port.vid == Config.PICO_USB_VID),
+        key=lambda port: port.device
+    )
+    if found:
+        return [(_table_id(port.serial_number or os.path.basename(port.device)), port.device) for port in found]
+    return [(_table_id(os.path.basename(Config.COM_PORT)), Config.COM_PORT)]
+
+
+class TableQueue:
+    """
+    Message queue of one table among several. Events are published with the
+    table ID appended to their type, e.g. 'status:E6614C311B4C2D37'.
+    """
+
+    def __init__(self, queue, table_id):
+        self.queue = queue
+        self.table_id = table_id
+
+    def put(self, message):
+        event_type, data = message
+        self.queue.put((f"{event_type}:{self.table_id}", data))
+
+
+class TableRegistry:
+    """
+    One ShakeTableController per connected Pico.
+
+    Each controller has its own PicoLink, so every table has its own
+    listener thread and serial writer and a slow table never holds up
+    another. The first table found is the default one: it keeps publishing
+    plain SSE event types and serves the routes without a table ID.
+    """
+
+    def __init__(self, queue=None):
+        self.message_queue = queue
+        self._tables = {}
+        self._lock = threading.Lock()
+        self.default_id = None
+        self.refresh()
+
+    def refresh(self):
+        """Adds tables that appeared since the last discovery; known tables are kept."""
+        added = []
+        with self._lock:
+            for table_id, port in discover_tables():
+                if table_id in self._tables:
+                    continue
+                if self.default_id is None:
+                    self.default_id = table_id
+                    queue = self.message_queue
+                else:
+                    queue = TableQueue(self.message_queue, table_id) if self.message_queue else None
+                self._tables[table_id] = ShakeTableController(queue=queue, port=port, table_id=table_id)
+                added.append(table_id)
+        if added:
+            log.info(f"Tables found: {', '.join(added)}")
+        return added
+
+    def get(self, table_id=None):
+        """Controller of `table_id`, or of the default table when None; None if unknown."""
+        with self._lock:
+            return self._tables.get(self.default_id if table_id is None else table_id)
+
+    def default(self):
+        return self.get()
+
+    def controllers(self):
+        """(table ID, controller) pairs, default table first."""
+        with self._lock:
+            return list(self._tables.items())
+
+    def tables(self):
+        """Description of every table for the /tables route."""
+        return [
+            {
+                "id": table_id,
+                "port": controller.port,
+                "default": table_id == self.default_id,
+                "connected": bool(controller.conn and controller.conn.is_connected()),
+                "connecting": controller.connecting(),
+            }
+            for table_id, controller in self.controllers()
+        ]
+
+    def open_all(self):
+        """Connects every table at once, returns {table ID: result}."""
+        controllers = self.controllers()
+        if not controllers:
+            return {}
+        with ThreadPoolExecutor(len(controllers)) as executor:
+            results = executor.map(lambda item: item[1].open_connection(), controllers)
+            return {table_id: result for (table_id, _), result in zip(controllers, results)}
+
+    def connect_all_async(self):
+        """Starts connecting every table in the background, see ShakeTableController.connect_async."""
+        for _, controller in self.controllers():
+            controller.connect_async()
+
+    def close_all(self):
+        for _, controller in self.controllers():
+            controller.close_connection()
+
+    def stop_all(self):
+        """Stops every table, returns {table ID: response}."""
+        return {table_id: controller.stop_table() for table_id, controller in self.controllers()}
+
+    def start_synchronized(self, movements, window=None, timeout=5):
+        """
+        Starts movements on several tables together.
+
+        Every table gets its batch uploaded except for the last command
+        (ShakeTableController.arm_movement), all tables at once. Then the
+        serial writers of all tables are parked and the last commands,
+        already encoded, are written back to back from this thread, so the
+        tables start within the time of a few port writes of each other.
+        If that fails, tables already started are stopped and the others
+        disarmed.
+
+        :param movements: {table ID: {"waveform": (displacement, frequency, duration, percent_damped)}
+                           or {"commands": [...]}}
+        :param window: Upload window (default: Config.UPLOAD_WINDOW).
+        :return: Response dict with the host-side start skew in ms.
+        """
+        controllers = []
+        for table_id in movements:
+            controller = self.get(table_id)
+            if controller is None:
+                return {"status": "error", "message": f"Unknown table {table_id}"}
+            if controller.conn is None:
+                return {"status": "error", "message": f"Table {table_id} is not connected"}
+            controllers.append((table_id, controller))
+        if not controllers:
+            return {"status": "error", "message": "No tables to start"}
+
+        with ThreadPoolExecutor(len(controllers)) as executor:
+            armed = list(executor.map(
+                lambda item: item[1].arm_movement(window=window, **movements[item[0]]), controllers
+            ))
+        failed = {table_id: response["message"] for (table_id, _), response in zip(controllers, armed)
+                  if response["status"] == "error"}
+        if failed:
+            for table_id, controller in controllers:
+                if table_id not in failed:
+                    controller.disarm_movement()
+            return {"status": "error", "message": f"Could not arm every table: {failed}"}
+
+        links = [controller.conn for _, controller in controllers]
+        releases = []
+        written = []
+        error = None
+        try:
+            for link in links:
+                releases.append(link.hold_writes())
+            prepared = [link.prepare_held(response["trigger"]) for link, response in zip(links, armed)]
+            for link, (data, future) in zip(links, prepared):
+                link.write_held(data, future)
+                written.append(time.perf_counter())
+        except Exception as e:
+            error = e
+        finally:
+            for release in releases:
+                release.set()
+        if error is not None:
+            # Writers are running again: stop the tables already triggered, disarm the rest
+            for index, (table_id, controller) in enumerate(controllers):
+                if index < len(written):
+                    controller.stop_table()
+                else:
+                    controller.disarm_movement()
+            log.error(f"Synchronized start failed after {len(written)} of {len(controllers)} tables: {error}")
+            return {"status": "error", "message": f"Could not start every table: {error}"}
+
+        skew_ms = (written[-1] - written[0]) * 1e3
+        replies = {}
+        for (table_id, _), (_, future) in zip(controllers, prepared):
+            try:
+                replies[table_id] = future.result(timeout)
+            except Exception as e:
+                replies[table_id] = f"{type(e).__name__}: {e}"
+        log.info(f"Started {len(controllers)} tables with {skew_ms:.3f} ms skew: {replies}")
+        if any(reply != Config.ACK for reply in replies.values()):
+            return {"status": "error", "message": f"Not every table started: {replies}", "skew_ms": skew_ms}
+        return {"status": "success", "message": f"Started {len(controllers)} tables.",
+                "skew_ms": skew_ms, "replies": replies}
@@ -0,0 +1,189 @@
+# telemetry.py
+import json
+import threading
+import time
+
+import numpy as np
+
+from config import Config
+from logger import Logger
+
+# Initialize the logger
+logger = Logger()
+log = logger.get_logger(__name__)
+
+# Binary telemetry frame payload: repeated (time_us u32, position_steps i32) records
+TELEMETRY_DTYPE = np.dtype([('time_us', '<u4'), ('position', '<i4')])
+
+
+class TelemetryBuffer:
+    """
+    Preallocated ring buffer of position samples from the Pico.
+
+    Samples arrive as (time in µs, position in steps) from the listener
+    thread. The Pico's 32-bit microsecond clock is unwrapped into seconds.
+    Readers get windows of the history, either raw or min/max decimated
+    to a fixed number of buckets for plotting.
+    """
+
+    def __init__(self, capacity=None):
+        self.capacity = capacity or Config.TELEMETRY_CAPACITY
+        self.times = np.zeros(self.capacity, dtype=np.float64)
+        self.positions = np.zeros(self.capacity, dtype=np.float32)
+        self.count = 0  # total samples ever written
+        self.rejected = 0  # malformed lines and frames skipped
+        self.recorder = None
+        self._lock = threading.Lock()
+        self._last_raw = None
+        self._wrap_offset = 0
+
+    def _unwrap(self, time_us):
+        time_us = np.asarray(time_us, dtype=np.int64)
+        if self._last_raw is None:
+            self._last_raw = int(time_us[0])
+        steps = np.diff(np.concatenate(([self._last_raw], time_us)))
+        wraps = np.cumsum(steps < -(1 << 31)) << 32
+        unwrapped = time_us + self._wrap_offset + wraps
+        self._wrap_offset += int(wraps[-1])
+        self._last_raw = int(time_us[-1])
+        return unwrapped / 1e6
+
+    def ingest(self, time_us, positions):
+        """Appends samples; time in µs (may wrap at 2³²), position in steps."""
+        n = len(positions)
+        if n == 0:
+            return
+        if self.recorder is not None:
+            self.recorder.telemetry(time_us, positions)
+        with self._lock:
+            times = self._unwrap(time_us)
+            mm = np.asarray(positions, dtype=np.float32) / float(Config.STEPS_PER_MM)
+            if n > self.capacity:
+                times, mm = times[-self.capacity:], mm[-self.capacity:]
+                self.count += n - self.capacity
+                n = self.capacity
+            start = self.count % self.capacity
+            first = min(n, self.capacity - start)
+            self.times[start:start + first] = times[:first]
+            self.positions[start:start + first] = mm[:first]
+            if first < n:
+                self.times[:n - first] = times[first:]
+                self.positions[:n - first] = mm[first:]
+            self.count += n
+
+    def ingest_line(self, line):
+        """
+        Parses a text telemetry line: b"TLM <time_us> <position_steps>".
+
+        :return: False when the line is malformed and was skipped.
+        """
+        parts = line.split()
+        try:
+            time_us, position = int(parts[1]), int(parts[2])
+        except (IndexError, ValueError):
+            time_us = position = None
+        if len(parts) != 3 or time_us is None or not 0 <= time_us < 1 << 32 or not -(1 << 31) <= position < 1 << 31:
+            self.rejected += 1
+            return False
+        self.ingest((time_us,), (position,))
+        return True
+
+    def ingest_frame(self, payload):
+        """
+        Parses a binary telemetry frame payload.
+
+        :return: False when the payload is not whole records and was skipped.
+        """
+        if len(payload) % TELEMETRY_DTYPE.itemsize:
+            self.rejected += 1
+            return False
+        records = np.frombuffer(payload, dtype=TELEMETRY_DTYPE)
+        self.ingest(records['time_us'], records['position'])
+        return True
+
+    def since(self, index):
+        """
+        Returns samples written after sample number `index`.
+
+        :return: (next index, times, positions in mm)
+        """
+        with self._lock:
+            index = max(index, self.count - self.capacity)
+            idx = np.arange(index, self.count) % self.capacity
+            return self.count, self.times[idx], self.positions[idx]
+
+    def latest_time(self):
+        with self._lock:
+            if self.count == 0:
+                return None
+            return float(self.times[(self.count - 1) % self.capacity])
+
+    def _search(self, first, value, side):
+        """
+        Sample number at which `value` seconds would be inserted, found by
+        binary search on the ring as it lies: the older samples run from
+        the write position to the end of the arrays, the newer from 0.
+        """
+        split = first % self.capacity
+        older = self.times[split:split + self.count - first]
+        i = int(np.searchsorted(older, value, side))
+        if i < len(older):
+            return first + i
+        newer = self.times[:self.count - first - len(older)]
+        return first + len(older) + int(np.searchsorted(newer, value, side))
+
+    def window(self, start=None, end=None):
+        """Returns (times, positions) between start and end seconds, in order; only the window is copied."""
+        with self._lock:
+            first = max(0, self.count - self.capacity)
+            lo = first if start is None else self._search(first, start, 'left')
+            hi = self.count if end is None else self._search(first, end, 'right')
+            idx = np.arange(lo, max(lo, hi)) % self.capacity
+            return self.times[idx], self.positions[idx]
+
+    def decimate(self, start=None, end=None, width=800):
+        """
+        Reduces a window to at most `width` buckets with the min and max of
+        each, so peaks survive however far the chart is zoomed out.
+
+        :return: dict with t (bucket start), min and max lists.
+        """
+        times, positions = self.window(start, end)
+        if len(times) <= width:
+            return {"t": times.tolist(), "min": positions.tolist(), "max": positions.tolist()}
+        edges = np.linspace(times[0], times[-1], width + 1)
+        bucket = np.clip(np.searchsorted(edges, times, 'right') - 1, 0, width - 1)
+        starts = np.flatnonzero(np.diff(bucket, prepend=-1))
+        return {
+            "t": edges[bucket[starts]].tolist(),
+            "min": np.minimum.reduceat(positions, starts).tolist(),
+            "max": np.maximum.reduceat(positions, starts).tolist(),
+        }
+
+
+def start_publisher(buffer, broadcaster, interval=None, max_points=None, event_type='telemetry'):
+    """
+    Publishes new telemetry to SSE clients as batched 'telemetry' events,
+    min/max decimated to at most `max_points` per batch.
+    """
+    interval = interval or Config.TELEMETRY_PUBLISH_INTERVAL
+    max_points = max_points or Config.TELEMETRY_BATCH_POINTS
+
+    def publish():
+        index = 0
+        while True:
+            time.sleep(interval)
+            if buffer.count == index or not broadcaster.subscriber_count():
+                index = buffer.count
+                continue
+            index, times, positions = buffer.since(index)
+            if len(times) > max_points:
+                batch = buffer.decimate(times[0], times[-1], max_points // 2)
+            else:
+                batch = {"t": times.tolist(), "min": positions.tolist(), "max": positions.tolist()}
+            broadcaster.publish(event_type, json.dumps(batch), replay=False)
+
+    thread = threading.Thread(target=publish)
+    thread.daemon = True
+    thread.start()
+    return thread
@@ -0,0 +1,54 @@
+"""
+The same record must give the same table motion whatever file format it
+arrives in.
+"""
+import numpy as np
+
+import accelerogram
+
+DT = 0.005
+
+
+def _record():
+    t = np.arange(int(5 / DT)) * DT
+    return t, 0.3 * np.sin(2 * np.pi * 3 * t) * np.minimum(t, 1)
+
+
+def _write_at2(path, accel):
+    with open(path, 'w') as f:
+        f.write("PEER NGA STRONG MOTION DATABASE RECORD\nSYNTHETIC 3 HZ\nACCELERATION TIME SERIES IN UNITS OF G\n")
+        f.write(f"NPTS= {len(accel)}, DT= {DT:.4f} SEC\n")
+        for row in range(0, len(accel), 5):
+            f.write(" ".join(f"{value:.7E}" for value in accel[row:row + 5]) + "\n")
+
+
+def _write_csv(path, t, accel):
+    with open(path, 'w') as f:
+        f.write("time,acceleration\n")
+        for time_s, value in zip(t, accel):
+            f.write(f"{time_s:.4f},{value:.7E}\n")
+
+
+def test_csv_and_at2_give_the_same_motion(tmp_path):
+    t, accel = _record()
+    _write_at2(tmp_path / "record.at2", accel)
+    _write_csv(tmp_path / "record.csv", t, accel)
+
+    at2 = accelerogram.load(str(tmp_path / "record.at2"), cache_dir=str(tmp_path / "cache"))
+    csv = accelerogram.load(str(tmp_path / "record.csv"), cache_dir=str(tmp_path / "cache"))
+
+    assert at2.sample_rate == csv.sample_rate
+    assert len(at2.displacement) == len(csv.displacement)
+    assert np.isclose(at2.scale, csv.scale, rtol=1e-4)
+    np.testing.assert_allclose(csv.displacement, at2.displacement, rtol=1e-4, atol=1e-4)
+
+
+def test_csv_without_time_column_matches_at2(tmp_path):
+    _, accel = _record()
+    _write_at2(tmp_path / "record.at2", accel)
+    np.savetxt(tmp_path / "record.csv", accel, fmt="%.7E")
+
+    at2 = accelerogram.load(str(tmp_path / "record.at2"), cache_dir=str(tmp_path / "cache"))
+    csv = accelerogram.load(str(tmp_path / "record.csv"), dt=DT, cache_dir=str(tmp_path / "cache"))
+
+    np.testing.assert_allclose(csv.displacement, at2.displacement, rtol=1e-4, atol=1e-4)
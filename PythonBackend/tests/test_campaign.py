@@ -0,0 +1,46 @@
+"""
+A queue reloaded after a restart must report itself paused, and cancelling
+one campaign must not cancel a compile another campaign is waiting on.
+"""
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from campaign import QUEUED, CampaignScheduler, expand_sweep
+
+SWEEP = {"displacements": 5, "frequencies": 2, "duration": 1}
+
+
+def _controller():
+    return SimpleNamespace(table_id="t1", message_queue=None, conn=None)
+
+
+def test_reloaded_queue_is_paused(tmp_path):
+    path = tmp_path / "t1.json"
+    campaign, jobs = expand_sweep(SWEEP)
+    path.write_text(json.dumps({"campaigns": {campaign["id"]: campaign}, "jobs": jobs}))
+    scheduler = CampaignScheduler(_controller(), path=str(path))
+    assert scheduler.jobs[0]["state"] == QUEUED
+    assert scheduler.stats()["paused"]
+    assert not scheduler.running
+
+
+def test_cancel_keeps_a_compile_shared_with_another_campaign(tmp_path):
+    scheduler = CampaignScheduler(_controller(), path=str(tmp_path / "t1.json"))
+    scheduler._compile = lambda job: (True, None)
+    # One worker, kept busy so the compiles below stay queued and can be cancelled
+    scheduler._pool = ThreadPoolExecutor(max_workers=1)
+    release = threading.Event()
+    scheduler._pool.submit(release.wait)
+
+    first = scheduler.submit(SWEEP, start=False)
+    scheduler.submit(SWEEP, start=False)
+    other = scheduler.jobs[1]
+    shared = scheduler._compiled[other["id"]]
+    assert shared is scheduler._compiled[scheduler.jobs[0]["id"]]
+
+    assert scheduler.cancel(first["id"]) == 1
+    release.set()
+    assert not shared.cancelled()
+    assert shared.result(timeout=2) == (True, None)
@@ -0,0 +1,86 @@
+"""
+The pre-flight check must name exactly the segments that break each table
+limit, and only the hard limits may stop a batch from running.
+"""
+import numpy as np
+import pytest
+
+import feasibility
+from config import Config
+from waveform_compiler import COMMAND_DTYPE, DIR_NEGATIVE, DIR_POSITIVE
+
+STEPS_PER_MM = float(Config.STEPS_PER_MM)
+A_MAX = float(Config.MAX_ACCELERATION) * STEPS_PER_MM
+
+
+def _batch(count, speed=20000, accel=A_MAX / 4, steps=800):
+    batch = np.zeros(count, dtype=COMMAND_DTYPE)
+    batch['speed'] = speed
+    batch['accel'] = accel
+    batch['steps'] = steps
+    # Back and forth around the centre
+    batch['direction'] = np.where(np.arange(count) % 2, DIR_NEGATIVE, DIR_POSITIVE)
+    batch['duration'] = np.nan
+    batch['feasible'] = True
+    return batch
+
+
+def test_batch_within_limits_passes():
+    report = feasibility.analyze(_batch(100))
+    assert report["feasible"]
+    assert all(indices == [] for indices in report["infeasible"].values())
+    assert feasibility.summarize(report) == "all checks passed"
+
+
+def test_acceleration_limit():
+    batch = _batch(10)
+    batch['accel'][[2, 7]] = A_MAX * 1.5
+    report = feasibility.analyze(batch)
+    assert not report["feasible"]
+    assert report["infeasible"]["acceleration"] == [2, 7]
+    assert report["peak_acceleration"] == 1.5 * float(Config.MAX_ACCELERATION)
+
+
+def test_speed_limit_counts_the_speed_reached():
+    too_fast = (Config.MAX_SPEED + 100) * STEPS_PER_MM
+    batch = _batch(4, accel=A_MAX, steps=40000)
+    batch['speed'][1] = too_fast
+    # Too short to get anywhere near its slew speed
+    batch['speed'][3] = too_fast
+    batch['steps'][3] = 100
+    report = feasibility.analyze(batch)
+    assert report["infeasible"]["speed"] == [1]
+    assert report["peak_speed"] == pytest.approx(Config.MAX_SPEED + 100)
+    assert not report["feasible"]
+
+
+def test_travel_limit_from_the_start_position():
+    limit_steps = int(Config.MAX_DISPLACEMENT * STEPS_PER_MM)
+    batch = _batch(3, steps=limit_steps // 2)
+    batch['direction'] = DIR_POSITIVE
+    assert feasibility.analyze(batch)["infeasible"]["travel"] == [2]
+    assert feasibility.analyze(batch, start=-Config.MAX_DISPLACEMENT)["infeasible"]["travel"] == []
+    report = feasibility.analyze(batch, start=1.0)
+    assert report["infeasible"]["travel"] == [1, 2]
+    assert report["travel"]["max"] == 1.0 + 3 * (limit_steps // 2) / STEPS_PER_MM
+
+
+def test_late_and_hot_segments_are_reported_but_not_fatal():
+    # Triangular moves accelerate the whole time, at full acceleration that overheats within the window
+    count = int(3 * Config.THERMAL_WINDOW / 0.1)
+    batch = _batch(count, speed=10 ** 6, accel=A_MAX, steps=int(A_MAX * 0.05 ** 2))
+    batch['duration'] = 0.1
+    batch['duration'][5] = 0.05
+    report = feasibility.analyze(batch)
+    assert report["feasible"]
+    assert report["infeasible"]["timing"] == [5]
+    assert report["infeasible"]["thermal"]
+    assert report["thermal"]["duty"] == pytest.approx(1.0)
+    assert "thermal exceeded" in feasibility.summarize(report)
+
+
+def test_parse_commands_round_trip():
+    commands = ["MOVE 4000 640000 120 1", "MOVE 5000 320000 80 0"]
+    batch = feasibility.parse_commands(commands)
+    assert batch[['speed', 'accel', 'steps', 'direction']].tolist() == [(4000, 640000, 120, 1), (5000, 320000, 80, 0)]
+    assert np.isnan(batch['duration']).all()
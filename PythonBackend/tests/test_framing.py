@@ -0,0 +1,54 @@
+"""
+Frames must decode to what was encoded, however the bytes are split up on
+the way, and corrupt frames must be dropped without losing the ones after.
+"""
+import numpy as np
+
+import framing
+
+
+def _moves():
+    rng = np.random.default_rng(0)
+    count = 50
+    return (rng.integers(1, 2**32, count), rng.integers(1, 2**32, count),
+            rng.integers(0, 2**31, count), rng.integers(0, 2, count))
+
+
+def test_encode_moves_matches_encode_move():
+    speeds, accels, steps, directions = _moves()
+    data, seqs = framing.encode_moves(0xFFF0, speeds, accels, steps, directions)
+    assert seqs == [(0xFFF0 + i) & 0xFFFF for i in range(len(steps))]
+    assert data == b''.join(framing.encode_move(seq, *move)
+                            for seq, move in zip(seqs, zip(speeds, accels, steps, directions)))
+
+
+def test_moves_round_trip_through_the_decoder_in_any_chunks():
+    speeds, accels, steps, directions = _moves()
+    data, seqs = framing.encode_moves(7, speeds, accels, steps, directions)
+    decoder = framing.FrameDecoder()
+    frames = []
+    for start in range(0, len(data), 5):
+        frames += decoder.feed(data[start:start + 5])
+    assert [frame.seq for frame in frames] == seqs
+    assert all(frame.type == framing.TYPE_MOVE for frame in frames)
+    decoded = [framing.decode_move(frame.payload) for frame in frames]
+    assert decoded == [tuple(int(v) for v in move) for move in zip(speeds, accels, steps, directions)]
+
+
+def test_commands_round_trip():
+    decoder = framing.FrameDecoder()
+    frames = decoder.feed(framing.encode_command(1, "MOVE 4000 640000 120 1")
+                          + framing.encode_command(2, "BATCH_SIZE 10\n"))
+    assert frames[0].type == framing.TYPE_MOVE
+    assert framing.decode_move(frames[0].payload) == (4000, 640000, 120, 1)
+    assert frames[1] == framing.Frame(2, framing.TYPE_TEXT, b"BATCH_SIZE 10")
+
+
+def test_corrupt_frame_is_dropped_and_the_next_one_decoded():
+    good = framing.encode_frame(3, framing.TYPE_ACK)
+    bad = bytearray(framing.encode_frame(2, framing.TYPE_TEXT, b"PING"))
+    bad[-1] ^= 0xFF
+    decoder = framing.FrameDecoder()
+    frames = decoder.feed(b"\x00noise" + bytes(bad) + good)
+    assert frames == [framing.Frame(3, framing.TYPE_ACK, b"")]
+    assert decoder.crc_errors == 1
@@ -0,0 +1,77 @@
+"""
+A malformed line from the Pico must be skipped, never stop the listener
+thread that completes every pending command.
+"""
+import io
+import os
+import time
+
+import pytest
+
+from config import Config
+from pico_emulator import PicoEmulator
+from pico_link import PicoLink
+import serial_reader
+from stream_player import StreamPlayer
+from telemetry import TelemetryBuffer
+
+
+@pytest.fixture
+def link():
+    binary = Config.BINARY_PROTOCOL
+    Config.BINARY_PROTOCOL = False
+    emulator = PicoEmulator()
+    link = PicoLink(port=emulator.start())
+    link.telemetry = TelemetryBuffer(capacity=1024)
+    assert link.open()
+    yield link, emulator
+    link.close()
+    emulator.close()
+    Config.BINARY_PROTOCOL = binary
+
+
+def test_listener_survives_malformed_lines(link):
+    link, emulator = link
+    os.write(emulator._master, b"TLM 12 nope\nTLM 5\n\xff\xfe garbage\nTLM 1000 42\n")
+    time.sleep(0.2)
+    assert link.send("CONF", timeout=2) == Config.ACK
+    assert link.telemetry.rejected == 2
+    assert link.telemetry.count == 1
+
+
+def test_ingest_line_rejects_out_of_range_values():
+    buffer = TelemetryBuffer(capacity=16)
+    assert not buffer.ingest_line(b"TLM -1 0")
+    assert not buffer.ingest_line(b"TLM 1 99999999999")
+    assert not buffer.ingest_line(b"TLM 1 2 3")
+    assert buffer.ingest_line(b"TLM 1 -2")
+    assert buffer.count == 1 and buffer.rejected == 3
+
+
+def test_stream_player_ignores_malformed_flow_reports():
+    player = StreamPlayer(conn=None, producer=iter(()))
+    player.capacity, player.sent = 100, 50
+    for message in ("", "FREE", "FREE X", "FREE 10 Y", "FREE 500", "FREE -1", "FREE 10 -3", "FREE 1 2 3"):
+        player._on_event(message)
+    assert player.executed == 0 and player._depth_samples == 0
+    player._on_event("FREE 90")
+    assert player.executed == 40
+    player._on_event("FREE 100 999")
+    assert player.executed == 50
+
+
+def test_reader_rates_hold_between_back_to_back_reads(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(serial_reader.time, 'monotonic', lambda: clock[0])
+    port = io.BytesIO(b"TLM 1 2\n" * 10)
+    port.in_waiting = 80
+    reader = serial_reader.SerialReader(port)
+    reader.fill()
+    while reader.next_line() is not None:
+        pass
+    clock[0] += 2
+    first = reader.stats()
+    assert first["bytes_per_sec"] == 40 and first["lines_per_sec"] == 5
+    assert reader.stats() == first
+    clock[0] += 2
+    assert reader.stats()["bytes_per_sec"] == 0
@@ -0,0 +1,64 @@
+"""
+A loop compressed program must run exactly the moves of the batch it was
+made from, on the host's model of it and on the firmware's.
+"""
+import numpy as np
+import pytest
+
+import loop_compressor
+import waveform_compiler
+from config import Config
+from pico_emulator import PicoEmulator
+from pico_link import PicoLink
+
+
+@pytest.mark.parametrize("waveform", [(5, 1, 60), (2, 3.3, 30), (10, 0.7, 120, 50)])
+def test_program_expands_to_the_batch(waveform):
+    batch = waveform_compiler.compile_waveform(*waveform)
+    program = loop_compressor.compress(batch, max_period=16)
+    assert program.runs(batch)
+    assert program.move_count == len(batch)
+    commands = program.commands()
+    assert len(commands) == program.sent_count
+    repeats = [command.split() for command in commands if command.startswith("REPEAT")]
+    assert len(repeats) == len(program.loops)
+    assert all(1 <= int(length) <= 16 and int(count) >= 2 for _, count, length in repeats)
+
+
+def test_periodic_motion_compresses():
+    batch = waveform_compiler.compile_waveform(5, 1, 60)
+    program = loop_compressor.compress(batch, max_period=16)
+    assert program.loops
+    assert program.ratio > 10
+
+
+def test_batch_without_repetition_is_sent_as_is():
+    rng = np.random.default_rng(0)
+    batch = np.zeros(200, dtype=waveform_compiler.COMMAND_DTYPE)
+    batch['speed'] = rng.integers(1000, 50000, len(batch))
+    batch['accel'] = 640000
+    batch['steps'] = rng.integers(1, 4000, len(batch))
+    batch['direction'] = rng.integers(0, 2, len(batch))
+    program = loop_compressor.compress(batch)
+    assert program.loops == []
+    assert program.commands() == waveform_compiler.to_commands(batch)
+
+
+def test_firmware_runs_the_program_to_the_same_position():
+    binary = Config.BINARY_PROTOCOL
+    Config.BINARY_PROTOCOL = False
+    batch = waveform_compiler.compile_waveform(5, 3.3, 20)
+    program = loop_compressor.compress(batch, max_period=16)
+    commands = program.commands()
+    emulator = PicoEmulator(loop_body=16)
+    link = PicoLink(port=emulator.start())
+    try:
+        assert link.open()
+        assert link.send_pipelined(commands, announce=[f"BATCH_SIZE {len(commands)}"]) == []
+    finally:
+        link.close()
+        emulator.close()
+        Config.BINARY_PROTOCOL = binary
+    assert emulator.batch == commands
+    signed = np.where(batch['direction'] == waveform_compiler.DIR_POSITIVE, 1, -1) * batch['steps'].astype(np.int64)
+    assert emulator.position == signed.sum()
@@ -0,0 +1,82 @@
+"""
+Pipelined uploads must leave the batch on the Pico in the order it was
+sent, whatever commands are rejected or lost on the way. The emulator
+stores MOVEs as it accepts them, so its batch is what the firmware would run.
+"""
+import numpy as np
+import pytest
+
+from config import Config
+from pico_emulator import PicoEmulator
+from pico_link import PicoLink
+from waveform_compiler import COMMAND_DTYPE
+
+COMMANDS = [f"MOVE {4000 + i} 640000 {80 + i % 400} {i % 2}" for i in range(300)]
+
+
+def _batch():
+    batch = np.zeros(len(COMMANDS), dtype=COMMAND_DTYPE)
+    batch['speed'] = 4000 + np.arange(len(COMMANDS))
+    batch['accel'] = 640000
+    batch['steps'] = 80 + np.arange(len(COMMANDS)) % 400
+    batch['direction'] = np.arange(len(COMMANDS)) % 2
+    return batch
+
+
+def _upload(emulator, binary, window=32, timeout=5, commands=COMMANDS):
+    Config.BINARY_PROTOCOL = binary
+    link = PicoLink(port=emulator.start())
+    try:
+        link.open()
+        assert link.is_connected()
+        assert link.binary == binary
+        return link.send_pipelined(commands, window=window, timeout=timeout,
+                                   announce=[f"BATCH_SIZE {len(commands)}"])
+    finally:
+        link.close()
+        emulator.close()
+
+
+@pytest.fixture(autouse=True)
+def restore_protocol():
+    binary = Config.BINARY_PROTOCOL
+    yield
+    Config.BINARY_PROTOCOL = binary
+
+
+@pytest.mark.parametrize("binary", [False, True])
+def test_rejected_moves_never_reorder_the_batch(binary):
+    emulator = PicoEmulator(nack_rate=0.05, seed=1)
+    failed = _upload(emulator, binary)
+    # Too many rejections to get 300 moves through: the upload must say so rather than succeed out of order
+    if not failed:
+        assert emulator.batch == COMMANDS
+    else:
+        assert failed == list(range(failed[0], len(COMMANDS)))
+
+
+@pytest.mark.parametrize("binary", [False, True])
+def test_rejected_move_resends_the_batch_in_order(binary):
+    emulator = PicoEmulator(nack_rate=0.002, seed=5)
+    failed = _upload(emulator, binary)
+    assert failed == []
+    assert emulator.moves_received > len(COMMANDS), "no MOVE was rejected, the test proves nothing"
+    assert emulator.batch == COMMANDS
+
+
+@pytest.mark.parametrize("binary", [False, True])
+def test_lost_reply_resends_the_batch_in_order(binary):
+    emulator = PicoEmulator(drop_rate=0.002, seed=6)
+    failed = _upload(emulator, binary, timeout=0.5)
+    assert failed == []
+    assert emulator.moves_received > len(COMMANDS), "no command was lost, the test proves nothing"
+    assert emulator.batch == COMMANDS
+
+
+@pytest.mark.parametrize("binary", [False, True])
+def test_typed_batch_uploads_like_its_commands(binary):
+    emulator = PicoEmulator(nack_rate=0.002, seed=5)
+    failed = _upload(emulator, binary, commands=_batch())
+    assert failed == []
+    assert emulator.moves_received > len(COMMANDS), "no MOVE was rejected, the test proves nothing"
+    assert emulator.batch == COMMANDS
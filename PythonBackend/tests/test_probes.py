@@ -0,0 +1,33 @@
+"""
+Firmware that predates a capability query may never answer it; connecting
+must not wait the full command timeout for each one, and the unanswered
+query must not take the reply of the command after it.
+"""
+import time
+
+import pytest
+
+from config import Config
+from pico_emulator import PicoEmulator
+from pico_link import PicoLink
+
+
+@pytest.mark.parametrize("binary", [False, True])
+def test_unanswered_probes_time_out_quickly(binary):
+    support = Config.BINARY_PROTOCOL
+    Config.BINARY_PROTOCOL = True
+    emulator = PicoEmulator(binary=binary, silent=() if binary else ("PROTO",))
+    link = PicoLink(port=emulator.start())
+    try:
+        start = time.monotonic()
+        assert link.open()
+        assert link.binary == binary
+        emulator.silent = {"PROFILES", "LOOPS"}
+        assert link.probe("PROFILES") is None
+        assert link.probe("LOOPS") is None
+        assert time.monotonic() - start < 4 * Config.PROBE_TIMEOUT + 1
+        assert link.send("CONF", timeout=2) == Config.ACK
+    finally:
+        link.close()
+        emulator.close()
+        Config.BINARY_PROTOCOL = support
@@ -0,0 +1,54 @@
+"""The disk tier of the profile cache stays within its size cap."""
+import os
+
+import numpy as np
+
+import profile_cache
+from profile_cache import ProfileCache
+
+
+def test_disk_tier_evicts_least_recently_used(tmp_path):
+    batch = np.zeros(1000, dtype=np.uint8)
+    cache = ProfileCache(max_entries=1, cache_dir=str(tmp_path), max_bytes=3 * 1200)
+    for i, key in enumerate("abc"):
+        cache.put(key, batch)
+        os.utime(tmp_path / f"{key}.npy", (i, i))
+    # A disk hit makes "a" the most recently used
+    assert cache.get("a") is not None
+    cache.put("d", batch)
+
+    assert sorted(os.listdir(tmp_path)) == ["a.npy", "c.npy", "d.npy"]
+    assert cache.disk_evictions == 1
+    assert cache.get("b") is None
+
+
+def test_no_cap_keeps_every_file(tmp_path):
+    cache = ProfileCache(cache_dir=str(tmp_path), max_bytes=0)
+    for key in "abcd":
+        cache.put(key, np.zeros(1000))
+    assert len(os.listdir(tmp_path)) == 4
+
+
+def test_tables_storing_the_same_profile_at_once(tmp_path, monkeypatch):
+    batch = np.arange(1000)
+    first, second = (ProfileCache(cache_dir=str(tmp_path), max_bytes=0) for _ in range(2))
+    save = np.save
+
+    def save_while_another_table_stores(f, array):
+        # The second table finishes storing the same profile while the first is still writing
+        monkeypatch.setattr(profile_cache.np, 'save', save)
+        second.put("same", array)
+        save(f, array)
+
+    monkeypatch.setattr(profile_cache.np, 'save', save_while_another_table_stores)
+    first.put("same", batch)
+    assert os.listdir(tmp_path) == ["same.npy"]
+    np.testing.assert_array_equal(np.load(tmp_path / "same.npy"), batch)
+    assert second.get("same") is not None
+
+
+def test_stale_temporary_file_is_replaced(tmp_path):
+    (tmp_path / "a.tmp").write_bytes(b"partial")
+    os.utime(tmp_path / "a.tmp", (0, 0))
+    ProfileCache(cache_dir=str(tmp_path), max_bytes=0).put("a", np.zeros(10))
+    assert os.listdir(tmp_path) == ["a.npy"]
@@ -0,0 +1,33 @@
+"""
+Windows read straight off the ring must match the same window cut from
+the whole history, wherever the ring's write position happens to be.
+"""
+import numpy as np
+import pytest
+
+from config import Config
+from telemetry import TelemetryBuffer
+
+
+@pytest.mark.parametrize("written", [7, 16, 25, 40])
+def test_window_matches_the_full_history(written):
+    buffer = TelemetryBuffer(capacity=16)
+    buffer.ingest(np.arange(written) * 1000, np.arange(written))
+    _, times, positions = buffer.since(0)
+    for start, end in [(None, None), (0.0, 0.01), (0.0095, 0.0205), (0.012, None), (None, 0.015),
+                       (0.030, 0.035), (0.1, 0.2), (-1.0, -0.5), (0.02, 0.01)]:
+        lo = 0 if start is None else np.searchsorted(times, start, 'left')
+        hi = len(times) if end is None else np.searchsorted(times, end, 'right')
+        window_times, window_positions = buffer.window(start, end)
+        np.testing.assert_array_equal(window_times, times[lo:max(lo, hi)])
+        np.testing.assert_array_equal(window_positions, positions[lo:max(lo, hi)])
+
+
+def test_decimate_keeps_peaks():
+    buffer = TelemetryBuffer(capacity=1000)
+    positions = np.zeros(2500, dtype=np.int64)
+    positions[2200] = 5 * int(Config.STEPS_PER_MM)
+    buffer.ingest(np.arange(2500) * 1000, positions)
+    batch = buffer.decimate(width=50)
+    assert len(batch["t"]) == 50
+    assert max(batch["max"]) == pytest.approx(5.0)
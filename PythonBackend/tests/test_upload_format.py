@@ -0,0 +1,88 @@
+"""
+Typed uploads: valid batches are read exactly, anything else is refused
+before memory is allocated for it.
+"""
+import gzip
+import io
+
+import numpy as np
+import pytest
+
+import upload_format
+from config import Config
+from waveform_compiler import COMMAND_DTYPE
+
+ROWS = np.array([[4000, 640000, 80, 0], [3000, 500000, 120, 1]])
+
+
+def _npy(array):
+    buffer = io.BytesIO()
+    np.save(buffer, array)
+    return buffer.getvalue()
+
+
+def _npy_header(descr, shape):
+    buffer = io.BytesIO()
+    np.lib.format.write_array_header_1_0(buffer, {'descr': descr, 'fortran_order': False, 'shape': shape})
+    return buffer.getvalue()
+
+
+def _read(body, content_type='application/x-npy', encoding=None):
+    return upload_format.read_moves(io.BytesIO(body), content_type, encoding)
+
+
+def _check(batch):
+    for i, name in enumerate(upload_format.FIELDS):
+        np.testing.assert_array_equal(batch[name], ROWS[:, i])
+
+
+@pytest.mark.parametrize("dtype", ['<i4', '<u4', '<i8', '>i4'])
+def test_npy_rows(dtype):
+    _check(_read(_npy(ROWS.astype(dtype))))
+
+
+def test_npy_structured_and_fortran_order():
+    structured = np.zeros(len(ROWS), dtype=[(name, '<u4') for name in upload_format.FIELDS] + [('extra', '<f8')])
+    for i, name in enumerate(upload_format.FIELDS):
+        structured[name] = ROWS[:, i]
+    _check(_read(_npy(structured)))
+    _check(_read(_npy(np.asfortranarray(ROWS.astype('<i4')))))
+
+
+def test_npy_gzip():
+    _check(_read(gzip.compress(_npy(ROWS.astype('<i4'))), encoding='gzip'))
+
+
+@pytest.mark.parametrize("body", [
+    _npy(ROWS.astype('<f8')),                                    # float columns are not truncated
+    _npy(ROWS.reshape(2, 2, 2)),                                 # 3-D
+    _npy(ROWS[:, :3]),                                           # missing a column
+    _npy(np.zeros(2, dtype=[('speed', '<u4'), ('steps', '<u4')])),
+    _npy(np.zeros(2, dtype=[(name, '<f4') for name in upload_format.FIELDS])),
+    _npy_header('<i4', (10, 10 ** 9)),
+    _npy_header('<i4', (10, 4, 10 ** 9)),
+    _npy_header([(name, '<u4') for name in upload_format.FIELDS] + [('pad', 'V1000000')], (10 ** 6,)),
+    _npy_header('<i4', (Config.MAX_UPLOAD_COMMANDS + 1, 4)),
+    _npy(np.array([[1, 2, 3, -4]])),                             # negative
+    _npy(np.array([[1, 2, 3, 2]])),                              # direction
+    _npy(ROWS.astype('<i4'))[:-4],                               # truncated
+])
+def test_npy_rejected(body):
+    with pytest.raises(ValueError):
+        _read(body)
+
+
+def test_msgpack_rows_and_columns():
+    msgpack = pytest.importorskip("msgpack")
+    _check(_read(msgpack.packb(ROWS.tolist()), 'application/msgpack'))
+    columns = {name: ROWS[:, i].astype(COMMAND_DTYPE[name].newbyteorder('<')).tobytes()
+               for i, name in enumerate(upload_format.FIELDS)}
+    _check(_read(msgpack.packb(columns), 'application/msgpack'))
+
+
+def test_msgpack_float_rejected():
+    msgpack = pytest.importorskip("msgpack")
+    with pytest.raises(ValueError):
+        _read(msgpack.packb([[4000, 640000, 80.5, 0]]), 'application/msgpack')
+    with pytest.raises(ValueError):
+        _read(msgpack.packb({name: [1.5] for name in upload_format.FIELDS}), 'application/msgpack')
@@ -0,0 +1,33 @@
+"""
+Compiling the damped cosine from its extrema must give the segments the
+sampled trace gives, without a zero-time jump to the first sample.
+"""
+import numpy as np
+import pytest
+
+import waveform_compiler
+from config import Config
+
+
+@pytest.mark.parametrize("waveform", [(5, 10, 50, 0), (20, 2, 30, 40), (1, 3.3, 7.7, 90), (2, 0, 3, 50)])
+def test_extrema_match_the_sampled_trace(waveform):
+    batch = waveform_compiler.compile_waveform(*waveform)
+    _, trace = waveform_compiler.damped_cosine(*waveform)
+    sampled = waveform_compiler.compile_displacement(trace, 1000, start=0.0)
+
+    assert len(batch) == len(sampled)
+    np.testing.assert_array_equal(batch['direction'], sampled['direction'])
+    assert np.abs(batch['steps'].astype(np.int64) - sampled['steps']).max() <= 1
+    # The sampled trace turns on the last sample of a flat peak, up to half of a wide one late
+    assert np.abs(np.cumsum(batch['duration']) - np.cumsum(sampled['duration'])).max() <= 0.025
+    assert batch['duration'].sum() == pytest.approx(waveform[2])
+
+
+def test_first_segment_starts_from_the_centred_table():
+    batch = waveform_compiler.compile_waveform(5, 1, 10)
+    assert (batch['duration'] > 0).all()
+    assert batch['feasible'].all()
+    # From the centre to the first trough, rather than a jump to the peak and back
+    assert batch[0]['steps'] == 5 * Config.STEPS_PER_MM
+    assert batch[0]['direction'] == waveform_compiler.DIR_NEGATIVE
+    assert batch[0]['duration'] == pytest.approx(0.5)
@@ -0,0 +1,210 @@
+# trajectory_planner.py
+import numpy as np
+
+from config import Config
+from waveform_compiler import COMMAND_DTYPE, DIR_POSITIVE, DIR_NEGATIVE, max_acceleration_steps, slew_speeds
+
+# Bisection steps when solving S-curve speeds, enough for float64 precision
+_BISECT_ITERATIONS = 60
+
+
+def max_jerk_steps():
+    """Returns Config.MAX_JERK in steps/s³, or None when jerk limiting is off."""
+    jerk = float(Config.MAX_JERK)
+    return jerk * float(Config.STEPS_PER_MM) if jerk > 0 else None
+
+
+def parse_commands(commands):
+    """
+    Reads "MOVE speed accel steps dir" strings.
+
+    Each move is timed as the firmware runs it, from rest to rest.
+
+    :return: (signed steps, durations in s)
+    """
+    if not len(commands):
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+    fields = np.array([command.split()[1:5] for command in commands], dtype=np.float64)
+    speed, accel, steps, direction = fields.T
+    deltas = np.where(direction == DIR_POSITIVE, steps, -steps).astype(np.int64)
+    return deltas, trapezoid_time(steps, speed, accel)
+
+
+def trapezoid_time(distance, speed, accel):
+    """Rest-to-rest time of trapezoidal moves, triangular when `speed` is never reached."""
+    distance = np.asarray(distance, dtype=np.float64)
+    speed = np.maximum(np.asarray(speed, dtype=np.float64), 1)
+    accel = np.maximum(np.asarray(accel, dtype=np.float64), 1)
+    return np.where(
+        distance >= speed ** 2 / accel,
+        distance / speed + speed / accel,
+        2 * np.sqrt(distance / accel),
+    )
+
+
+def junction_velocities(deltas, durations, a_max_steps):
+    """
+    Look-ahead limit on the velocity at each junction between segments.
+
+    A junction between two segments moving the same way can be crossed at
+    the slower of their mean speeds. A reversal, a pause or either end of
+    the batch must be crossed at rest. Backward and forward passes then
+    lower each junction so the table can always brake for the next one:
+    v[i]² ≤ v[i+1]² + 2·a·D[i]. Both passes are cumulative minima, so the
+    whole batch is planned without a Python loop.
+
+    :return: len(deltas) + 1 velocities in steps/s.
+    """
+    deltas = np.asarray(deltas)
+    distance = np.abs(deltas).astype(np.float64)
+    cruise = distance / np.maximum(durations, 1e-9)
+    signs = np.sign(deltas)
+
+    v2 = np.zeros(len(deltas) + 1)
+    same = (signs[1:] == signs[:-1]) & (signs[1:] != 0)
+    v2[1:-1] = np.where(same, np.minimum(cruise[:-1], cruise[1:]), 0) ** 2
+
+    x = 2 * a_max_steps * np.concatenate(([0.0], np.cumsum(distance)))
+    v2 = np.minimum(v2, np.minimum.accumulate((v2 + x)[::-1])[::-1] - x)
+    v2 = np.minimum(v2, np.minimum.accumulate(v2 - x) + x)
+    return np.sqrt(np.maximum(v2, 0))
+
+
+def merge_collinear(deltas, durations, a_max_steps):
+    """
+    Joins consecutive moves in the same direction into one.
+
+    The firmware runs every MOVE from rest to rest, so a junction the
+    look-ahead plan would cross at speed is a needless stop. Only
+    reversals and pauses are kept. Pauses (zero-step moves) are folded
+    into the time of the move before them.
+
+    :return: (signed steps, durations) of the merged moves.
+    """
+    deltas = np.asarray(deltas, dtype=np.int64)
+    durations = np.asarray(durations, dtype=np.float64)
+    if len(deltas) == 0:
+        return deltas, durations
+
+    # Pauses stretch the move they follow, or the first move when they lead
+    moving = np.flatnonzero(deltas)
+    if len(moving) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+    owner = np.maximum(np.searchsorted(moving, np.arange(len(deltas)), 'right') - 1, 0)
+    durations = np.bincount(owner, weights=durations, minlength=len(moving))
+    deltas = deltas[moving]
+
+    v = junction_velocities(deltas, durations, a_max_steps)
+    starts = np.concatenate(([0], np.flatnonzero(v[1:-1] == 0) + 1))
+    return np.add.reduceat(deltas, starts), np.add.reduceat(durations, starts)
+
+
+def _scurve_ramp_time(v, a_max_steps, j_max_steps):
+    """Time to reach v from rest with acceleration and jerk limits."""
+    return np.where(
+        v >= a_max_steps ** 2 / j_max_steps,
+        v / a_max_steps + a_max_steps / j_max_steps,
+        2 * np.sqrt(v / j_max_steps),
+    )
+
+
+def scurve_speeds(durations, a_max_steps, j_max_steps, d_steps):
+    """
+    Jerk-limited counterpart of waveform_compiler.slew_speeds.
+
+    A rest-to-rest S-curve that ramps to v in t_r(v) covers d_steps in
+    t_r(v) + D/v. The ramp time grows with v and D/v shrinks, so the
+    speed that finishes in the planned duration is found by bisection,
+    below the speed that leaves no time for cruising. Segments that cannot
+    finish in time get that top speed and run late.
+
+    :return: (speeds in steps/s, ramp times in s, feasible mask)
+    """
+    d_steps = np.asarray(d_steps, dtype=np.float64)
+    durations = np.asarray(durations, dtype=np.float64)
+    a, j = a_max_steps, j_max_steps
+
+    # Fastest profile: the two ramps meet with no cruise, v·t_r(v) = D
+    v_full = (np.sqrt((a / j) ** 2 + 4 * d_steps / a) - a / j) * a / 2
+    v_peak = np.where(v_full >= a ** 2 / j, v_full, (d_steps * np.sqrt(j) / 2) ** (2 / 3))
+    t_min = _scurve_ramp_time(v_peak, a, j) + d_steps / np.maximum(v_peak, 1e-12)
+    feasible = durations >= t_min
+
+    lo = np.zeros_like(d_steps)
+    hi = v_peak.copy()
+    for _ in range(_BISECT_ITERATIONS):
+        mid = (lo + hi) / 2
+        t = _scurve_ramp_time(mid, a, j) + d_steps / np.maximum(mid, 1e-12)
+        slow = t > durations
+        lo = np.where(slow, mid, lo)
+        hi = np.where(slow, hi, mid)
+    speeds = np.where(feasible, hi, v_peak)
+    return speeds, _scurve_ramp_time(speeds, a, j), feasible
+
+
+def plan(deltas, durations, a_max_steps=None, j_max_steps=None):
+    """
+    Plans moves into the fewest segments the firmware can run.
+
+    Collinear moves are merged, then each segment gets the speed that
+    finishes it in its planned time without exceeding MAX_ACCELERATION.
+    With a jerk limit the timing follows an S-curve, and the firmware's
+    constant-acceleration ramps are given the S-curve's average
+    acceleration so they take exactly as long.
+
+    :param deltas: Signed move lengths in steps.
+    :param durations: Time each move should take in s.
+    :param a_max_steps: Acceleration in steps/s² (default: Config.MAX_ACCELERATION).
+    :param j_max_steps: Jerk in steps/s³ (default: Config.MAX_JERK, None or 0 for trapezoids).
+    :return: Structured array of COMMAND_DTYPE.
+    """
+    a_max_steps = max_acceleration_steps() if a_max_steps is None else float(a_max_steps)
+    j_max_steps = max_jerk_steps() if j_max_steps is None else (float(j_max_steps) or None)
+
+    deltas, durations = merge_collinear(deltas, durations, a_max_steps)
+    distance = np.abs(deltas).astype(np.float64)
+    if j_max_steps:
+        speeds, ramp, feasible = scurve_speeds(durations, a_max_steps, j_max_steps, distance)
+        accels = np.minimum(speeds / np.maximum(ramp, 1e-9), a_max_steps)
+    else:
+        speeds, feasible = slew_speeds(durations, a_max_steps, distance)
+        accels = np.full(len(deltas), a_max_steps)
+
+    batch = np.empty(len(deltas), dtype=COMMAND_DTYPE)
+    batch['speed'] = np.maximum(np.rint(speeds), 1)
+    batch['accel'] = np.maximum(np.rint(accels), 1)
+    batch['steps'] = distance
+    batch['direction'] = np.where(deltas > 0, DIR_POSITIVE, DIR_NEGATIVE)
+    batch['duration'] = durations
+    batch['feasible'] = feasible
+    return batch
+
+
+def plan_batch(batch, a_max_steps=None, j_max_steps=None):
+    """Replans a compiled COMMAND_DTYPE batch, keeping its segment timing."""
+    deltas = np.where(batch['direction'] == DIR_POSITIVE, 1, -1) * batch['steps'].astype(np.int64)
+    return plan(deltas, batch['duration'].astype(np.float64), a_max_steps, j_max_steps)
+
+
+def moves_timing(batch):
+    """
+    Reads the moves of a COMMAND_DTYPE batch, e.g. a typed upload, timed
+    like parse_commands.
+
+    :return: (signed steps, durations in s)
+    """
+    steps = batch['steps'].astype(np.int64)
+    deltas = np.where(batch['direction'] == DIR_POSITIVE, steps, -steps)
+    return deltas, trapezoid_time(steps, batch['speed'], batch['accel'])
+
+
+def plan_commands(commands, a_max_steps=None, j_max_steps=None):
+    """
+    Plans preformatted "MOVE ..." strings, e.g. one per point from the
+    browser, or the COMMAND_DTYPE batch of a typed upload.
+    """
+    if isinstance(commands, np.ndarray):
+        deltas, durations = moves_timing(commands)
+    else:
+        deltas, durations = parse_commands(commands)
+    return plan(deltas, durations, a_max_steps, j_max_steps)
@@ -0,0 +1,243 @@
+# upload_format.py
+"""
+Typed movement uploads.
+
+Besides a JSON list of "MOVE speed accel steps dir" strings, /start-movement
+takes the same moves as a NumPy .npy file or as msgpack, optionally gzip or
+deflate compressed (Content-Encoding). The body is read from the request
+stream a chunk at a time, decompressed on the way, and copied straight
+into a COMMAND_DTYPE array, so no Python string is built per command.
+
+Accepted layouts:
+  - .npy: a structured array with speed, accel, steps and direction fields
+    (e.g. COMMAND_DTYPE), or an (n, 4) integer array in that column order
+  - msgpack: a map of column name to little-endian binary column (bin) or
+    list of integers, or an array of [speed, accel, steps, direction] rows
+"""
+import zlib
+
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:  # Only needed for msgpack uploads
+    msgpack = None
+
+from config import Config
+from waveform_compiler import COMMAND_DTYPE
+
+CHUNK_SIZE = 65536
+FIELDS = ('speed', 'accel', 'steps', 'direction')
+NPY_TYPES = ('application/x-npy', 'application/octet-stream')
+MSGPACK_TYPES = ('application/msgpack', 'application/x-msgpack', 'application/vnd.msgpack')
+# Largest .npy record accepted, a structured upload may carry a few fields besides the moves
+MAX_RECORD_BYTES = 64
+
+
+def is_typed(content_type):
+    """Whether a request body of this MIME type is a typed upload rather than JSON."""
+    return content_type in NPY_TYPES or content_type in MSGPACK_TYPES
+
+
+class DecodedStream:
+    """File-like view of a request body that undoes its Content-Encoding as it is read."""
+
+    def __init__(self, stream, encoding=None):
+        encoding = (encoding or 'identity').strip().lower()
+        if encoding == 'identity':
+            self._decompressor = None
+        elif encoding in ('gzip', 'x-gzip'):
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            self._decompressor = zlib.decompressobj(zlib.MAX_WBITS)
+        else:
+            raise ValueError(f"Unsupported Content-Encoding {encoding}")
+        self.stream = stream
+        self._buffer = bytearray()
+        self._eof = False
+
+    def _fill(self, size):
+        while (size < 0 or len(self._buffer) < size) and not self._eof:
+            chunk = self.stream.read(CHUNK_SIZE)
+            if not chunk:
+                self._eof = True
+                if self._decompressor is not None:
+                    self._buffer += self._decompressor.flush()
+            elif self._decompressor is None:
+                self._buffer += chunk
+            else:
+                self._buffer += self._decompressor.decompress(chunk)
+
+    def peek(self, size):
+        """Returns up to `size` bytes without consuming them."""
+        self._fill(size)
+        return bytes(self._buffer[:size])
+
+    def read(self, size=-1):
+        self._fill(size)
+        if size < 0 or size >= len(self._buffer):
+            data, self._buffer = bytes(self._buffer), bytearray()
+        else:
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+        return data
+
+    def readinto(self, view):
+        """Fills a writable buffer, returns the number of bytes copied."""
+        self._fill(len(view))
+        n = min(len(view), len(self._buffer))
+        view[:n] = self._buffer[:n]
+        del self._buffer[:n]
+        return n
+
+
+def _check_count(count):
+    if count > Config.MAX_UPLOAD_COMMANDS:
+        raise ValueError(f"Upload of {count} commands exceeds MAX_UPLOAD_COMMANDS ({Config.MAX_UPLOAD_COMMANDS})")
+
+
+def _to_batch(columns, count):
+    """Checks the four move columns and stores them as a COMMAND_DTYPE batch."""
+    batch = np.zeros(count, dtype=COMMAND_DTYPE)
+    for name in FIELDS:
+        column = np.asarray(columns[name])
+        if column.shape != (count,):
+            raise ValueError(f"Column {name} has {column.size} values, expected {count}")
+        if not np.issubdtype(column.dtype, np.integer) or (count and column.min() < 0):
+            raise ValueError(f"Column {name} must hold non-negative integers")
+        if count and column.max() > np.iinfo(COMMAND_DTYPE[name]).max:
+            raise ValueError(f"Column {name} holds values too large for a MOVE")
+        batch[name] = column
+    if count and batch['direction'].max() > 1:
+        raise ValueError("Direction must be 0 or 1")
+    batch['duration'] = np.nan
+    batch['feasible'] = True
+    return batch
+
+
+def _check_npy_header(shape, dtype):
+    """Rejects a .npy header that is not a batch of moves before anything is allocated."""
+    if dtype.hasobject:
+        raise ValueError("Object arrays cannot be uploaded")
+    if not shape:
+        raise ValueError("Upload is a scalar, not an array of moves")
+    if dtype.names:
+        if len(shape) != 1:
+            raise ValueError(f"Expected a 1-D structured array of moves, got shape {shape}")
+        missing = [name for name in FIELDS if name not in dtype.names]
+        if missing:
+            raise ValueError(f"Structured upload lacks fields {', '.join(missing)}")
+        columns = [dtype.fields[name][0] for name in FIELDS]
+    else:
+        if len(shape) != 2 or shape[1] != len(FIELDS):
+            raise ValueError(f"Expected an (n, 4) array of moves, got shape {shape}")
+        columns = [dtype]
+    for column in columns:
+        if column.kind not in 'iu' or column.shape:
+            raise ValueError(f"Moves must be integers, got {column}")
+    record_bytes = dtype.itemsize * (shape[1] if len(shape) == 2 else 1)
+    if record_bytes > MAX_RECORD_BYTES:
+        raise ValueError(f"Records of {record_bytes} bytes exceed {MAX_RECORD_BYTES} bytes per move")
+    # With the count capped too, no header can allocate more than MAX_UPLOAD_COMMANDS * MAX_RECORD_BYTES
+    _check_count(shape[0])
+
+
+def read_npy(stream):
+    """
+    Reads a .npy upload. The header is parsed first, so the array is
+    allocated once and filled from the stream in place.
+
+    :return: COMMAND_DTYPE batch.
+    """
+    version = np.lib.format.read_magic(stream)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(stream)
+    elif version == (2, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(stream)
+    else:
+        raise ValueError(f"Unsupported .npy format version {version}")
+    _check_npy_header(shape, dtype)
+
+    data = np.empty(shape[::-1] if fortran_order else shape, dtype=dtype)
+    view = memoryview(data.reshape(-1).view(np.uint8))
+    filled = 0
+    while filled < len(view):
+        n = stream.readinto(view[filled:filled + CHUNK_SIZE * 16])
+        if n == 0:
+            raise ValueError(f"Upload ended after {filled} of {len(view)} bytes")
+        filled += n
+    if fortran_order:
+        data = data.T
+
+    if dtype.names:
+        return _to_batch({name: data[name] for name in FIELDS}, len(data))
+    return _to_batch({name: data[:, i] for i, name in enumerate(FIELDS)}, len(data))
+
+
+def read_msgpack(stream):
+    """
+    Reads a msgpack upload with an incremental unpacker.
+
+    :return: COMMAND_DTYPE batch.
+    """
+    if msgpack is None:
+        raise ValueError("msgpack uploads need the msgpack package (pip install msgpack)")
+    first = stream.peek(1)
+    if not first:
+        raise ValueError("Empty upload")
+    unpacker = msgpack.Unpacker(stream, raw=False, read_size=CHUNK_SIZE)
+    marker = first[0]
+
+    if 0x80 <= marker <= 0x8f or marker in (0xde, 0xdf):
+        # Columns, the compact form: each one a bin of little-endian values or a list
+        columns = {}
+        for _ in range(unpacker.read_map_header()):
+            name = unpacker.unpack()
+            value = unpacker.unpack()
+            if name not in FIELDS:
+                continue
+            if isinstance(value, (bytes, bytearray)):
+                value = np.frombuffer(value, dtype=COMMAND_DTYPE[name].newbyteorder('<'))
+            columns[name] = value
+        missing = [name for name in FIELDS if name not in columns]
+        if missing:
+            raise ValueError(f"Upload lacks columns {', '.join(missing)}")
+        count = len(columns['steps'])
+        _check_count(count)
+        return _to_batch(columns, count)
+
+    if 0x90 <= marker <= 0x9f or marker in (0xdc, 0xdd):
+        count = unpacker.read_array_header()
+        _check_count(count)
+        rows = np.empty((count, len(FIELDS)), dtype=np.int64)
+        for i in range(count):
+            row = unpacker.unpack()
+            if len(row) != len(FIELDS):
+                raise ValueError(f"Move {i + 1} has {len(row)} values, expected speed, accel, steps, direction")
+            if not all(type(value) is int for value in row):
+                raise ValueError(f"Move {i + 1} must hold integers")
+            rows[i] = row
+        return _to_batch({name: rows[:, i] for i, name in enumerate(FIELDS)}, count)
+
+    raise ValueError("msgpack upload must be a map of columns or an array of rows")
+
+
+def read_moves(stream, content_type, content_encoding=None):
+    """
+    Reads a typed upload from a request body stream.
+
+    :param content_type: MIME type, one of NPY_TYPES or MSGPACK_TYPES.
+    :param content_encoding: Content-Encoding header, gzip and deflate are undone.
+    :return: COMMAND_DTYPE batch with NaN durations, like feasibility.parse_commands.
+    :raises ValueError: If the body is not a valid batch of moves.
+    """
+    decoded = DecodedStream(stream, content_encoding)
+    errors = (zlib.error, EOFError) + ((msgpack.UnpackException,) if msgpack is not None else ())
+    try:
+        if content_type in NPY_TYPES:
+            return read_npy(decoded)
+        if content_type in MSGPACK_TYPES:
+            return read_msgpack(decoded)
+    except errors as e:
+        raise ValueError(f"Could not decode upload: {e}") from e
+    raise ValueError(f"Unsupported upload type {content_type}")
@@ -0,0 +1,241 @@
+# waveform_compiler.py
+import numpy as np
+
+from config import Config
+
+# MOVE direction for increasing position, matches the browser's original conversion
+DIR_POSITIVE = 1
+DIR_NEGATIVE = 0
+
+COMMAND_DTYPE = np.dtype([
+    ('speed', np.uint32),      # slew speed in steps/s
+    ('accel', np.uint32),      # acceleration in steps/s²
+    ('steps', np.uint32),      # distance in steps
+    ('direction', np.uint8),   # DIR_POSITIVE or DIR_NEGATIVE
+    ('duration', np.float32),  # planned segment time in s
+    ('feasible', np.bool_),    # False when the segment cannot finish in time at MAX_ACCELERATION
+])
+
+
+def max_acceleration_steps():
+    """Returns Config.MAX_ACCELERATION in steps/s²."""
+    return float(Config.MAX_ACCELERATION) * float(Config.STEPS_PER_MM)
+
+
+def damped_cosine(displacement, frequency, duration, percent_damped=0, sample_rate=1000):
+    """
+    Samples the damped cosine shown in the web UI.
+
+    :param displacement: Peak displacement in mm.
+    :param frequency: Frequency in Hz.
+    :param duration: Length of the motion in s.
+    :param percent_damped: Amplitude lost by the end of the motion, 0-99 %.
+    :param sample_rate: Samples per second.
+    :return: (t, displacement in mm) arrays.
+    """
+    percent_damped = min(max(percent_damped, 0), 99)
+    decay = -np.log(1 - percent_damped / 100) / max(0.1, duration)
+    t = np.arange(int(round(duration * sample_rate)) + 1) / sample_rate
+    return t, displacement * np.exp(-decay * t) * np.cos(2 * np.pi * frequency * t)
+
+
+def slew_speeds(durations, a_max_steps, d_steps):
+    """
+    Vectorised form of shake_table_controller._calculate_slew_speed.
+
+    Each segment is a symmetric trapezoid covering d_steps in `durations`
+    seconds at a_max_steps: v = aT/2 - sqrt((aT/2)² - D·a). Segments that
+    would need more than a_max_steps fall back to the triangular profile
+    v = sqrt(D·a), which is the fastest the table can do and takes longer.
+
+    :return: (speeds in steps/s, feasible mask)
+    """
+    half = a_max_steps * durations / 2
+    disc = half ** 2 - d_steps * a_max_steps
+    feasible = disc >= 0
+    speeds = np.where(
+        feasible,
+        half - np.sqrt(np.where(feasible, disc, 0)),
+        np.sqrt(d_steps * a_max_steps),
+    )
+    return speeds, feasible
+
+
+def _drop_interior(points, positions):
+    """Removes points in the middle of a monotonic run, including flat stretches."""
+    signs = np.sign(np.diff(positions[points]))
+    same = (signs[1:] == signs[:-1]) | (signs[1:] == 0) | (signs[:-1] == 0)
+    return points[~np.concatenate(([False], same, [False]))]
+
+
+def _turning_points(positions):
+    """Indices where the quantised position changes direction, plus both ends."""
+    deltas = np.diff(positions)
+    moving = np.flatnonzero(deltas)
+    signs = np.sign(deltas[moving])
+    # A reversal happens at the sample a move in the new direction starts from
+    reversals = moving[1:][signs[1:] != signs[:-1]]
+    return np.concatenate(([0], reversals, [len(positions) - 1]))
+
+
+def _apply_deadband(points, positions, min_steps):
+    """
+    Merges segments shorter than min_steps into their neighbours.
+
+    Each pass removes the smallest of any run of adjacent short segments by
+    dropping its end points, which joins the segments either side of it.
+    """
+    while len(points) > 2:
+        size = np.abs(np.diff(positions[points])).astype(np.float64)
+        small = size < min_steps
+        if not small.any():
+            break
+        padded = np.concatenate(([np.inf], size, [np.inf]))
+        selected = small & (size <= padded[:-2]) & (size < padded[2:])
+        drop = np.zeros(len(points), dtype=bool)
+        drop[:-1] |= selected
+        drop[1:] |= selected
+        drop[0] = drop[-1] = False
+        points = _drop_interior(points[~drop], positions)
+    return points
+
+
+def _segments(ends, times, a_max_steps):
+    """
+    Sizes one trapezoidal MOVE per pair of consecutive end points.
+
+    :param ends: Positions in steps the table passes through, starting where it is.
+    :param times: Time in s of each end point.
+    :return: Structured array of COMMAND_DTYPE.
+    """
+    deltas = np.diff(ends)
+    durations = np.diff(times)
+    nonzero = deltas != 0
+    deltas, durations = deltas[nonzero], durations[nonzero]
+
+    distance = np.abs(deltas).astype(np.float64)
+    speeds, feasible = slew_speeds(durations, a_max_steps, distance)
+
+    batch = np.empty(len(deltas), dtype=COMMAND_DTYPE)
+    batch['speed'] = np.maximum(np.rint(speeds), 1)
+    batch['accel'] = int(a_max_steps)
+    batch['steps'] = distance
+    batch['direction'] = np.where(deltas > 0, DIR_POSITIVE, DIR_NEGATIVE)
+    batch['duration'] = durations
+    batch['feasible'] = feasible
+    return batch
+
+
+def _end_points(positions, min_steps):
+    """
+    Turning points of quantised positions after the deadband. The first
+    is moved to 0, the table's position, so the first segment runs from
+    there rather than opening with a jump to the first sample.
+
+    :return: (indices into positions, end positions in steps)
+    """
+    points = _turning_points(positions)
+    if min_steps > 1:
+        points = _apply_deadband(points, positions, min_steps)
+    ends = positions[points]
+    ends[0] = 0
+    return points, ends
+
+
+def compile_displacement(displacement, sample_rate, min_steps=1, a_max_steps=None, start=None):
+    """
+    Converts a displacement trace into MOVE segments.
+
+    The trace is quantised to whole steps and cut at its turning points, so
+    each half cycle becomes one trapezoidal MOVE whose speed is chosen to
+    finish in the time the trace takes to get there.
+
+    :param displacement: Array of displacements in mm.
+    :param sample_rate: Samples per second of `displacement`.
+    :param min_steps: Segments shorter than this many steps are merged away.
+    :param a_max_steps: Acceleration in steps/s² (default: Config.MAX_ACCELERATION).
+    :param start: Table position in mm before the motion. When it differs from the
+                  first sample, the first segment starts from there.
+                  Default: the first sample.
+    :return: Structured array of COMMAND_DTYPE.
+    """
+    a_max_steps = max_acceleration_steps() if a_max_steps is None else float(a_max_steps)
+    displacement = np.asarray(displacement, dtype=np.float64)
+    if displacement.size < 2:
+        return np.zeros(0, dtype=COMMAND_DTYPE)
+
+    origin = displacement[0] if start is None else start
+    positions = np.rint((displacement - origin) * float(Config.STEPS_PER_MM)).astype(np.int64)
+    points, ends = _end_points(positions, min_steps)
+    return _segments(ends, points / sample_rate, a_max_steps)
+
+
+def compile_waveform(displacement, frequency, duration, percent_damped=0, sample_rate=1000, min_steps=1):
+    """
+    Compiles the damped cosine into MOVE segments.
+
+    Only the segment end points are evaluated: the extrema of
+    A·e^(-λt)·cos(ωt) fall where tan(ωt) = -λ/ω, snapped to the sample
+    grid, so the cost grows with the number of segments rather than
+    with the duration at `sample_rate`. The table starts centred and
+    the first segment takes it to the first trough.
+    """
+    percent_damped = min(max(percent_damped, 0), 99)
+    decay = -np.log(1 - percent_damped / 100) / max(0.1, duration)
+    omega = 2 * np.pi * frequency
+    end = int(round(duration * sample_rate)) / sample_rate
+    if end <= 0:
+        return np.zeros(0, dtype=COMMAND_DTYPE)
+    if omega > 0:
+        phase = np.arctan(decay / omega)
+        count = int(np.floor((end * omega + phase) / np.pi))
+        extrema = (np.arange(1, count + 1) * np.pi - phase) / omega
+        extrema = np.rint(extrema[extrema < end] * sample_rate) / sample_rate
+    else:
+        extrema = np.zeros(0)
+    times = np.concatenate(([0.0], extrema, [end]))
+    trace = displacement * np.exp(-decay * times) * np.cos(omega * times)
+    positions = np.rint(trace * float(Config.STEPS_PER_MM)).astype(np.int64)
+    points, ends = _end_points(positions, min_steps)
+    return _segments(ends, times[points], max_acceleration_steps())
+
+
+def iter_waveform_commands(displacement, frequency, duration=None, percent_damped=0,
+                           sample_rate=1000, window=None):
+    """
+    Compiles the damped cosine window by window for streaming playback.
+
+    Each window starts where the previous one ended, so memory stays
+    constant however long the motion runs.
+
+    :param duration: Length of the motion in s, None to run until stopped.
+                     Damping needs a duration and is ignored without one.
+    :param window: Seconds compiled at a time (default: Config.STREAM_WINDOW).
+    :return: Generator of "MOVE ..." strings.
+    """
+    window = float(window or Config.STREAM_WINDOW)
+    if duration is None:
+        decay = 0.0
+    else:
+        percent_damped = min(max(percent_damped, 0), 99)
+        decay = -np.log(1 - percent_damped / 100) / max(0.1, duration)
+    position = 0.0
+    t0 = 0.0
+    while duration is None or t0 < duration:
+        t1 = t0 + window if duration is None else min(t0 + window, duration)
+        t = t0 + np.arange(int(round((t1 - t0) * sample_rate)) + 1) / sample_rate
+        trace = displacement * np.exp(-decay * t) * np.cos(2 * np.pi * frequency * t)
+        yield from to_commands(compile_displacement(trace, sample_rate, start=position))
+        position = np.rint(trace[-1] * float(Config.STEPS_PER_MM)) / float(Config.STEPS_PER_MM)
+        t0 = t1
+
+
+def to_commands(batch):
+    """Formats a compiled batch as "MOVE speed accel steps dir" strings."""
+    return [
+        f"MOVE {speed} {accel} {steps} {direction}"
+        for speed, accel, steps, direction in zip(
+            batch['speed'].tolist(), batch['accel'].tolist(),
+            batch['steps'].tolist(), batch['direction'].tolist()
+        )
+    ]
@@ -9,6 +9,7 @@ class Config:
     # Server settings
     FLASK_HOST = os.environ.get('FLASK_HOST', '127.0.0.1')
     FLASK_PORT = int(os.environ.get('FLASK_PORT', 5051))
+    FLASK_RELOADER = os.environ.get('FLASK_RELOADER', '0') == '1'  # restart on code changes, runs the app twice
 
     # CORS settings
     CORS_ORIGINS = '*'
@@ -17,9 +18,21 @@ class Config:
 
     # Logging settings
     LOG_LEVEL = 'DEBUG'
+    LOG_ASYNC = os.environ.get('LOG_ASYNC', '1') == '1'  # handlers run on a background thread
+    LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))  # records queued before new ones are dropped
+    LOG_HOT_PATH_RATE = float(os.environ.get('LOG_HOT_PATH_RATE', 20))  # per-message records/s from the serial threads
+    LOG_BINARY_FILE = os.environ.get('LOG_BINARY_FILE', '')  # optional structured binary log, empty disables
 
     # SSE settings
     SSE_HEARTBEAT_TIMEOUT = 0.5
+    SSE_REPLAY_SIZE = int(os.environ.get('SSE_REPLAY_SIZE', 256))  # events kept for Last-Event-ID replay
+    SSE_MAX_PENDING = int(os.environ.get('SSE_MAX_PENDING', 128))  # per-client buffer before dropping oldest
+
+    # Telemetry settings
+    TELEMETRY_CAPACITY = int(os.environ.get('TELEMETRY_CAPACITY', 1 << 20))  # samples kept in the ring buffer
+    TELEMETRY_WINDOW = float(os.environ.get('TELEMETRY_WINDOW', 10))  # default /telemetry window in s
+    TELEMETRY_PUBLISH_INTERVAL = float(os.environ.get('TELEMETRY_PUBLISH_INTERVAL', 0.1))  # s between SSE batches
+    TELEMETRY_BATCH_POINTS = int(os.environ.get('TELEMETRY_BATCH_POINTS', 200))  # max points per SSE batch
 
     # Hardware Connection settings
     COM_PORT = os.environ.get('COM_PORT', '/dev/tty.usbmodem21301')
@@ -27,7 +40,83 @@ class Config:
     ACK = os.environ.get('ACK', 'OK')
     CONNECTION_TIMEOUT = os.environ.get('CONNECTION_TIMEOUT', 60)
     MAX_RECONNECT_ATTEMPTS = int(os.environ.get('MAX_RECONNECT_ATTEMPTS', 5))
+    RECONNECT_BACKOFF_INITIAL = float(os.environ.get('RECONNECT_BACKOFF_INITIAL', 0.5))  # s before the first reconnect attempt
+    RECONNECT_BACKOFF_MAX = float(os.environ.get('RECONNECT_BACKOFF_MAX', 30))  # longest wait between attempts
+
+    # Serial protocol settings
+    BINARY_PROTOCOL = os.environ.get('BINARY_PROTOCOL', '1') == '1'  # try framed protocol, text is the fallback
+    LOOP_COMPRESSION = os.environ.get('LOOP_COMPRESSION', '1') == '1'  # send repeated blocks as REPEAT loops when the firmware supports them
+    LOOP_MAX_PERIOD = int(os.environ.get('LOOP_MAX_PERIOD', 16))  # longest block of segments looked for
+    PROBE_TIMEOUT = float(os.environ.get('PROBE_TIMEOUT', 0.25))  # s to wait for PROTO BIN, PROFILES and LOOPS, which older firmware never answers
+
+    # Multi-table settings
+    TABLE_PORTS = os.environ.get('TABLE_PORTS', '')  # comma-separated ports, empty discovers Picos by USB vendor ID
+    PICO_USB_VID = int(os.environ.get('PICO_USB_VID', '2E8A'), 16)  # Raspberry Pi
+
+    # Batch upload settings
+    UPLOAD_WINDOW = int(os.environ.get('UPLOAD_WINDOW', 32))  # commands in flight, 1 disables pipelining
+    MAX_UPLOAD_COMMANDS = int(os.environ.get('MAX_UPLOAD_COMMANDS', 1 << 20))  # largest typed /start-movement upload
+    NACK = os.environ.get('NACK', 'ERR')
+    MAX_RETRANSMITS = int(os.environ.get('MAX_RETRANSMITS', 3))
+
+    # Streaming playback settings
+    STREAM_RING_SIZE = int(os.environ.get('STREAM_RING_SIZE', 1024))  # commands buffered on the host
+    STREAM_WINDOW = float(os.environ.get('STREAM_WINDOW', 10))  # seconds of motion compiled at a time
 
     # Physical Table Settings
     STEPS_PER_MM = os.environ.get('STEPS_PER_MM', 80)
-    MAX_ACCELERATION = os.environ.get('MAX_ACCELERATIONS', 8000) # in mm/s^2 This needs to be tuned to ensure the motor doesn't stall
\ No newline at end of file
+    MAX_ACCELERATION = os.environ.get('MAX_ACCELERATIONS', 8000) # in mm/s^2 This needs to be tuned to ensure the motor doesn't stall
+    MAX_DISPLACEMENT = float(os.environ.get('MAX_DISPLACEMENT', 50))  # in mm either side of centre, keep inside the limit switches
+    MAX_JERK = float(os.environ.get('MAX_JERK', 0))  # in mm/s^3, 0 plans plain trapezoids
+    MAX_SPEED = float(os.environ.get('MAX_SPEED', 1000))  # in mm/s, highest step rate the Pico and driver can sustain
+    MAX_RMS_ACCELERATION = float(os.environ.get('MAX_RMS_ACCELERATION', 5000))  # in mm/s^2 over THERMAL_WINDOW, motor heating limit
+    THERMAL_WINDOW = float(os.environ.get('THERMAL_WINDOW', 10))  # seconds averaged for the heating estimate
+
+    # Ground motion record settings
+    RECORD_SAMPLE_RATE = float(os.environ.get('RECORD_SAMPLE_RATE', 200))  # Hz after resampling
+    MOTION_CACHE_DIR = os.environ.get('MOTION_CACHE_DIR', 'motion_cache')
+
+    # Synthetic ground motion settings
+    SYNTH_SAMPLE_RATE = float(os.environ.get('SYNTH_SAMPLE_RATE', 100))  # Hz response spectra are matched at
+    SYNTH_MIN_PERIOD = float(os.environ.get('SYNTH_MIN_PERIOD', 0.05))  # s, shortest period matched
+    SYNTH_MAX_PERIOD = float(os.environ.get('SYNTH_MAX_PERIOD', 2))  # s, longest period matched, the stroke limits longer ones
+    SYNTH_PERIOD_COUNT = int(os.environ.get('SYNTH_PERIOD_COUNT', 40))  # log-spaced periods matched
+    SYNTH_DAMPINGS = [float(d) for d in os.environ.get('SYNTH_DAMPINGS', '0.02,0.05,0.1').split(',')]  # damping ratios response spectra are reported for, 5 % is matched
+    SYNTH_ITERATIONS = int(os.environ.get('SYNTH_ITERATIONS', 8))  # most spectral correction passes
+    SYNTH_TOLERANCE = float(os.environ.get('SYNTH_TOLERANCE', 0.1))  # largest relative spectral error accepted
+    SYNTH_SDS = float(os.environ.get('SYNTH_SDS', 1.0))  # g, default design spectrum plateau
+    SYNTH_SD1 = float(os.environ.get('SYNTH_SD1', 0.6))  # g at 1 s
+    SYNTH_TL = float(os.environ.get('SYNTH_TL', 8))  # s, long-period transition
+
+    # Compiled profile cache settings
+    PROFILE_CACHE_SIZE = int(os.environ.get('PROFILE_CACHE_SIZE', 32))  # profiles kept in memory
+    PROFILE_CACHE_DIR = os.environ.get('PROFILE_CACHE_DIR', 'profile_cache')
+    PROFILE_CACHE_MAX_BYTES = int(os.environ.get('PROFILE_CACHE_MAX_BYTES', 512 * 1024 ** 2))  # disk tier size, least recently used files evicted beyond it, 0 keeps all
+
+    # Metrics settings
+    METRICS_WINDOW = int(os.environ.get('METRICS_WINDOW', 4096))  # recent observations p50/p99 are computed over
+    PROFILER_INTERVAL = float(os.environ.get('PROFILER_INTERVAL', 0.005))  # s between profiler samples
+
+    # Run recording settings
+    RECORD_RUNS = os.environ.get('RECORD_RUNS', '1') == '1'  # record every session to RUN_DIR
+    RUN_DIR = os.environ.get('RUN_DIR', 'runs')
+    RUN_BLOCK_RECORDS = int(os.environ.get('RUN_BLOCK_RECORDS', 4096))  # records buffered per stream before writing
+    RUN_MAX_RUNS = int(os.environ.get('RUN_MAX_RUNS', 100))  # oldest runs deleted beyond this many, 0 keeps all
+    RUN_MAX_BYTES = int(os.environ.get('RUN_MAX_BYTES', 2 * 1024 ** 3))  # oldest runs deleted beyond this size, 0 keeps all
+
+    # Tracking-error compensation settings
+    ILC_GAIN = float(os.environ.get('ILC_GAIN', 0.8))  # fraction of the tracking error corrected per run
+    ILC_CUTOFF_HZ = float(os.environ.get('ILC_CUTOFF_HZ', 20))  # no learning above this frequency
+    ILC_REGULARIZATION = float(os.environ.get('ILC_REGULARIZATION', 0.05))  # bounds the inverse where the table barely responds
+    ILC_SMOOTHING_HZ = float(os.environ.get('ILC_SMOOTHING_HZ', 0.2))  # bandwidth the transfer function is averaged over
+    ILC_MAX_DELAY = float(os.environ.get('ILC_MAX_DELAY', 2))  # s searched for the start of the response
+    ILC_SETTLE = float(os.environ.get('ILC_SETTLE', 1))  # s of telemetry kept after the motion ends
+    ILC_ITERATIONS = int(os.environ.get('ILC_ITERATIONS', 3))  # runs per compensation request
+
+    # Test campaign settings
+    CAMPAIGN_DIR = os.environ.get('CAMPAIGN_DIR', 'campaigns')  # persistent job queue of each table
+    CAMPAIGN_WORKERS = int(os.environ.get('CAMPAIGN_WORKERS', 2))  # upcoming runs compiled while one runs
+    CAMPAIGN_SETTLE = float(os.environ.get('CAMPAIGN_SETTLE', 2))  # s waited after each run
+    CAMPAIGN_RESET = os.environ.get('CAMPAIGN_RESET', '1') == '1'  # send RESET between runs
+    CAMPAIGN_RESET_TIME = float(os.environ.get('CAMPAIGN_RESET_TIME', 3))  # s for the table to recentre after RESET
+    CAMPAIGN_MAX_JOBS = int(os.environ.get('CAMPAIGN_MAX_JOBS', 10000))  # largest sweep accepted at once